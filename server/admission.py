@@ -0,0 +1,194 @@
+# admission.py
+import math
+import threading
+import time as clock
+from collections import OrderedDict
+
+from flask import g, jsonify, request, session
+
+DEFAULTS = {
+    # Off unless asked for, like group commit: clients sharing one NAT
+    # address share one client budget, so size the limits before turning it on
+    'ADMISSION_ENABLED': False,
+    # Token buckets: requests per second refilled, and how many may burst.
+    # Per client (logged-in user, else remote address) ...
+    'ADMISSION_CLIENT_WRITE_RATE': 5,
+    'ADMISSION_CLIENT_WRITE_BURST': 20,
+    'ADMISSION_CLIENT_READ_RATE': 50,
+    'ADMISSION_CLIENT_READ_BURST': 200,
+    # ... and per route, across all clients
+    'ADMISSION_ROUTE_WRITE_RATE': 200,
+    'ADMISSION_ROUTE_WRITE_BURST': 400,
+    'ADMISSION_ROUTE_READ_RATE': 2000,
+    'ADMISSION_ROUTE_READ_BURST': 4000,
+    # Writes in flight at once in this process. SQLite takes one writer at a
+    # time, so more only queue on its lock while holding request threads.
+    'ADMISSION_MAX_WRITERS': 4,
+    # How long a write may wait for a writer slot before it is shed
+    'ADMISSION_WRITER_WAIT_MS': 50,
+}
+
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+# Observability stays reachable while everything else is being shed
+EXEMPT_ENDPOINTS = {'admission_state', 'get_metrics', 'static'}
+# Client buckets kept; the least recently seen are dropped first. A dropped
+# client comes back with a full bucket, which is all an idle one would have.
+MAX_CLIENTS = 10000
+# Throttled clients listed by state()
+MAX_LISTED_CLIENTS = 100
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = clock.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until a token is available
+    def wait(self):
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+# Per process, like the other caches here; each worker enforces its share
+_clients = OrderedDict()
+_routes = {}
+_stats = {'admitted': 0, 'client_limited': 0, 'route_limited': 0, 'writers_busy': 0}
+_lock = threading.Lock()
+_config = dict(DEFAULTS)
+_writers = None
+_active_writers = 0
+
+
+def init_app(app):
+    global _writers
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+        _config[key] = app.config[key]
+    _writers = threading.BoundedSemaphore(_config['ADMISSION_MAX_WRITERS'])
+    if not _config['ADMISSION_ENABLED']:
+        return
+    app.before_request(_admit)
+    app.teardown_request(_release)
+
+
+# Writer slots are taken by a hook of their own, registered after
+# idempotency's: a retry that is replayed, or that waits on the request
+# holding its key, must not sit on a slot that request may need.
+def init_writers(app):
+    if _config['ADMISSION_ENABLED']:
+        app.before_request(_acquire_writer)
+
+
+def _client():
+    user_id = session.get('_user_id')
+    return f'user:{user_id}' if user_id is not None else f'ip:{request.remote_addr}'
+
+
+def _bucket(buckets, key, kind, scope):
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = buckets[key] = TokenBucket(
+            _config[f'ADMISSION_{scope}_{kind}_RATE'], _config[f'ADMISSION_{scope}_{kind}_BURST'])
+    return bucket
+
+
+def _shed(message, status, retry_after):
+    response = jsonify({'message': message})
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response, status
+
+
+# Runs before anything touches the database: a request that is over its
+# client's or its route's budget is answered here and never opens a session.
+def _admit():
+    if request.endpoint in EXEMPT_ENDPOINTS or request.url_rule is None:
+        return None
+    kind = 'WRITE' if request.method in WRITE_METHODS else 'READ'
+    client = _client()
+    route = (request.method, request.url_rule.rule)
+    now = clock.monotonic()
+
+    with _lock:
+        client_bucket = _bucket(_clients, (kind, client), kind, 'CLIENT')
+        _clients.move_to_end((kind, client))
+        while len(_clients) > MAX_CLIENTS:
+            _clients.popitem(last=False)
+        route_bucket = _bucket(_routes, route, kind, 'ROUTE')
+        client_bucket.refill(now)
+        route_bucket.refill(now)
+        # Both or neither: a request shed by its route costs its client nothing
+        if client_bucket.tokens < 1:
+            _stats['client_limited'] += 1
+            return _shed('Too many requests from this client; slow down', 429, client_bucket.wait())
+        if route_bucket.tokens < 1:
+            _stats['route_limited'] += 1
+            return _shed('This route is over capacity; retry shortly', 503, route_bucket.wait())
+        client_bucket.tokens -= 1
+        route_bucket.tokens -= 1
+        _stats['admitted'] += 1
+    return None
+
+
+# A write that finds every writer slot taken is shed before its route runs
+def _acquire_writer():
+    global _active_writers
+    if request.method not in WRITE_METHODS or request.endpoint in EXEMPT_ENDPOINTS or request.url_rule is None:
+        return None
+    if not _writers.acquire(timeout=_config['ADMISSION_WRITER_WAIT_MS'] / 1000.0):
+        with _lock:
+            _stats['writers_busy'] += 1
+        return _shed('Too many writes in progress; retry shortly', 503, 1)
+    g.admission_writer = True
+    with _lock:
+        _active_writers += 1
+    return None
+
+
+# Teardown also runs after errors and once a streamed response is done
+def _release(error):
+    global _active_writers
+    if g.pop('admission_writer', False):
+        with _lock:
+            _active_writers -= 1
+        _writers.release()
+
+
+def stats():
+    with _lock:
+        return dict(_stats, enabled=_config['ADMISSION_ENABLED'], active_writers=_active_writers,
+                    max_writers=_config['ADMISSION_MAX_WRITERS'], client_buckets=len(_clients))
+
+
+# Limits, counters and every route bucket, for GET /admission
+def state():
+    now = clock.monotonic()
+    with _lock:
+        routes = []
+        for (method, rule), bucket in sorted(_routes.items(), key=lambda item: (item[0][1], item[0][0])):
+            bucket.refill(now)
+            routes.append({'method': method, 'route': rule, 'tokens': round(bucket.tokens, 2),
+                           'rate': bucket.rate, 'burst': bucket.burst})
+        limited = []
+        for (kind, client), bucket in _clients.items():
+            bucket.refill(now)
+            if bucket.tokens < 1 and len(limited) < MAX_LISTED_CLIENTS:
+                limited.append({'client': client, 'kind': kind.lower(), 'retry_after': round(bucket.wait(), 2)})
+        return {
+            'limits': {key[len('ADMISSION_'):].lower(): value for key, value in _config.items()},
+            'stats': dict(_stats, active_writers=_active_writers, client_buckets=len(_clients)),
+            'routes': routes,
+            'limited_clients': limited,
+        }
+
+
+def clear():
+    with _lock:
+        _clients.clear()
+        _routes.clear()
+        for key in _stats:
+            _stats[key] = 0
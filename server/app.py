@@ -1,16 +1,55 @@
-from flask import Flask, request, jsonify
+from datetime import date, datetime, timedelta
+
+import click
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager, login_user, logout_user, login_required
 from flask_cors import CORS
-from models import db, User, Doctor, Patient, Symptom, Appointment, patient_symptom  # Import models
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, add_symptom_to_patient, User, Doctor, Patient, Symptom, Appointment, AppointmentArchive, patient_symptom, parse_appointment_start, PATIENT_EXPANSIONS, DOCTOR_EXPANSIONS, PUBLIC_FIELDS  # Import models
+from pagination import list_response, wants_stream, field_args, project, row_dict
+import availability
+import refcache
+import principals
+import passwords
+import sqlite_engine
+import group_commit
+import bulk
+import jsonenc
+import batch
+import metrics
+import search
+import appointment_stats
+import changes
+import versioning
+import archive
+import deletes
+import cooccurrence
+import doctor_load
+import idempotency
+import admission
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = 'your_secret_key'  # Required for session management
+app.config.from_prefixed_env()  # FLASK_<KEY> environment variables override the above
 
+jsonenc.init_app(app)
+sqlite_engine.configure(app)
 db.init_app(app)
+sqlite_engine.install(app, db)
+passwords.init_app(app)
+group_commit.init_app(app, db)
+metrics.init_app(app, db)
+admission.init_app(app)  # Before idempotency: shed requests never claim a key
+changes.init_app(app, db)
+archive.init_app(app)
+cooccurrence.init_app(app)
+idempotency.init_app(app, db)
+admission.init_writers(app)  # After idempotency: replays and waiting retries hold no writer slot
 migrate = Migrate(app, db)  # Initialize Flask-Migrate
 CORS(app)  # Enable CORS
 
@@ -19,7 +58,79 @@ login_manager = LoginManager(app)
 # Login Manager setup
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return principals.get(int(user_id), load_principal)
+
+def load_principal(user_id):
+    row = db.session.query(User.id, User.username).filter_by(id=user_id).first()
+    return principals.Principal(row.id, row.username) if row else None
+
+# expand=a,b from the query string, checked against the allowed names;
+# returns (names, loader options) or raises ValueError naming the bad ones.
+def expand_args(expansions):
+    names = {name.strip() for name in request.args.get('expand', '').split(',') if name.strip()}
+    unknown = names - expansions.keys()
+    if unknown:
+        raise ValueError(f"Unknown expand value(s): {', '.join(sorted(unknown))}. Allowed: {', '.join(expansions)}")
+    return names, [expansions[name]() for name in names]
+
+@app.errorhandler(passwords.HashingBusy)
+def hashing_busy(error):
+    response = jsonify({'message': 'Server busy, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+# A PUT or DELETE whose If-Match no longer names the current version
+@app.errorhandler(versioning.PreconditionFailed)
+@app.errorhandler(StaleDataError)
+def precondition_failed(error):
+    db.session.rollback()
+    return jsonify({'message': 'Resource was modified by another request; fetch it and retry'}), 412
+
+# A PUT value refused by the model's validators
+@app.errorhandler(versioning.Invalid)
+def invalid_value(error):
+    return jsonify({'message': str(error)}), 400
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    """Recompute appointment_daily_stats from live and archived appointments."""
+    with db.engines.get(sqlite_engine.WRITER_BIND, db.engine).begin() as connection:
+        appointment_stats.rebuild(connection)
+    print('appointment_daily_stats rebuilt')
+
+@app.cli.command('archive-appointments')
+@click.option('--days', type=int, help='Archive appointments older than this many days (default ARCHIVE_AFTER_DAYS).')
+def archive_appointments(days):
+    """Move old appointments into appointment_archive in batches."""
+    cutoff = None if days is None else datetime.combine(date.today(), datetime.min.time()) - timedelta(days=days)
+    with db.engines.get(sqlite_engine.WRITER_BIND, db.engine).connect() as connection:
+        moved = archive.archive(connection, cutoff)
+    print(f'{moved} appointments archived')
+
+@app.cli.command('rebuild-symptom-matrix')
+def rebuild_symptom_matrix():
+    """Recompute the memory-mapped symptom co-occurrence snapshot."""
+    with db.engine.connect() as connection:
+        built = cooccurrence.rebuild(connection)
+    print(f"symptom matrix rebuilt: {built['pairs']} diagnoses, {built['patients']} patient slots")
+
+@app.errorhandler(cooccurrence.Unavailable)
+def cooccurrence_unavailable(error):
+    return jsonify({'message': str(error)}), 503
+
+@app.cli.command('compact-changes')
+def compact_changes():
+    """Delete change_log entries older than CHANGE_LOG_RETENTION_HOURS."""
+    with db.engines.get(sqlite_engine.WRITER_BIND, db.engine).connect() as connection:
+        deleted = changes.compact(connection)
+    print(f'{deleted} change_log entries removed')
+
+@app.cli.command('compact-idempotency-keys')
+def compact_idempotency_keys():
+    """Delete stored Idempotency-Key responses older than IDEMPOTENCY_TTL_SECONDS."""
+    with db.engines.get(sqlite_engine.WRITER_BIND, db.engine).connect() as connection:
+        deleted = idempotency.compact(connection)
+    print(f'{deleted} idempotency keys removed')
 
 # Routes
 @app.route('/login', methods=['POST'])
@@ -29,6 +140,10 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     if user and user.check_password(password):
+        # Upgrade hashes made under an older method/cost policy
+        if passwords.needs_rehash(user.password_hash):
+            user.set_password(password)
+            db.session.commit()
         login_user(user)
         return jsonify({'message': 'Login successful'})
     else:
@@ -59,46 +174,87 @@ def logout():
 def protected():
     return jsonify({'message': 'This is a protected resource'})
 
+# Cache Statistics
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'session_users': principals.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    body = metrics.render({'session_users_cache': principals.stats(), 'group_commit': group_commit.stats(),
+                           'admission': admission.stats()})
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+# Rate limits, shed counts, writer slots and route buckets of this process
+@app.route('/admission', methods=['GET'])
+def admission_state():
+    return jsonify(admission.state())
+
+# Serializes a list route's rows: selected columns only, or with expansions
+# the ORM objects' to_dict() narrowed to the requested fields.
+def fields_or_expanded(model, expand):
+    fields = field_args(PUBLIC_FIELDS[model])
+    if not expand:
+        return fields, row_dict
+    names = {name for name, _ in fields} | set(expand)
+    return None, lambda obj: {key: value for key, value in obj.to_dict(expand).items() if key in names}
+
+def reference_list(model, namespace):
+    try:
+        fields = field_args(PUBLIC_FIELDS[model])
+    except ValueError as error:
+        return jsonify({'message': str(error)}), 400
+    build = lambda: list_response(model, row_dict, project(model.query, fields))
+    if wants_stream():
+        return build()
+    return refcache.cached_response(namespace, build)
+
 @app.route('/doctors', methods=['GET'])
 def get_doctors():
-    doctors = [
-        { 'id': 1, 'name': 'Dr. Faith Nyaboke', 'specialty': 'Cardiology', 'phone': '+254 123 456 789', 'email': 'faith.nyaboke@gmail.com', 'imageUrl': 'https://images.unsplash.com/photo-1651008376811-b90baee60c1f?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8Mnx8RG9jdG9yfGVufDB8fDB8fHww' },
-        { 'id': 2, 'name': 'Dr. Jane Kinyua', 'specialty': 'Pediatrics', 'phone': '+254 234 567 890', 'email': 'jane.kinyua@example.com', 'imageUrl': 'https://images.unsplash.com/photo-1584467735815-f778f274e296?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8OHx8RG9jdG9yfGVufDB8fDB8fHww' },
-        { 'id': 3, 'name': 'Dr. Michael Kimemia', 'specialty': 'Orthopedics', 'phone': '+254 345 678 901', 'email': 'michael.kimemia@icloud.com', 'imageUrl': 'https://images.unsplash.com/photo-1609743522471-83c84ce23e32?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8MTZ8fERvY3RvcnxlbnwwfHwwfHx8MA%3D%3D' },
-        { 'id': 4, 'name': 'Dr. Gary Kimani', 'specialty': 'Dermatology', 'phone': '+254 456 789 012', 'email': 'gary.kimani@example.com', 'imageUrl': 'https://media.istockphoto.com/id/1486172842/photo/portrait-of-male-nurse-in-his-office.webp?b=1&s=170667a&w=0&k=20&c=X4TGvYkgE0Hqqdwv13z47msgfNAFLH9udGXPzWHlT9A=' },
-        { 'id': 5, 'name': 'Dr. David', 'specialty': 'Neurology', 'phone': '+254 567 890 123', 'email': 'david.lee@example.com', 'imageUrl': 'https://images.unsplash.com/photo-1579684453401-966b11832744?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8MzV8fERvY3RvcnxlbnwwfHwwfHx8MA%3D%3D' },
-    ]
-    return jsonify(doctors)
+    return reference_list(Doctor, 'doctors')
+
+@app.route('/doctors/<int:id>', methods=['GET'])
+def get_doctor(id):
+    try:
+        expand, options = expand_args(DOCTOR_EXPANSIONS)
+        fields, serialize = fields_or_expanded(Doctor, expand)
+    except ValueError as error:
+        return jsonify({'message': str(error)}), 400
+    query = Doctor.query.options(*options) if fields is None else project(Doctor.query, fields)
+    doctor = query.filter(Doctor.id == id).first()
+    if not doctor:
+        return jsonify({'message': 'Doctor not found'}), 404
+    data = serialize(doctor)
+    return versioning.tagged(jsonify(data), data.get('version'))
 
 # List of Symptoms
 @app.route('/symptoms', methods=['GET'])
 def list_symptoms():
-    symptoms = Symptom.query.all()
-    symptoms_list = [{'id': symptom.id, 'name': symptom.name, 'description': symptom.description} for symptom in symptoms]
-    return jsonify(symptoms_list)
+    return reference_list(Symptom, 'symptoms')
 
 # List of Users
 @app.route('/users', methods=['GET'])
 def list_users():
-    users = User.query.all()
-    users_list = [{'id': user.id, 'username': user.username} for user in users]
-    return jsonify(users_list)
+    try:
+        fields = field_args(PUBLIC_FIELDS[User])
+    except ValueError as error:
+        return jsonify({'message': str(error)}), 400
+    return list_response(User, row_dict, project(User.query, fields))
 
 # Update User
 @app.route('/users/<int:id>', methods=['PUT'])
 def update_user(id):
-    user = User.query.get(id)
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
-
     data = request.json
-    if 'username' in data:
-        user.username = data['username']
+    values = versioning.values_from(data, {'username': User.username})
     if 'password' in data:
-        user.set_password(data['password'])
+        values[User.password_hash] = passwords.hash_password(data['password'])
 
+    version = versioning.update(User, id, values)
+    if version is None:
+        return jsonify({'message': 'User not found'}), 404
     db.session.commit()
-    return jsonify({'message': 'User updated successfully'})
+    principals.invalidate(id)
+    return versioning.tagged(jsonify({'message': 'User updated successfully', 'version': version}), version)
 
 # Delete User
 @app.route('/users/<int:id>', methods=['DELETE'])
@@ -107,165 +263,421 @@ def delete_user(id):
     if not user:
         return jsonify({'message': 'User not found'}), 404
 
+    versioning.check(user)
     db.session.delete(user)
     db.session.commit()
+    principals.invalidate(id)
     return jsonify({'message': 'User deleted successfully'})
 
+# Doctor Availability
+@app.route('/doctors/<int:id>/availability', methods=['GET'])
+def doctor_availability(id):
+    if not Doctor.query.get(id):
+        return jsonify({'message': 'Doctor not found'}), 404
+
+    try:
+        first_day = date.fromisoformat(request.args['from']) if 'from' in request.args else date.today()
+        last_day = date.fromisoformat(request.args['to']) if 'to' in request.args else first_day + timedelta(days=6)
+    except ValueError:
+        return jsonify({'message': 'Invalid date range'}), 400
+    if last_day < first_day or (last_day - first_day).days > 62:
+        return jsonify({'message': 'Date range must be between 1 and 63 days'}), 400
+
+    return jsonify({
+        'doctor_id': id,
+        'slot_minutes': availability.SLOT_MINUTES,
+        'days': availability.free_intervals(id, first_day, last_day)
+    })
+
 @app.route('/doctors', methods=['POST'])
 def create_doctor():
     data = request.json
     name = data.get('name')
     specialty = data.get('specialty')
 
-    new_doctor = Doctor(name=name, specialty=specialty)
+    new_doctor = Doctor(name=name, specialty=specialty, phone=data.get('phone'), email=data.get('email'), image_url=data.get('imageUrl'))
     db.session.add(new_doctor)
     db.session.commit()
+    refcache.invalidate('doctors')
+    doctor_load.doctor_added(new_doctor.id, specialty)
 
     return jsonify({'message': 'Doctor added successfully'}), 201
 
 # Update Doctor
 @app.route('/doctors/<int:id>', methods=['PUT'])
 def update_doctor(id):
-    doctor = Doctor.query.get(id)
-    if not doctor:
-        return jsonify({'message': 'Doctor not found'}), 404
-
     data = request.json
-    if 'name' in data:
-        doctor.name = data['name']
-    if 'specialty' in data:
-        doctor.specialty = data['specialty']
-
+    values = versioning.values_from(data, {'name': Doctor.name, 'specialty': Doctor.specialty, 'phone': Doctor.phone,
+                                           'email': Doctor.email, 'imageUrl': Doctor.image_url})
+    version = versioning.update(Doctor, id, values)
+    if version is None:
+        return jsonify({'message': 'Doctor not found'}), 404
     db.session.commit()
-    return jsonify({'message': 'Doctor updated successfully'})
+    refcache.invalidate('doctors')
+    if 'specialty' in data:
+        doctor_load.doctor_updated(id, data['specialty'])
+    return versioning.tagged(jsonify({'message': 'Doctor updated successfully', 'version': version}), version)
 
 # Delete Doctor
 @app.route('/doctors/<int:id>', methods=['DELETE'])
+# ?reassign_to=<doctor id> hands the doctor's patients and appointments to
+# another doctor; ?cascade=true deletes them instead.
 def delete_doctor(id):
-    doctor = Doctor.query.get(id)
-    if not doctor:
+    reassign_to = request.args.get('reassign_to', type=int)
+    cascade = request.args.get('cascade', '').lower() in ('1', 'true', 'yes')
+    try:
+        slots = deletes.delete_doctor(id, versioning.if_match(), reassign_to, cascade)
+    except deletes.HasDependents:
+        db.session.rollback()
+        return jsonify({'message': 'Doctor still has patients or appointments; pass reassign_to=<doctor id> or cascade=true'}), 409
+    except deletes.Conflict as error:
+        db.session.rollback()
+        return jsonify({'message': str(error)}), 409
+    if slots is None:
         return jsonify({'message': 'Doctor not found'}), 404
-
-    db.session.delete(doctor)
     db.session.commit()
+    for slot in slots:
+        availability.release(*slot)
+        if slot[0] != id:
+            doctor_load.appointment_removed(slot[0])
+    availability.forget(id)
+    if reassign_to is not None:
+        availability.forget(reassign_to)
+    refcache.invalidate('doctors')
+    doctor_load.doctor_removed(id, reassign_to)
     return jsonify({'message': 'Doctor deleted successfully'})
 
+@app.route('/patients', methods=['GET'])
+def get_patients():
+    try:
+        expand, options = expand_args(PATIENT_EXPANSIONS)
+        fields, serialize = fields_or_expanded(Patient, expand)
+    except ValueError as error:
+        return jsonify({'message': str(error)}), 400
+    query = Patient.query.options(*options) if fields is None else project(Patient.query, fields)
+    return list_response(Patient, serialize, query)
+
+@app.route('/patients/<int:id>', methods=['GET'])
+def get_patient(id):
+    try:
+        expand, options = expand_args(PATIENT_EXPANSIONS)
+        fields, serialize = fields_or_expanded(Patient, expand)
+    except ValueError as error:
+        return jsonify({'message': str(error)}), 400
+    query = Patient.query.options(*options) if fields is None else project(Patient.query, fields)
+    patient = query.filter(Patient.id == id).first()
+    if not patient:
+        return jsonify({'message': 'Patient not found'}), 404
+    data = serialize(patient)
+    return versioning.tagged(jsonify(data), data.get('version'))
+
 @app.route('/patients', methods=['POST'])
+# Without a doctor_id, the patient goes to the least-loaded doctor in the
+# requested specialty.
 def create_patient():
     data = request.json
     name = data.get('name')
     age = data.get('age')
     doctor_id = data.get('doctor_id')
 
+    if doctor_id is None:
+        if not data.get('specialty'):
+            return jsonify({'message': 'doctor_id or specialty is required'}), 400
+        doctor_id = doctor_load.assign(db.session, data['specialty'])
+        if doctor_id is None:
+            return jsonify({'message': f"No doctors with specialty {data['specialty']}"}), 404
+    else:
+        doctor_load.patient_added(doctor_id)
+
     new_patient = Patient(name=name, age=age, doctor_id=doctor_id)
-    db.session.add(new_patient)
-    db.session.commit()
+    try:
+        group_commit.add(new_patient)
+    except IntegrityError:
+        db.session.rollback()
+        doctor_load.patient_removed(doctor_id)
+        return jsonify({'message': 'Doctor not found'}), 404
+    except Exception:
+        db.session.rollback()
+        doctor_load.patient_removed(doctor_id)
+        raise
 
-    return jsonify({'message': 'Patient added successfully'}), 201
+    return jsonify({'message': 'Patient added successfully', 'id': new_patient.id, 'doctor_id': doctor_id}), 201
+
+# Current patient and appointment counts per doctor, least loaded first
+@app.route('/doctors/load', methods=['GET'])
+def get_doctor_load():
+    return jsonify(doctor_load.snapshot(db.session, request.args.get('specialty')))
 
 
 # Update Patient
 @app.route('/patients/<int:id>', methods=['PUT'])
 def update_patient(id):
-    patient = Patient.query.get(id)
-    if not patient:
-        return jsonify({'message': 'Patient not found'}), 404
-
     data = request.json
-    if 'name' in data:
-        patient.name = data['name']
-    if 'age' in data:
-        patient.age = data['age']
-    if 'doctor_id' in data:
-        patient.doctor_id = data['doctor_id']
-
+    values = versioning.values_from(data, {'name': Patient.name, 'age': Patient.age, 'doctor_id': Patient.doctor_id})
+    old_doctor_id = db.session.query(Patient.doctor_id).filter(Patient.id == id).scalar() if 'doctor_id' in data else None
+    try:
+        version = versioning.update(Patient, id, values)
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Doctor not found'}), 404
+    if version is None:
+        return jsonify({'message': 'Patient not found'}), 404
     db.session.commit()
-    return jsonify({'message': 'Patient updated successfully'})
+    if 'doctor_id' in data:
+        doctor_load.patient_moved(old_doctor_id, data['doctor_id'])
+    return versioning.tagged(jsonify({'message': 'Patient updated successfully', 'version': version}), version)
 
 # Delete Patient
 @app.route('/patients/<int:id>', methods=['DELETE'])
 def delete_patient(id):
-    patient = Patient.query.get(id)
-    if not patient:
+    deleted = deletes.delete_patient(id, versioning.if_match())
+    if deleted is None:
         return jsonify({'message': 'Patient not found'}), 404
-
-    db.session.delete(patient)
+    doctor_id, slots = deleted
     db.session.commit()
+    for slot in slots:
+        availability.release(*slot)
+        doctor_load.appointment_removed(slot[0])
+    doctor_load.patient_removed(doctor_id)
     return jsonify({'message': 'Patient deleted successfully'})
 
+@app.route('/patients/<int:id>/symptoms', methods=['POST'])
+def add_patient_symptom(id):
+    data = request.json
+    try:
+        values = bulk.validate_patient_symptom(dict(data, patient_id=id))
+    except bulk.RowError as error:
+        return jsonify({'message': str(error)}), 400
+    if not Patient.query.get(id) or not Symptom.query.get(values['symptom_id']):
+        return jsonify({'message': 'Patient or symptom not found'}), 404
+    try:
+        add_symptom_to_patient(id, values['symptom_id'], values['diagnosis'])
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Patient already has that symptom'}), 409
+    return jsonify({'message': 'Symptom added to patient'}), 201
+
+@app.route('/patients/<int:id>/similar', methods=['GET'])
+def similar_patients(id):
+    limit = max(1, min(request.args.get('limit', cooccurrence.DEFAULT_LIMIT, type=int), cooccurrence.MAX_LIMIT))
+    return jsonify(cooccurrence.similar(db.session, id, limit))
+
+@app.route('/symptoms/<int:id>/related', methods=['GET'])
+def related_symptoms(id):
+    limit = max(1, min(request.args.get('limit', cooccurrence.DEFAULT_LIMIT, type=int), cooccurrence.MAX_LIMIT))
+    return jsonify(cooccurrence.related(db.session, id, limit))
+
+@app.route('/search', methods=['GET'])
+def search_symptoms():
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'message': 'q is required'}), 400
+    kind = request.args.get('type')
+    if kind not in (None, 'symptom', 'diagnosis'):
+        return jsonify({'message': 'type must be symptom or diagnosis'}), 400
+    limit = max(1, min(request.args.get('limit', search.DEFAULT_LIMIT, type=int), search.MAX_LIMIT))
+    return jsonify(search.search(db.session, text, limit, kind))
+
 # Update Symptom
 @app.route('/symptoms/<int:id>', methods=['PUT'])
 def update_symptom(id):
-    symptom = Symptom.query.get(id)
-    if not symptom:
-        return jsonify({'message': 'Symptom not found'}), 404
-
     data = request.json
-    if 'name' in data:
-        symptom.name = data['name']
-    if 'description' in data:
-        symptom.description = data['description']
-
+    values = versioning.values_from(data, {'name': Symptom.name, 'description': Symptom.description})
+    version = versioning.update(Symptom, id, values)
+    if version is None:
+        return jsonify({'message': 'Symptom not found'}), 404
     db.session.commit()
-    return jsonify({'message': 'Symptom updated successfully'})
+    refcache.invalidate('symptoms')
+    return versioning.tagged(jsonify({'message': 'Symptom updated successfully', 'version': version}), version)
 
 # Delete Symptom
 @app.route('/symptoms/<int:id>', methods=['DELETE'])
 def delete_symptom(id):
-    symptom = Symptom.query.get(id)
-    if not symptom:
+    if not deletes.delete_symptom(id, versioning.if_match()):
         return jsonify({'message': 'Symptom not found'}), 404
-
-    db.session.delete(symptom)
     db.session.commit()
+    refcache.invalidate('symptoms')
     return jsonify({'message': 'Symptom deleted successfully'})
 
 # Create Appointment
 @app.route('/appointments', methods=['POST'])
 def create_appointment():
-    data = request.json
-    patient_id = data.get('patient_id')
-    doctor_id = data.get('doctor_id')
-    date = data.get('date')
-    time = data.get('time')
-    reason = data.get('reason')
-
-    new_appointment = Appointment(patient_id=patient_id, doctor_id=doctor_id, date=date, time=time, reason=reason)
-    db.session.add(new_appointment)
-    db.session.commit()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected a JSON object'}), 400
+    try:
+        values = bulk.validate_appointment(data)
+    except bulk.RowError as error:
+        return jsonify({'message': str(error)}), 400
+    patient_id, doctor_id, reason = values['patient_id'], values['doctor_id'], values['reason']
+    start, duration_minutes = values['start'], values['duration_minutes']
+
+    if not availability.reserve(doctor_id, start, duration_minutes):
+        return jsonify({'message': 'Doctor is not available at that time'}), 409
+
+    new_appointment = Appointment(patient_id=patient_id, doctor_id=doctor_id, reason=reason, duration_minutes=duration_minutes)
+    new_appointment.set_start(start)
+    try:
+        # Another worker's booking may not be in this process's map yet
+        booked = group_commit.add(new_appointment, unless=availability.overlapping(doctor_id, start, duration_minutes))
+    except IntegrityError:
+        db.session.rollback()
+        availability.release(doctor_id, start, duration_minutes)
+        return jsonify({'message': 'Patient or doctor not found'}), 404
+    except Exception:
+        db.session.rollback()
+        availability.release(doctor_id, start, duration_minutes)
+        raise
+    if booked is None:
+        availability.forget(doctor_id)
+        return jsonify({'message': 'Doctor is not available at that time'}), 409
+    doctor_load.appointment_added(doctor_id)
     return jsonify({'message': 'Appointment booked successfully'}), 201
 
 # Get Appointments
 @app.route('/appointments', methods=['GET'])
 def get_appointments():
-    appointments = Appointment.query.all()
-    appointments_list = [{
-        'id': appointment.id,
-        'patient_id': appointment.patient_id,
-        'doctor_id': appointment.doctor_id,
-        'date': appointment.date,
-        'time': appointment.time,
-        'reason': appointment.reason
-    } for appointment in appointments]
-    return jsonify(appointments_list)
+    try:
+        fields = field_args(PUBLIC_FIELDS[Appointment])
+    except ValueError as error:
+        return jsonify({'message': str(error)}), 400
+    try:
+        first_start = datetime.fromisoformat(request.args['from']) if 'from' in request.args else None
+        # Archived rows are only read when the range reaches back into them
+        source = Appointment
+        if archive.needed(db.session, first_start):
+            source = archive.with_archive(Appointment, AppointmentArchive)
+        query = project(db.session.query(source), [(name, getattr(source, column.key)) for name, column in fields])
+        if 'doctor_id' in request.args:
+            query = query.filter(source.doctor_id == int(request.args['doctor_id']))
+        if 'patient_id' in request.args:
+            query = query.filter(source.patient_id == int(request.args['patient_id']))
+        if first_start is not None:
+            query = query.filter(source.start >= first_start)
+        if 'to' in request.args:
+            query = query.filter(source.start < datetime.fromisoformat(request.args['to']))
+    except ValueError:
+        return jsonify({'message': 'Invalid appointment filter'}), 400
+    return list_response(source, row_dict, query)
+
+def changes_since(value):
+    since = int(value)
+    if changes.expired(db.session, since):
+        oldest, _ = changes.bounds(db.session)
+        response = jsonify({'message': 'Changes since that point have been compacted; reload and resume', 'oldest': oldest})
+        return since, (response, 410)
+    return since, None
+
+# Long-poll: answers as soon as there are changes after since, or with an
+# empty list after timeout seconds. Without since, returns the current head.
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    if 'since' not in request.args:
+        _, newest = changes.bounds(db.session)
+        return jsonify({'changes': [], 'next': newest})
+    try:
+        since, gone = changes_since(request.args['since'])
+    except ValueError:
+        return jsonify({'message': 'since must be an integer'}), 400
+    if gone:
+        return gone
+    timeout = request.args.get('timeout', app.config['CHANGE_LOG_POLL_TIMEOUT'], type=float)
+    timeout = max(0, min(timeout, app.config['CHANGE_LOG_MAX_POLL_TIMEOUT']))
+    limit = max(1, min(request.args.get('limit', changes.DEFAULT_LIMIT, type=int), changes.MAX_LIMIT))
+    found = changes.wait(db.session, since, timeout, limit)
+    return jsonify({'changes': found, 'next': found[-1]['seq'] if found else since})
+
+# Server-Sent Events: one event per change, resuming from Last-Event-ID on reconnect
+@app.route('/changes/stream', methods=['GET'])
+def stream_changes():
+    try:
+        if 'since' in request.args or 'Last-Event-ID' in request.headers:
+            since, gone = changes_since(request.headers.get('Last-Event-ID', request.args.get('since')))
+            if gone:
+                return gone
+        else:
+            _, since = changes.bounds(db.session)
+    except ValueError:
+        return jsonify({'message': 'since must be an integer'}), 400
+    response = Response(stream_with_context(changes.stream(db.session, since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/stats/appointments', methods=['GET'])
+def get_appointment_stats():
+    group_by = request.args.get('group_by', 'doctor')
+    if group_by not in appointment_stats.GROUPINGS:
+        return jsonify({'message': f"group_by must be one of {', '.join(appointment_stats.GROUPINGS)}"}), 400
+    try:
+        first_day = date.fromisoformat(request.args['from']) if 'from' in request.args else None
+        last_day = date.fromisoformat(request.args['to']) if 'to' in request.args else None
+    except ValueError:
+        return jsonify({'message': 'from and to must be YYYY-MM-DD dates'}), 400
+    rows = appointment_stats.summarize(db.session, group_by, first_day, last_day)
+    return jsonify({
+        'group_by': group_by,
+        'from': first_day.isoformat() if first_day else None,
+        'to': last_day.isoformat() if last_day else None,
+        'rows': rows,
+    })
 
 # Update Appointment
 @app.route('/appointments/<int:id>', methods=['PUT'])
 def update_appointment(id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected a JSON object'}), 400
+    try:
+        updates = bulk.validate_appointment_changes(data)
+    except bulk.RowError as error:
+        return jsonify({'message': str(error)}), 400
+    # Changing only the reason needs no slot bookkeeping: one conditional UPDATE
+    if not data.keys() & {'start', 'date', 'time', 'duration_minutes'}:
+        version = versioning.update(Appointment, id, versioning.values_from(updates, {'reason': Appointment.reason}))
+        if version is None:
+            return jsonify({'message': 'Appointment not found'}), 404
+        db.session.commit()
+        return versioning.tagged(jsonify({'message': 'Appointment updated successfully', 'version': version}), version)
+
     appointment = Appointment.query.get(id)
     if not appointment:
         return jsonify({'message': 'Appointment not found'}), 404
-
-    data = request.json
-    if 'date' in data:
-        appointment.date = data['date']
-    if 'time' in data:
-        appointment.time = data['time']
-    if 'reason' in data:
-        appointment.reason = data['reason']
-
-    db.session.commit()
-    return jsonify({'message': 'Appointment updated successfully'})
+    versioning.check(appointment)
+
+    old_slot = (appointment.start, appointment.duration_minutes)
+    start, duration_minutes = old_slot
+    if 'start' in data or 'date' in data or 'time' in data:
+        try:
+            start = parse_appointment_start(data.get('date', appointment.date), data.get('time', appointment.time), data.get('start'))
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Invalid appointment date or time'}), 400
+    if 'duration_minutes' in updates:
+        duration_minutes = updates['duration_minutes']
+
+    rescheduled = (start, duration_minutes) != old_slot
+    if rescheduled:
+        if not availability.reserve(appointment.doctor_id, start, duration_minutes, ignore=old_slot):
+            return jsonify({'message': 'Doctor is not available at that time'}), 409
+        appointment.set_start(start)
+        appointment.duration_minutes = duration_minutes
+    if 'reason' in updates:
+        appointment.reason = updates['reason']
+
+    try:
+        db.session.flush()
+        if rescheduled and availability.clashes(appointment.doctor_id, start, duration_minutes, appointment.id):
+            db.session.rollback()
+            return jsonify({'message': 'Doctor is not available at that time'}), 409
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if rescheduled:
+            availability.release(appointment.doctor_id, start, duration_minutes)
+        raise
+    if rescheduled:
+        availability.release(appointment.doctor_id, *old_slot)
+    return versioning.tagged(jsonify({'message': 'Appointment updated successfully', 'version': appointment.version}), appointment.version)
 
 # Delete Appointment
 @app.route('/appointments/<int:id>', methods=['DELETE'])
@@ -274,10 +686,61 @@ def delete_appointment(id):
     if not appointment:
         return jsonify({'message': 'Appointment not found'}), 404
 
+    versioning.check(appointment)
+    slot = (appointment.doctor_id, appointment.start, appointment.duration_minutes)
     db.session.delete(appointment)
     db.session.commit()
+    availability.release(*slot)
+    doctor_load.appointment_removed(slot[0])
     return jsonify({'message': 'Appointment deleted successfully'})
 
+# Delete every live appointment starting before ?before=, optionally narrowed
+# to one doctor_id or patient_id, in a single statement
+@app.route('/appointments', methods=['DELETE'])
+def delete_appointments():
+    try:
+        before = datetime.fromisoformat(request.args['before'])
+        doctor_id = int(request.args['doctor_id']) if 'doctor_id' in request.args else None
+        patient_id = int(request.args['patient_id']) if 'patient_id' in request.args else None
+    except KeyError:
+        return jsonify({'message': 'before is required'}), 400
+    except ValueError:
+        return jsonify({'message': 'Invalid appointment filter'}), 400
+    slots = deletes.delete_appointments(before, doctor_id, patient_id)
+    db.session.commit()
+    for slot in slots:
+        availability.release(*slot)
+        doctor_load.appointment_removed(slot[0])
+    return jsonify({'message': f'{len(slots)} appointments deleted', 'deleted': len(slots)})
+
+# Batch
+# Ordered create/update/delete operations applied in one transaction: all of
+# them commit together or none do. "$ref" values point at earlier creates.
+@app.route('/batch', methods=['POST'])
+def run_batch():
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'Expected a non-empty list of operations'}), 400
+    if len(operations) > batch.max_operations():
+        return jsonify({'message': f'At most {batch.max_operations()} operations per batch'}), 400
+    try:
+        results = batch.run(operations)
+    except batch.BatchError as error:
+        return jsonify({'message': error.message, 'index': error.index, 'status': error.status}), error.status
+    return jsonify({'results': results})
+
+# Bulk Import
+@app.route('/bulk/<any(patients, appointments, "patient-symptoms"):resource>', methods=['POST'])
+def bulk_import(resource):
+    try:
+        records = bulk.read_records()
+    except bulk.BodyError as error:
+        return jsonify({'message': str(error)}), 400
+
+    result = bulk.import_records(resource, records)
+    return jsonify(result), 201 if not result['errors'] else 207
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
@@ -0,0 +1,116 @@
+# appointment_stats.py
+import sqlalchemy as sa
+
+import archive
+
+GROUPINGS = ('doctor', 'specialty', 'day')
+
+# Every write to appointment adjusts the (doctor_id, day) summary row in the
+# same transaction, whichever path made it: ORM, group commit, bulk import or
+# a cascading delete. A day is the calendar date of the appointment's start.
+# Moving a row into appointment_archive leaves its day's totals alone. Legacy
+# rows whose start could not be parsed (start IS NULL) have no day and are
+# left out.
+TRIGGERS = {
+    'appointment_stats_insert': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_insert AFTER INSERT ON appointment
+        WHEN new.start IS NOT NULL BEGIN
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            VALUES (new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0))
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_update': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_update
+        AFTER UPDATE OF doctor_id, start, duration_minutes ON appointment
+        WHEN old.start IS NOT NULL OR new.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            SELECT new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0) WHERE new.start IS NOT NULL
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL AND NOT {archive.ARCHIVED} BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+}
+
+REBUILD = (
+    "DELETE FROM appointment_daily_stats",
+    """INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+       SELECT doctor_id, date(start), count(*), coalesce(sum(duration_minutes), 0)
+       FROM (SELECT doctor_id, start, duration_minutes FROM appointment
+             UNION ALL SELECT doctor_id, start, duration_minutes FROM appointment_archive)
+       WHERE start IS NOT NULL
+       GROUP BY doctor_id, date(start)""",
+)
+
+
+def create_triggers(connection):
+    for ddl in TRIGGERS.values():
+        connection.exec_driver_sql(ddl)
+
+
+def drop_triggers(connection):
+    for name in TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+
+
+# Recompute the whole summary from the hot and archived appointments, e.g. after a bulk
+# load with the triggers dropped or to repair drift.
+def rebuild(connection):
+    for statement in REBUILD:
+        connection.exec_driver_sql(statement)
+
+
+def install(metadata):
+    @sa.event.listens_for(metadata, 'after_create')
+    def _create_stats_triggers(target, connection, **kwargs):
+        if connection.dialect.name == 'sqlite':
+            create_triggers(connection)
+
+
+# Totals for first_day..last_day (either may be None for open-ended). Reads
+# only summary rows, so the cost depends on doctors x days in range and not
+# on how many appointments there are.
+def summarize(session, group_by, first_day=None, last_day=None):
+    conditions, params = [], {}
+    if first_day is not None:
+        conditions.append('s.day >= :first_day')
+        params['first_day'] = first_day.isoformat()
+    if last_day is not None:
+        conditions.append('s.day <= :last_day')
+        params['last_day'] = last_day.isoformat()
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    if group_by == 'doctor':
+        sql = f"""
+            SELECT s.doctor_id, d.name, d.specialty, sum(s.appointments) AS appointments, sum(s.minutes) AS minutes
+            FROM appointment_daily_stats s JOIN doctor d ON d.id = s.doctor_id
+            {where} GROUP BY s.doctor_id ORDER BY s.doctor_id"""
+        keys = ('doctor_id', 'name', 'specialty')
+    elif group_by == 'specialty':
+        sql = f"""
+            SELECT d.specialty, count(DISTINCT s.doctor_id) AS doctors, sum(s.appointments) AS appointments, sum(s.minutes) AS minutes
+            FROM appointment_daily_stats s JOIN doctor d ON d.id = s.doctor_id
+            {where} GROUP BY d.specialty ORDER BY d.specialty"""
+        keys = ('specialty', 'doctors')
+    else:
+        sql = f"""
+            SELECT s.day, sum(s.appointments) AS appointments, sum(s.minutes) AS minutes
+            FROM appointment_daily_stats s
+            {where} GROUP BY s.day ORDER BY s.day"""
+        keys = ('day',)
+
+    rows = session.execute(sa.text(sql), params)
+    return [dict(zip(keys + ('appointments', 'minutes'), row)) for row in rows]
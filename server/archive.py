@@ -0,0 +1,82 @@
+# archive.py
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.orm import aliased
+
+DEFAULTS = {
+    # Appointments that started more than this many days ago are archived
+    'ARCHIVE_AFTER_DAYS': 365,
+    'ARCHIVE_BATCH_SIZE': 1000,
+}
+
+COLUMNS = 'id, patient_id, doctor_id, start, duration_minutes, date, time, reason, version'
+
+# Trigger condition for a delete from appointment that is really a move into
+# the archive. The stats and change-log triggers skip those rows: the
+# appointment still happened, it just lives in the cold table now.
+ARCHIVED = 'EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id)'
+
+_config = dict(DEFAULTS)
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+        _config[key] = app.config[key]
+
+
+def default_cutoff():
+    return datetime.combine(datetime.utcnow().date(), datetime.min.time()) - timedelta(days=_config['ARCHIVE_AFTER_DAYS'])
+
+
+# Move appointments starting before cutoff into appointment_archive, one
+# transaction per batch so bookings are never held up behind one long move.
+# Batches walk the rowid, where old appointments cluster, so no start index
+# is needed on the hot table. Appointment ids are AUTOINCREMENT, so an
+# archived id is never reused by a new booking.
+def archive(connection, cutoff=None, batch_size=None):
+    cutoff = (cutoff or default_cutoff()).strftime('%Y-%m-%d %H:%M:%S')
+    batch_size = batch_size or _config['ARCHIVE_BATCH_SIZE']
+    moved = 0
+    while True:
+        with connection.begin():
+            ids = connection.execute(sa.text(
+                'SELECT id FROM appointment WHERE start < :cutoff ORDER BY id LIMIT :batch'
+            ), {'cutoff': cutoff, 'batch': batch_size}).scalars().all()
+            if not ids:
+                return moved
+            params = {'cutoff': cutoff, 'first': ids[0], 'last': ids[-1]}
+            connection.execute(sa.text(
+                f'INSERT INTO appointment_archive ({COLUMNS}) SELECT {COLUMNS} FROM appointment '
+                'WHERE id BETWEEN :first AND :last AND start < :cutoff'
+            ), params)
+            connection.execute(sa.text(
+                'DELETE FROM appointment WHERE id BETWEEN :first AND :last AND start < :cutoff'
+            ), params)
+        moved += len(ids)
+
+
+# Start of the newest archived appointment, or None while the archive is empty
+def watermark(session):
+    value = session.execute(sa.text('SELECT max(start) FROM appointment_archive')).scalar()
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+# Whether a listing from first_start onwards can reach archived rows. Open
+# ranges stay on the hot table: history is only read when asked for by date.
+def needed(session, first_start):
+    if first_start is None:
+        return False
+    newest = watermark(session)
+    return newest is not None and first_start <= newest
+
+
+# Appointment mapped over hot UNION ALL cold, for queries that need both
+def with_archive(model, archive_model):
+    columns = [column.name for column in model.__table__.columns]
+    union = sa.union_all(
+        sa.select(*[model.__table__.c[name] for name in columns]),
+        sa.select(*[archive_model.__table__.c[name] for name in columns]),
+    ).subquery('appointment_all')
+    return aliased(model, union)
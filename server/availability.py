@@ -0,0 +1,188 @@
+# availability.py
+import threading
+import time as clock
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from models import db, Appointment, DEFAULT_APPOINTMENT_MINUTES
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+WORKDAY_START_SLOT = 8 * 60 // SLOT_MINUTES
+WORKDAY_END_SLOT = 18 * 60 // SLOT_MINUTES
+
+# Entries are per worker process; the TTL bounds how long a booking made by
+# another worker can go unseen here. The maps are only the fast path: every
+# write also checks overlapping() inside its own transaction, so a booking
+# the map has not seen yet still turns it away.
+CACHE_TTL_SECONDS = 60
+MAX_CACHED_DAYS = 50000
+
+# Per (doctor_id, day) slot map: a bytearray holding how many appointments
+# cover each SLOT_MINUTES slot of the day. Legacy rows may overlap, so counts
+# rather than bits let a release undo exactly one booking.
+_days = OrderedDict()
+_lock = threading.Lock()
+
+
+class Conflict(Exception):
+    pass
+
+
+def _slot_spans(start, minutes):
+    end = start + timedelta(minutes=minutes or DEFAULT_APPOINTMENT_MINUTES)
+    day = start.date()
+    while datetime.combine(day, datetime.min.time()) < end:
+        midnight = datetime.combine(day, datetime.min.time())
+        first = max(0, int((start - midnight).total_seconds() // 60) // SLOT_MINUTES)
+        last = min(SLOTS_PER_DAY, -(-int((end - midnight).total_seconds() // 60) // SLOT_MINUTES))
+        if last > first:
+            yield day, first, last
+        day += timedelta(days=1)
+
+
+def _load(doctor_id, days):
+    # One indexed range scan on (doctor_id, start) for every missing day;
+    # the extra day back picks up appointments that run past midnight.
+    first, last = min(days), max(days)
+    rows = db.session.query(Appointment.start, Appointment.duration_minutes).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.start >= datetime.combine(first - timedelta(days=1), datetime.min.time()),
+        Appointment.start < datetime.combine(last + timedelta(days=1), datetime.min.time()),
+    ).all()
+
+    maps = {day: bytearray(SLOTS_PER_DAY) for day in days}
+    for start, minutes in rows:
+        for day, lo, hi in _slot_spans(start, minutes):
+            if day in maps:
+                slots = maps[day]
+                for i in range(lo, hi):
+                    slots[i] = min(slots[i] + 1, 255)
+    return maps
+
+
+def _cached(doctor_id, day):
+    entry = _days.get((doctor_id, day))
+    if entry is None or clock.monotonic() - entry[0] > CACHE_TTL_SECONDS:
+        return None
+    _days.move_to_end((doctor_id, day))
+    return entry[1]
+
+
+def _slot_maps(doctor_id, days):
+    with _lock:
+        maps = {day: _cached(doctor_id, day) for day in days}
+    missing = [day for day, slots in maps.items() if slots is None]
+    if missing:
+        loaded = _load(doctor_id, missing)
+        now = clock.monotonic()
+        with _lock:
+            for day, slots in loaded.items():
+                # Another thread may have loaded and booked into this day meanwhile
+                current = _cached(doctor_id, day)
+                if current is None:
+                    _days[(doctor_id, day)] = (now, slots)
+                    current = slots
+                maps[day] = current
+            while len(_days) > MAX_CACHED_DAYS:
+                _days.popitem(last=False)
+    return maps
+
+
+# Check and mark a booking's slots in one step, returning False on a clash.
+# ignore is the (start, minutes) of a booking being moved so it does not clash
+# with itself. Callers release() the slots again if their commit fails.
+def reserve(doctor_id, start, minutes, ignore=None):
+    doctor_id = int(doctor_id)
+    spans = list(_slot_spans(start, minutes))
+    maps = _slot_maps(doctor_id, {day for day, _, _ in spans})
+    ignored = {}
+    if ignore is not None and ignore[0] is not None:
+        for day, lo, hi in _slot_spans(*ignore):
+            for i in range(lo, hi):
+                ignored[(day, i)] = ignored.get((day, i), 0) + 1
+
+    with _lock:
+        for day, lo, hi in spans:
+            slots = maps[day]
+            if any(slots[i] - ignored.get((day, i), 0) > 0 for i in range(lo, hi)):
+                return False
+        for day, lo, hi in spans:
+            slots = maps[day]
+            for i in range(lo, hi):
+                slots[i] = min(slots[i] + 1, 255)
+    return True
+
+
+# SQL condition: doctor_id has a live appointment, other than exclude_id,
+# overlapping [start, start + minutes). One range scan on (doctor_id, start).
+def overlapping(doctor_id, start, minutes, exclude_id=None):
+    end = start + timedelta(minutes=minutes or DEFAULT_APPOINTMENT_MINUTES)
+    ends = sa.func.datetime(Appointment.start, sa.func.printf(
+        '+%d minutes', sa.func.coalesce(Appointment.duration_minutes, DEFAULT_APPOINTMENT_MINUTES)))
+    condition = sa.exists().where(Appointment.doctor_id == int(doctor_id), Appointment.start < end,
+                                  ends > start.strftime('%Y-%m-%d %H:%M:%S'))
+    if exclude_id is not None:
+        condition = condition.where(Appointment.id != exclude_id)
+    return condition
+
+
+# For a write already flushed in this session: it holds the database's write
+# lock, so the answer cannot change before it commits. A clash means this
+# process's map missed another worker's booking, so the doctor's days are
+# dropped to be reloaded.
+def clashes(doctor_id, start, minutes, exclude_id):
+    if start is None or not db.session.query(overlapping(doctor_id, start, minutes, exclude_id)).scalar():
+        return False
+    forget(doctor_id)
+    return True
+
+
+def release(doctor_id, start, minutes):
+    if start is None:
+        return
+    doctor_id = int(doctor_id)
+    with _lock:
+        for day, lo, hi in _slot_spans(start, minutes):
+            slots = _cached(doctor_id, day)
+            if slots is not None:
+                for i in range(lo, hi):
+                    slots[i] = max(slots[i] - 1, 0)
+
+
+def free_intervals(doctor_id, first_day, last_day):
+    days = [first_day + timedelta(days=n) for n in range((last_day - first_day).days + 1)]
+    maps = _slot_maps(doctor_id, days)
+
+    result = []
+    for day in days:
+        slots = maps[day]
+        midnight = datetime.combine(day, datetime.min.time())
+        free, run_start = [], None
+        for i in range(WORKDAY_START_SLOT, WORKDAY_END_SLOT + 1):
+            is_free = i < WORKDAY_END_SLOT and slots[i] == 0
+            if is_free and run_start is None:
+                run_start = i
+            elif not is_free and run_start is not None:
+                free.append([
+                    (midnight + timedelta(minutes=run_start * SLOT_MINUTES)).strftime('%H:%M'),
+                    (midnight + timedelta(minutes=i * SLOT_MINUTES)).strftime('%H:%M'),
+                ])
+                run_start = None
+        result.append({'date': day.isoformat(), 'free': free})
+    return result
+
+
+def clear():
+    with _lock:
+        _days.clear()
+
+
+# Drop one doctor's cached days, e.g. after a set-based change to their bookings
+def forget(doctor_id):
+    doctor_id = int(doctor_id)
+    with _lock:
+        for key in [key for key in _days if key[0] == doctor_id]:
+            del _days[key]
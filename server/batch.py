@@ -0,0 +1,252 @@
+# batch.py
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Doctor, Patient, Symptom, Appointment, patient_symptom, parse_appointment_start, DEFAULT_APPOINTMENT_MINUTES
+from bulk import RowError, validate_patient, validate_appointment, validate_appointment_changes, validate_patient_symptom
+import availability
+import cooccurrence
+import deletes
+import doctor_load
+import refcache
+
+DEFAULT_MAX_OPERATIONS = 100
+
+
+class BatchError(Exception):
+    def __init__(self, index, status, message):
+        super().__init__(message)
+        self.index = index
+        self.status = status
+        self.message = message
+
+
+def _validate_doctor(record):
+    if not record.get('name') or not record.get('specialty'):
+        raise RowError('name and specialty are required')
+    return {'name': record['name'], 'specialty': record['specialty'], 'phone': record.get('phone'),
+            'email': record.get('email'), 'image_url': record.get('imageUrl')}
+
+
+def _validate_symptom(record):
+    if not record.get('name'):
+        raise RowError('name is required')
+    return {'name': record['name'], 'description': record.get('description')}
+
+
+# Fields an update may change, mapped from request key to model attribute
+RESOURCES = {
+    'doctors': {'model': Doctor, 'validate': _validate_doctor, 'cache': 'doctors',
+                'fields': {'name': 'name', 'specialty': 'specialty', 'phone': 'phone', 'email': 'email', 'imageUrl': 'image_url'}},
+    'patients': {'model': Patient, 'validate': validate_patient,
+                 'fields': {'name': 'name', 'age': 'age', 'doctor_id': 'doctor_id'}},
+    'symptoms': {'model': Symptom, 'validate': _validate_symptom, 'cache': 'symptoms',
+                 'fields': {'name': 'name', 'description': 'description'}},
+    'appointments': {'model': Appointment, 'validate': validate_appointment,
+                     'fields': {'patient_id': 'patient_id', 'doctor_id': 'doctor_id', 'reason': 'reason'}},
+    'patient-symptoms': {'validate': validate_patient_symptom},
+}
+
+
+# "$name" (an earlier operation's ref) or "$3" (its index) becomes that
+# operation's new id; anything else is returned unchanged.
+def _resolve(value, created, index):
+    if isinstance(value, str) and value.startswith('$'):
+        key = value[1:]
+        if key not in created:
+            raise BatchError(index, 400, f'{value} does not refer to an earlier create')
+        return created[key]
+    return value
+
+
+class Batch:
+    def __init__(self):
+        self.created = {}
+        self.reserved = []
+        self.released = []
+        self.forgotten = set()
+        self.diagnoses = []
+        self.caches = set()
+        # (doctor_load hook, *args) calls, made once the batch has committed
+        self.loads = []
+
+    def run(self, operations):
+        results = []
+        try:
+            for index, operation in enumerate(operations):
+                try:
+                    results.append(self._apply(index, operation))
+                except SQLAlchemyError as error:
+                    raise BatchError(index, 400, str(getattr(error, 'orig', None) or error))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for slot in self.reserved:
+                availability.release(*slot)
+            raise
+        # Slots given up by moved or deleted appointments only free up once committed
+        for slot in self.released:
+            availability.release(*slot)
+        for doctor_id in self.forgotten:
+            availability.forget(doctor_id)
+        cooccurrence.record(db.session, self.diagnoses)
+        for adjust, *args in self.loads:
+            adjust(*args)
+        for namespace in self.caches:
+            refcache.invalidate(namespace)
+        return results
+
+    def _apply(self, index, operation):
+        if not isinstance(operation, dict):
+            raise BatchError(index, 400, 'Expected a JSON object')
+        op, resource = operation.get('op'), operation.get('resource')
+        if resource not in RESOURCES:
+            raise BatchError(index, 400, f"resource must be one of {', '.join(RESOURCES)}")
+        spec = RESOURCES[resource]
+        data = operation.get('data') or {}
+        if not isinstance(data, dict):
+            raise BatchError(index, 400, 'data must be a JSON object')
+        data = {key: _resolve(value, self.created, index) for key, value in data.items()}
+
+        try:
+            if op == 'create':
+                result = self._create(index, resource, spec, data)
+                new_id = result.get('id')
+                self.created[str(index)] = new_id
+                if operation.get('ref') is not None:
+                    self.created[str(operation['ref'])] = new_id
+                return result
+            if resource == 'patient-symptoms':
+                raise BatchError(index, 400, 'patient-symptoms only supports create')
+            target = _resolve(operation.get('id'), self.created, index)
+            if op == 'update':
+                return self._update(index, resource, spec, target, data)
+            if op == 'delete':
+                return self._delete(index, resource, spec, target, data)
+            raise BatchError(index, 400, 'op must be create, update or delete')
+        except RowError as error:
+            raise BatchError(index, 400, str(error))
+
+    def _reserve(self, index, doctor_id, start, minutes, ignore=None):
+        if not availability.reserve(doctor_id, start, minutes, ignore=ignore):
+            raise BatchError(index, 409, 'Doctor is not available at that time')
+        self.reserved.append((doctor_id, start, minutes))
+
+    # The slot maps are per process; the flushed row is checked against the
+    # table too, under the write lock this transaction now holds
+    def _recheck(self, index, obj):
+        if availability.clashes(obj.doctor_id, obj.start, obj.duration_minutes, obj.id):
+            raise BatchError(index, 409, 'Doctor is not available at that time')
+
+    def _create(self, index, resource, spec, data):
+        values = spec['validate'](data)
+        if resource == 'patient-symptoms':
+            db.session.execute(patient_symptom.insert().values(**values))
+            self.diagnoses.append((values['patient_id'], values['symptom_id']))
+            return {'index': index, 'status': 201}
+        if resource == 'appointments':
+            self._reserve(index, values['doctor_id'], values['start'], values['duration_minutes'])
+        obj = spec['model'](**values)
+        db.session.add(obj)
+        db.session.flush()
+        if resource == 'appointments':
+            self._recheck(index, obj)
+        if resource == 'doctors':
+            self.loads.append((doctor_load.doctor_added, obj.id, obj.specialty))
+        elif resource == 'patients':
+            self.loads.append((doctor_load.patient_added, obj.doctor_id))
+        elif resource == 'appointments':
+            self.loads.append((doctor_load.appointment_added, obj.doctor_id))
+        if 'cache' in spec:
+            self.caches.add(spec['cache'])
+        return {'index': index, 'status': 201, 'id': obj.id}
+
+    def _get(self, index, spec, target):
+        obj = db.session.get(spec['model'], target) if isinstance(target, int) else None
+        if obj is None:
+            raise BatchError(index, 404, f'{spec["model"].__name__} {target} not found')
+        return obj
+
+    def _update(self, index, resource, spec, target, data):
+        obj = self._get(index, spec, target)
+        old_doctor = getattr(obj, 'doctor_id', None)
+        if resource == 'appointments':
+            data = {**data, **validate_appointment_changes(data)}
+            old_slot = (obj.start, obj.duration_minutes)
+        for key, attribute in spec['fields'].items():
+            if key in data:
+                setattr(obj, attribute, data[key])
+
+        if resource == 'appointments':
+            start, minutes = old_slot
+            if 'start' in data or 'date' in data or 'time' in data:
+                try:
+                    start = parse_appointment_start(data.get('date', obj.date), data.get('time', obj.time), data.get('start'))
+                except (TypeError, ValueError):
+                    raise BatchError(index, 400, 'Invalid appointment date or time')
+            minutes = data.get('duration_minutes', minutes) or DEFAULT_APPOINTMENT_MINUTES
+            if (obj.doctor_id, start, minutes) != (old_doctor, *old_slot):
+                self._reserve(index, obj.doctor_id, start, minutes, ignore=old_slot if obj.doctor_id == old_doctor else None)
+                self.released.append((old_doctor, *old_slot))
+                obj.set_start(start)
+                obj.duration_minutes = minutes
+                db.session.flush()
+                self._recheck(index, obj)
+
+        db.session.flush()
+        if resource == 'doctors' and 'specialty' in data:
+            self.loads.append((doctor_load.doctor_updated, obj.id, obj.specialty))
+        elif resource == 'patients':
+            self.loads.append((doctor_load.patient_moved, old_doctor, obj.doctor_id))
+        elif resource == 'appointments':
+            self.loads.append((doctor_load.appointment_moved, old_doctor, obj.doctor_id))
+        if 'cache' in spec:
+            self.caches.add(spec['cache'])
+        return {'index': index, 'status': 200, 'id': obj.id}
+
+    # Doctors, patients and symptoms go through deletes.py, taking their
+    # dependents with them; data may carry a doctor's reassign_to or cascade.
+    def _delete(self, index, resource, spec, target, data):
+        if resource == 'appointments':
+            obj = self._get(index, spec, target)
+            self.released.append((obj.doctor_id, obj.start, obj.duration_minutes))
+            self.loads.append((doctor_load.appointment_removed, obj.doctor_id))
+            db.session.delete(obj)
+            db.session.flush()
+        else:
+            found = None
+            if isinstance(target, int):
+                try:
+                    if resource == 'doctors':
+                        found = deletes.delete_doctor(target, reassign_to=data.get('reassign_to'), cascade=bool(data.get('cascade')))
+                        self.forgotten.update(d for d in (target, data.get('reassign_to')) if d is not None)
+                        if found is not None:
+                            self.loads.extend((doctor_load.appointment_removed, slot[0]) for slot in found if slot[0] != target)
+                            self.loads.append((doctor_load.doctor_removed, target, data.get('reassign_to')))
+                    elif resource == 'patients':
+                        found = deletes.delete_patient(target)
+                        if found is not None:
+                            doctor_id, found = found
+                            self.loads.extend((doctor_load.appointment_removed, slot[0]) for slot in found)
+                            self.loads.append((doctor_load.patient_removed, doctor_id))
+                    else:
+                        found = deletes.delete_symptom(target) or None
+                except deletes.HasDependents:
+                    raise BatchError(index, 409, 'Doctor still has patients or appointments; pass reassign_to or cascade')
+                except deletes.Conflict as error:
+                    raise BatchError(index, 409, str(error))
+            if found is None:
+                raise BatchError(index, 404, f'{spec["model"].__name__} {target} not found')
+            if isinstance(found, list):
+                self.released.extend(found)
+        if 'cache' in spec:
+            self.caches.add(spec['cache'])
+        return {'index': index, 'status': 200, 'id': target}
+
+
+def max_operations():
+    return current_app.config.get('BATCH_MAX_OPERATIONS', DEFAULT_MAX_OPERATIONS)
+
+
+def run(operations):
+    return Batch().run(operations)
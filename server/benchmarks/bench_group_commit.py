@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Compares per-request commits with group commit for concurrent inserts.
+# Run from the server directory:
+#   python -m benchmarks.bench_group_commit --threads 16 --rows 200
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import sqlalchemy as sa
+
+from group_commit import GroupCommitter
+
+
+def make_engine(path, synchronous):
+    engine = sa.create_engine(f'sqlite:///{path}', pool_size=1, max_overflow=0, pool_timeout=60)
+
+    @sa.event.listens_for(engine, 'connect')
+    def pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
+    return engine
+
+
+def make_table(engine):
+    metadata = sa.MetaData()
+    table = sa.Table(
+        'appointment', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('patient_id', sa.Integer, nullable=False),
+        sa.Column('doctor_id', sa.Integer, nullable=False),
+        sa.Column('reason', sa.String(200), nullable=False),
+    )
+    metadata.create_all(engine)
+    return table
+
+
+def run(threads, rows, insert):
+    def worker(n):
+        for i in range(rows):
+            insert({'patient_id': n, 'doctor_id': i % 10, 'reason': 'benchmark'})
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return threads * rows / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-request commit vs group commit insert throughput')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rows', type=int, default=200, help='inserts per thread')
+    parser.add_argument('--window-ms', type=float, default=2)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--synchronous', default='FULL', choices=['OFF', 'NORMAL', 'FULL'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, 'per_request.db'), args.synchronous)
+        table = make_table(engine)
+
+        def per_request(values):
+            with engine.begin() as connection:
+                connection.execute(table.insert().values(**values))
+
+        baseline = run(args.threads, args.rows, per_request)
+
+        engine = make_engine(os.path.join(tmp, 'group.db'), args.synchronous)
+        table = make_table(engine)
+        committer = GroupCommitter(engine, args.window_ms, args.max_batch)
+        grouped = run(args.threads, args.rows, lambda values: committer.execute(table.insert().values(**values)))
+
+    print(f'threads={args.threads} rows/thread={args.rows} synchronous={args.synchronous}')
+    print(f'per-request commit: {baseline:10.0f} inserts/s')
+    print(f'group commit:       {grouped:10.0f} inserts/s  '
+          f'({committer.batches} batches, avg {committer.statements / max(committer.batches, 1):.1f} rows)')
+    print(f'speedup:            {grouped / baseline:10.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# Load and latency benchmarks for every route in app.py.
+#
+# Each dataset is seeded into its own temporary SQLite file and benchmarked
+# in a fresh subprocess, once through the Flask test client and once through
+# a real WSGI server on 127.0.0.1. Run from the server directory:
+#
+#   python -m benchmarks.bench_http --datasets tiny,small --output results.json
+#   python -m benchmarks.bench_http --datasets small --compare results.json
+#
+# With --compare, routes whose throughput dropped or whose p95 latency rose
+# by more than --threshold are listed and the exit status is 1.
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+DATASETS = {
+    'tiny': {'doctors': 10, 'patients': 1000, 'appointments': 10000, 'users': 20},
+    'small': {'doctors': 100, 'patients': 10000, 'appointments': 100000, 'users': 100},
+    'medium': {'doctors': 1000, 'patients': 100000, 'appointments': 1000000, 'users': 1000},
+    'large': {'doctors': 1000, 'patients': 1000000, 'appointments': 10000000, 'users': 1000},
+}
+
+# Relative weights of each route in the mixed workload profiles
+PROFILES = {
+    'read-heavy': {'list_doctors': 20, 'list_symptoms': 20, 'list_appointments': 25, 'availability': 20,
+                   'list_users': 5, 'create_appointment': 5, 'update_appointment': 3, 'create_patient': 2},
+    'mixed': {'list_doctors': 10, 'list_symptoms': 10, 'list_appointments': 20, 'availability': 15,
+              'create_appointment': 15, 'update_appointment': 10, 'delete_appointment': 5,
+              'create_patient': 10, 'update_patient': 5},
+    'write-heavy': {'list_appointments': 10, 'availability': 10, 'create_appointment': 30,
+                    'update_appointment': 15, 'delete_appointment': 10, 'create_patient': 20, 'update_patient': 5},
+}
+
+DISPOSABLE_ROWS = 5000
+
+
+# ---- transports ----------------------------------------------------------
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, len(response.data)
+
+
+class HTTPTransport:
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status, len(data)
+
+
+def start_wsgi_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ---- scenarios -----------------------------------------------------------
+
+# A scenario returns (method, path, json body) for one timed request. Some
+# need untimed preparation first (logging in, a row to delete).
+class Context:
+    def __init__(self, sizes, disposables):
+        self.sizes = sizes
+        self.disposables = disposables
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.first_day = date.today()
+
+    def take(self, kind):
+        with self.lock:
+            return self.disposables[kind].pop() if self.disposables[kind] else None
+
+    def future_start(self, rng):
+        day = self.first_day + timedelta(days=400 + rng.randrange(3000))
+        return f'{day.isoformat()}T{rng.randrange(8, 18):02d}:{rng.choice((0, 15, 30, 45)):02d}'
+
+
+def login(transport, ctx, rng):
+    transport.request('POST', '/login', {'username': 'user1', 'password': 'password1'})
+
+
+SCENARIOS = {
+    'login': lambda ctx, rng: ('POST', '/login', {'username': 'user1', 'password': 'password1'}),
+    'signup': lambda ctx, rng: ('POST', '/signup', {'username': f'bench-{uuid.uuid4().hex[:12]}', 'password': 'password'}),
+    'protected': lambda ctx, rng: ('GET', '/protected', None),
+    'logout': lambda ctx, rng: ('GET', '/logout', None),
+    'list_doctors': lambda ctx, rng: ('GET', '/doctors', None),
+    'list_symptoms': lambda ctx, rng: ('GET', '/symptoms', None),
+    'list_users': lambda ctx, rng: ('GET', '/users', None),
+    'list_appointments': lambda ctx, rng: ('GET', f'/appointments?limit=100&after={rng.randrange(ctx.sizes["appointments"])}', None),
+    'list_appointments_by_doctor': lambda ctx, rng: ('GET', f'/appointments?doctor_id={rng.randint(1, ctx.sizes["doctors"])}&limit=100', None),
+    'availability': lambda ctx, rng: ('GET', f'/doctors/{rng.randint(1, ctx.sizes["doctors"])}/availability', None),
+    'search': lambda ctx, rng: ('GET', f'/search?q={rng.choice(("fev", "pain", "influ", "migr", "cough", "asth"))}', None),
+    'appointment_stats': lambda ctx, rng: ('GET', f'/stats/appointments?group_by={rng.choice(("doctor", "specialty", "day"))}&from={ctx.first_day - timedelta(days=90)}&to={ctx.first_day}', None),
+    'create_doctor': lambda ctx, rng: ('POST', '/doctors', {'name': 'Dr. Bench', 'specialty': 'Cardiology'}),
+    'update_doctor': lambda ctx, rng: ('PUT', f'/doctors/{rng.randint(6, ctx.sizes["doctors"])}', {'specialty': 'Neurology'}),
+    'delete_doctor': lambda ctx, rng: ('DELETE', f'/doctors/{ctx.take("doctor")}', None),
+    'list_patients': lambda ctx, rng: ('GET', f'/patients?expand=symptoms&limit=100&after={rng.randrange(ctx.sizes["patients"])}', None),
+    'get_patient': lambda ctx, rng: ('GET', f'/patients/{rng.randint(1, ctx.sizes["patients"])}?expand=symptoms,appointments', None),
+    'get_doctor': lambda ctx, rng: ('GET', f'/doctors/{rng.randint(1, ctx.sizes["doctors"])}?expand=patients', None),
+    'create_patient': lambda ctx, rng: ('POST', '/patients', {'name': 'Bench Patient', 'age': rng.randint(0, 90), 'doctor_id': rng.randint(1, ctx.sizes['doctors'])}),
+    'update_patient': lambda ctx, rng: ('PUT', f'/patients/{rng.randint(1, ctx.sizes["patients"])}', {'age': rng.randint(0, 90)}),
+    'delete_patient': lambda ctx, rng: ('DELETE', f'/patients/{ctx.take("patient")}', None),
+    'update_symptom': lambda ctx, rng: ('PUT', f'/symptoms/{rng.randint(1, 30)}', {'description': 'Updated by benchmark'}),
+    'delete_symptom': lambda ctx, rng: ('DELETE', f'/symptoms/{ctx.take("symptom")}', None),
+    'update_user': lambda ctx, rng: ('PUT', f'/users/{rng.randint(3, ctx.sizes["users"])}', {'username': f'bench-{uuid.uuid4().hex[:12]}'}),
+    'delete_user': lambda ctx, rng: ('DELETE', f'/users/{ctx.take("user")}', None),
+    'create_appointment': lambda ctx, rng: ('POST', '/appointments', {
+        'patient_id': rng.randint(1, ctx.sizes['patients']), 'doctor_id': rng.randint(1, ctx.sizes['doctors']),
+        'start': ctx.future_start(rng), 'reason': 'Benchmark'}),
+    'update_appointment': lambda ctx, rng: ('PUT', f'/appointments/{rng.randint(1, ctx.sizes["appointments"])}', {'reason': 'Rescheduled by benchmark'}),
+    'delete_appointment': lambda ctx, rng: ('DELETE', f'/appointments/{ctx.take("appointment")}', None),
+}
+
+PREPARE = {'protected': login, 'logout': login}
+
+
+def create_disposables(app, count):
+    from models import db, Doctor, Patient, Symptom, User, Appointment
+
+    prefix = uuid.uuid4().hex[:8]
+    with app.app_context():
+        rows = {
+            'doctor': [{'name': 'Dr. Disposable', 'specialty': 'None'} for _ in range(count)],
+            'symptom': [{'name': 'Disposable', 'description': None} for _ in range(count)],
+            'user': [{'username': f'disposable-{prefix}-{i}', 'password_hash': 'x'} for i in range(count)],
+        }
+        tables = {'doctor': Doctor, 'symptom': Symptom, 'user': User}
+        ids = {}
+        for kind, model in tables.items():
+            first = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+            db.session.execute(model.__table__.insert(), rows[kind])
+            ids[kind] = list(range(first, first + count))
+        db.session.commit()
+
+        # Patients and appointments hang off a disposable doctor so deleting them touches nothing else
+        doctor_id = ids['doctor'].pop()
+        first = (db.session.query(db.func.max(Patient.id)).scalar() or 0) + 1
+        db.session.execute(Patient.__table__.insert(), [{'name': 'Disposable', 'age': 1, 'doctor_id': doctor_id} for _ in range(count)])
+        ids['patient'] = list(range(first, first + count))
+        start = date.today() + timedelta(days=5000)
+        first = (db.session.query(db.func.max(Appointment.id)).scalar() or 0) + 1
+        db.session.execute(Appointment.__table__.insert(), [
+            {'patient_id': ids['patient'][0], 'doctor_id': doctor_id, 'start': start + timedelta(days=i),
+             'date': (start + timedelta(days=i)).isoformat(), 'time': '09:00', 'reason': 'Disposable'}
+            for i in range(count)])
+        ids['appointment'] = list(range(first, first + count))
+        ids['patient'] = ids['patient'][1:]
+        db.session.commit()
+    return ids
+
+
+# ---- measurement ---------------------------------------------------------
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, elapsed, sizes):
+    latencies.sort()
+    count = len(latencies)
+    return {
+        'requests': count,
+        'throughput_rps': round(count / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if count else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if count else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if count else None,
+        'mean_response_bytes': round(sum(sizes) / count, 1) if count else None,
+        'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+        'server_errors': sum(1 for status in statuses if status >= 500),
+    }
+
+
+def run_load(make_transport, ctx, weights, requests, concurrency, seed):
+    names = list(weights)
+    cumulative = []
+    total = 0
+    for name in names:
+        total += weights[name]
+        cumulative.append(total)
+
+    per_route = {name: ([], [], []) for name in names}
+    counter = {'left': requests}
+    counter_lock = threading.Lock()
+    # A fresh stream per run so later runs do not book the same slots again
+    ctx.runs += 1
+    run = ctx.runs
+
+    def worker(worker_id):
+        rng = random.Random(f'{seed}:{run}:{worker_id}')
+        transport = make_transport()
+        while True:
+            with counter_lock:
+                if counter['left'] <= 0:
+                    return
+                counter['left'] -= 1
+            name = rng.choices(names, cum_weights=cumulative)[0]
+            if name in PREPARE:
+                PREPARE[name](transport, ctx, rng)
+            method, path, body = SCENARIOS[name](ctx, rng)
+            started = time.perf_counter()
+            status, size = transport.request(method, path, body)
+            elapsed = time.perf_counter() - started
+            latencies, statuses, sizes = per_route[name]
+            latencies.append(elapsed)
+            statuses.append(status)
+            sizes.append(size)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    routes = {name: summarize(*per_route[name][:2], elapsed, per_route[name][2]) for name in names if per_route[name][0]}
+    everything = [value for name in names for value in per_route[name][0]]
+    all_statuses = [value for name in names for value in per_route[name][1]]
+    all_sizes = [value for name in names for value in per_route[name][2]]
+    return summarize(everything, all_statuses, elapsed, all_sizes), routes
+
+
+def bench_dataset(args):
+    from app import app
+    import seed
+
+    sizes = dict(DATASETS[args.dataset])
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            seed.seed_data(days=max(365, sizes['appointments'] // sizes['doctors'] // 15 + 1), seed=args.seed, **sizes)
+        finally:
+            sys.stdout = stdout
+    ctx = Context(sizes, {})
+
+    results = {}
+    for server in args.servers:
+        if server == 'wsgi':
+            httpd = start_wsgi_server(app)
+            make_transport = lambda: HTTPTransport(httpd.server_port)
+        else:
+            httpd = None
+            make_transport = lambda: TestClientTransport(app)
+
+        ctx.disposables = create_disposables(app, max(DISPOSABLE_ROWS, args.requests * (len(args.profiles) + 1)))
+        routes = {}
+        for name in SCENARIOS:
+            total, _ = run_load(make_transport, ctx, {name: 1}, args.requests, args.concurrency, args.seed)
+            routes[name] = total
+            print(f'  {args.dataset:>6} {server:>10} {name:<28} {total["throughput_rps"]:>9} rps  '
+                  f'p50 {total["p50_ms"]:>8} ms  p95 {total["p95_ms"]:>8} ms  p99 {total["p99_ms"]:>8} ms', file=sys.stderr)
+
+        profiles = {}
+        for profile in args.profiles:
+            total, per_route = run_load(make_transport, ctx, PROFILES[profile], args.requests * 5, args.concurrency, args.seed)
+            profiles[profile] = {'total': total, 'routes': per_route}
+            print(f'  {args.dataset:>6} {server:>10} profile:{profile:<20} {total["throughput_rps"]:>9} rps  '
+                  f'p50 {total["p50_ms"]:>8} ms  p95 {total["p95_ms"]:>8} ms  p99 {total["p99_ms"]:>8} ms', file=sys.stderr)
+
+        if httpd is not None:
+            httpd.shutdown()
+        results[server] = {'routes': routes, 'profiles': profiles}
+    return {'sizes': sizes, 'servers': results}
+
+
+# ---- orchestration and comparison ----------------------------------------
+
+def flatten(results):
+    flat = {}
+    for dataset, data in results['datasets'].items():
+        for server, server_data in data['servers'].items():
+            for route, stats in server_data['routes'].items():
+                flat[f'{dataset}/{server}/{route}'] = stats
+            for profile, profile_data in server_data['profiles'].items():
+                flat[f'{dataset}/{server}/profile:{profile}'] = profile_data['total']
+    return flat
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    old, new = flatten(baseline), flatten(current)
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        if before['throughput_rps'] and after['throughput_rps'] is not None and after['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f'{key}: throughput {before["throughput_rps"]} -> {after["throughput_rps"]} rps')
+        if before['p95_ms'] and after['p95_ms'] is not None and after['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f'{key}: p95 {before["p95_ms"]} -> {after["p95_ms"]} ms')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP load and latency benchmarks for every route in app.py.')
+    parser.add_argument('--datasets', default='tiny', help=f'comma-separated, from {", ".join(DATASETS)}')
+    parser.add_argument('--servers', default='testclient,wsgi', help='comma-separated: testclient, wsgi')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help=f'comma-separated, from {", ".join(PROFILES)}')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route (profiles run 5x this)')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--compare', help='baseline results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed relative slowdown before flagging')
+    parser.add_argument('--dataset', help=argparse.SUPPRESS)
+    parser.add_argument('--part', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.servers = [server for server in args.servers.split(',') if server]
+    args.profiles = [profile for profile in args.profiles.split(',') if profile]
+
+    if args.dataset:
+        with open(args.part, 'w') as part:
+            json.dump(bench_dataset(args), part)
+        return 0
+
+    results = {
+        'meta': {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+                 'requests': args.requests, 'concurrency': args.concurrency, 'seed': args.seed},
+        'datasets': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for dataset in args.datasets.split(','):
+            database = os.path.join(tmp, f'{dataset}.db')
+            part = os.path.join(tmp, f'{dataset}.json')
+            # One client drives all the load, which admission control would shed
+            env = dict(os.environ, FLASK_SQLALCHEMY_DATABASE_URI=f'sqlite:///{database}', FLASK_ADMISSION_ENABLED='false')
+            command = [sys.executable, '-m', 'benchmarks.bench_http', '--dataset', dataset, '--part', part,
+                       '--servers', ','.join(args.servers), '--profiles', ','.join(args.profiles),
+                       '--requests', str(args.requests), '--concurrency', str(args.concurrency), '--seed', str(args.seed)]
+            print(f'{dataset}: seeding {DATASETS[dataset]} and benchmarking', file=sys.stderr)
+            subprocess.run(command, env=env, check=True)
+            with open(part) as f:
+                results['datasets'][dataset] = json.load(f)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'results written to {args.output}', file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}:', file=sys.stderr)
+            for regression in regressions:
+                print(f'  {regression}', file=sys.stderr)
+            return 1
+        print('no regressions', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+# bulk.py
+import json
+from itertools import islice
+
+from flask import current_app, request
+
+from models import db, Doctor, Patient, Symptom, Appointment, patient_symptom, parse_appointment_start, DEFAULT_APPOINTMENT_MINUTES
+import availability
+import cooccurrence
+import doctor_load
+
+DEFAULT_CHUNK_SIZE = 1000
+# Stay well under SQLite's bound-parameter limit in IN (...) lookups
+LOOKUP_BATCH_SIZE = 500
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+class RowError(ValueError):
+    pass
+
+
+class BodyError(ValueError):
+    pass
+
+
+# (index, record) pairs from a JSON array body or, for NDJSON, lazily from
+# the request stream so a large upload is never held in memory at once.
+def read_records():
+    if request.mimetype == NDJSON_MIMETYPE:
+        return _ndjson_records()
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise BodyError('Expected a JSON array or an NDJSON body')
+    return enumerate(data)
+
+
+def _ndjson_records():
+    index = 0
+    for line in request.stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError:
+            yield index, RowError('Invalid JSON')
+        index += 1
+
+
+def _required_int(record, key, minimum=None):
+    value = record.get(key)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RowError(f'{key} must be an integer')
+    if minimum is not None and value < minimum:
+        raise RowError(f'{key} must be at least {minimum}')
+    return value
+
+
+def _required_str(record, key, max_length):
+    value = record.get(key)
+    if not isinstance(value, str) or not value.strip():
+        raise RowError(f'{key} is required')
+    if len(value) > max_length:
+        raise RowError(f'{key} must be at most {max_length} characters')
+    return value
+
+
+def validate_patient(record):
+    return {
+        'name': _required_str(record, 'name', 150),
+        'age': _required_int(record, 'age', minimum=0),
+        'doctor_id': _required_int(record, 'doctor_id'),
+    }
+
+
+def validate_appointment(record):
+    try:
+        start = parse_appointment_start(record.get('date'), record.get('time'), record.get('start'))
+    except (TypeError, ValueError):
+        raise RowError('Invalid appointment date or time')
+    duration_minutes = record.get('duration_minutes', DEFAULT_APPOINTMENT_MINUTES)
+    if isinstance(duration_minutes, bool) or not isinstance(duration_minutes, int) or duration_minutes <= 0:
+        raise RowError('duration_minutes must be a positive integer')
+    return {
+        'patient_id': _required_int(record, 'patient_id'),
+        'doctor_id': _required_int(record, 'doctor_id'),
+        'start': start,
+        'duration_minutes': duration_minutes,
+        'date': start.date().isoformat(),
+        'time': start.strftime('%H:%M'),
+        'reason': _required_str(record, 'reason', 200),
+    }
+
+
+# The fields an appointment update carries, checked like validate_appointment
+# checks a new one. The start is parsed by the caller against the current row.
+def validate_appointment_changes(record):
+    changes = {}
+    if 'duration_minutes' in record:
+        duration_minutes = record['duration_minutes']
+        if isinstance(duration_minutes, bool) or not isinstance(duration_minutes, int) or duration_minutes <= 0:
+            raise RowError('duration_minutes must be a positive integer')
+        changes['duration_minutes'] = duration_minutes
+    for key in ('patient_id', 'doctor_id'):
+        if key in record:
+            changes[key] = _required_int(record, key)
+    if 'reason' in record:
+        changes['reason'] = _required_str(record, 'reason', 200)
+    return changes
+
+
+def validate_patient_symptom(record):
+    diagnosis = record.get('diagnosis')
+    if diagnosis is not None and (not isinstance(diagnosis, str) or len(diagnosis) > 100):
+        raise RowError('diagnosis must be a string of at most 100 characters')
+    return {
+        'patient_id': _required_int(record, 'patient_id'),
+        'symptom_id': _required_int(record, 'symptom_id'),
+        'diagnosis': diagnosis,
+    }
+
+
+def _existing_ids(model, ids):
+    found = set()
+    ids = list(ids)
+    for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        batch = ids[i:i + LOOKUP_BATCH_SIZE]
+        found.update(row[0] for row in db.session.query(model.id).filter(model.id.in_(batch)))
+    return found
+
+
+def _existing_pairs(pairs):
+    found = set()
+    patient_ids = list({patient_id for patient_id, _ in pairs})
+    for i in range(0, len(patient_ids), LOOKUP_BATCH_SIZE):
+        batch = patient_ids[i:i + LOOKUP_BATCH_SIZE]
+        rows = db.session.query(patient_symptom.c.patient_id, patient_symptom.c.symptom_id).filter(
+            patient_symptom.c.patient_id.in_(batch))
+        found.update((row[0], row[1]) for row in rows if (row[0], row[1]) in pairs)
+    return found
+
+
+def _check_pairs(rows, errors):
+    pairs = {(row['patient_id'], row['symptom_id']) for _, row in rows}
+    taken = _existing_pairs(pairs)
+    kept = []
+    for index, row in rows:
+        pair = (row['patient_id'], row['symptom_id'])
+        if pair in taken:
+            errors.append({'index': index, 'error': 'Symptom already recorded for this patient'})
+        else:
+            taken.add(pair)
+            kept.append((index, row))
+    return kept
+
+
+def _reserve_slots(rows, errors):
+    kept = []
+    for index, row in rows:
+        if availability.reserve(row['doctor_id'], row['start'], row['duration_minutes']):
+            kept.append((index, row))
+        else:
+            errors.append({'index': index, 'error': 'Doctor is not available at that time'})
+    return kept
+
+
+def _release_slots(rows):
+    for _, row in rows:
+        availability.release(row['doctor_id'], row['start'], row['duration_minutes'])
+
+
+def _patients_added(rows):
+    for _, row in rows:
+        doctor_load.patient_added(row['doctor_id'])
+
+
+def _appointments_added(rows):
+    for _, row in rows:
+        doctor_load.appointment_added(row['doctor_id'])
+
+
+RESOURCES = {
+    'patients': {
+        'table': Patient.__table__,
+        'validate': validate_patient,
+        'references': {'doctor_id': Doctor},
+        'committed': _patients_added,
+    },
+    'appointments': {
+        'table': Appointment.__table__,
+        'validate': validate_appointment,
+        'references': {'patient_id': Patient, 'doctor_id': Doctor},
+        'check': _reserve_slots,
+        'undo': _release_slots,
+        'committed': _appointments_added,
+    },
+    'patient-symptoms': {
+        'table': patient_symptom,
+        'validate': validate_patient_symptom,
+        'references': {'patient_id': Patient, 'symptom_id': Symptom},
+        'check': _check_pairs,
+        'committed': lambda rows: cooccurrence.record(db.session, [(row['patient_id'], row['symptom_id']) for _, row in rows]),
+    },
+}
+
+
+# Returns the (index, row) pairs that were committed
+def _insert(table, rows, errors, undo):
+    try:
+        db.session.execute(table.insert(), [row for _, row in rows])
+        db.session.commit()
+        return rows
+    except Exception:
+        db.session.rollback()
+
+    # Something in the chunk was rejected by the database; find which rows
+    inserted = []
+    for index, row in rows:
+        try:
+            db.session.execute(table.insert(), [row])
+            db.session.commit()
+            inserted.append((index, row))
+        except Exception as error:
+            db.session.rollback()
+            if undo:
+                undo([(index, row)])
+            errors.append({'index': index, 'error': str(getattr(error, 'orig', error))})
+    return inserted
+
+
+# Validates, resolves foreign keys and inserts one chunk at a time: a single
+# pass over the input, one IN (...) lookup per referenced table per chunk and
+# one executemany per chunk, so cost is linear in the number of rows.
+def import_records(resource, records):
+    spec = RESOURCES[resource]
+    chunk_size = current_app.config.get('BULK_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    errors = []
+    received = inserted = 0
+
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        received += len(chunk)
+
+        rows = []
+        for index, record in chunk:
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                if not isinstance(record, dict):
+                    raise RowError('Expected a JSON object')
+                rows.append((index, spec['validate'](record)))
+            except RowError as error:
+                errors.append({'index': index, 'error': str(error)})
+
+        for field, model in spec['references'].items():
+            found = _existing_ids(model, {row[field] for _, row in rows})
+            missing = [(index, row) for index, row in rows if row[field] not in found]
+            for index, row in missing:
+                errors.append({'index': index, 'error': f'{field} {row[field]} does not exist'})
+            if missing:
+                rows = [(index, row) for index, row in rows if row[field] in found]
+
+        if 'check' in spec:
+            rows = spec['check'](rows, errors)
+        if rows:
+            committed = _insert(spec['table'], rows, errors, spec.get('undo'))
+            inserted += len(committed)
+            if 'committed' in spec:
+                spec['committed'](committed)
+
+    errors.sort(key=lambda error: error['index'])
+    return {'received': received, 'inserted': inserted, 'failed': len(errors), 'errors': errors}
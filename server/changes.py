@@ -0,0 +1,179 @@
+# changes.py
+import json
+import threading
+import time as clock
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+import archive
+
+DEFAULTS = {
+    'CHANGE_LOG_RETENTION_HOURS': 24,
+    'CHANGE_LOG_POLL_TIMEOUT': 25,
+    'CHANGE_LOG_MAX_POLL_TIMEOUT': 60,
+    # Seconds between SSE keep-alive comments on an idle stream
+    'CHANGE_LOG_HEARTBEAT': 15,
+}
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+COMPACT_BATCH_SIZE = 5000
+# Commits from other processes are not signalled here; waiters re-check the
+# log at least this often so they still see them promptly.
+RECHECK_SECONDS = 1.0
+
+# Columns captured for each logged table, as (json key, SQL expression on the
+# row alias). Timestamps match the isoformat the REST API returns.
+ENTITIES = {
+    'appointment': (
+        ('id', '{r}.id'), ('patient_id', '{r}.patient_id'), ('doctor_id', '{r}.doctor_id'),
+        ('start', "strftime('%Y-%m-%dT%H:%M:%S', {r}.start)"), ('duration_minutes', '{r}.duration_minutes'),
+        ('date', '{r}.date'), ('time', '{r}.time'), ('reason', '{r}.reason'),
+    ),
+    'patient': (
+        ('id', '{r}.id'), ('name', '{r}.name'), ('age', '{r}.age'), ('doctor_id', '{r}.doctor_id'),
+    ),
+    'doctor': (
+        ('id', '{r}.id'), ('name', '{r}.name'), ('specialty', '{r}.specialty'), ('phone', '{r}.phone'),
+        ('email', '{r}.email'), ('imageUrl', '{r}.image_url'),
+    ),
+}
+
+
+# Extra WHEN conditions: archiving an appointment is not a delete to clients
+GUARDS = {
+    ('appointment', 'delete'): f'NOT {archive.ARCHIVED}',
+}
+
+
+def _trigger(entity, op):
+    event, row = {'insert': ('INSERT', 'new'), 'update': ('UPDATE', 'new'), 'delete': ('DELETE', 'old')}[op]
+    guard = f' WHEN {GUARDS[entity, op]}' if (entity, op) in GUARDS else ''
+    if op == 'delete':
+        data = 'NULL'
+    else:
+        data = 'json_object(%s)' % ', '.join(f"'{key}', {expression.format(r=row)}" for key, expression in ENTITIES[entity])
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS change_log_{entity}_{op} AFTER {event} ON {entity}{guard} BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('{entity}', {row}.id, '{op}', {data});
+        END"""
+
+
+TRIGGERS = {f'change_log_{entity}_{op}': _trigger(entity, op)
+            for entity in ENTITIES for op in ('insert', 'update', 'delete')}
+
+_config = dict(DEFAULTS)
+_condition = threading.Condition()
+_generation = 0
+
+
+def init_app(app, db):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+        _config[key] = app.config[key]
+    # Wake waiting pollers whenever this process commits anything
+    with app.app_context():
+        for engine in db.engines.values():
+            sa.event.listen(engine, 'commit', _notify)
+
+
+def _notify(connection):
+    global _generation
+    with _condition:
+        _generation += 1
+        _condition.notify_all()
+
+
+def create_triggers(connection):
+    for ddl in TRIGGERS.values():
+        connection.exec_driver_sql(ddl)
+
+
+def drop_triggers(connection):
+    for name in TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def install(metadata):
+    @sa.event.listens_for(metadata, 'after_create')
+    def _create_change_triggers(target, connection, **kwargs):
+        if connection.dialect.name == 'sqlite':
+            create_triggers(connection)
+
+
+def bounds(session):
+    oldest, newest = session.execute(sa.text('SELECT min(seq), max(seq) FROM change_log')).one()
+    if newest is None:
+        newest = session.execute(sa.text("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")).scalar() or 0
+    return oldest, newest
+
+
+def fetch(session, since, limit=DEFAULT_LIMIT):
+    rows = session.execute(sa.text(
+        'SELECT seq, entity, entity_id, op, data, changed_at FROM change_log WHERE seq > :since ORDER BY seq LIMIT :limit'
+    ), {'since': since, 'limit': limit})
+    return [{
+        'seq': row.seq,
+        'entity': row.entity,
+        'id': row.entity_id,
+        'op': row.op,
+        'data': json.loads(row.data) if row.data else None,
+        'changed_at': row.changed_at.replace(' ', 'T') if isinstance(row.changed_at, str) else row.changed_at,
+    } for row in rows]
+
+
+# True when entries after since have already been compacted away, so the
+# caller has to resynchronise from the REST endpoints.
+def expired(session, since):
+    oldest, newest = bounds(session)
+    first_kept = oldest if oldest is not None else newest + 1
+    return since < first_kept - 1
+
+
+# Block until there are changes after since or timeout seconds pass. The
+# session is closed between checks so an idle waiter holds no connection.
+def wait(session, since, timeout, limit=DEFAULT_LIMIT):
+    deadline = clock.monotonic() + timeout
+    while True:
+        with _condition:
+            generation = _generation
+        changes = fetch(session, since, limit)
+        session.close()
+        remaining = deadline - clock.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        with _condition:
+            if _generation == generation:
+                _condition.wait(min(remaining, RECHECK_SECONDS))
+
+
+def stream(session, since):
+    last_sent = clock.monotonic()
+    while True:
+        changes = wait(session, since, _config['CHANGE_LOG_HEARTBEAT'], MAX_LIMIT)
+        for change in changes:
+            since = change['seq']
+            yield f"id: {since}\nevent: change\ndata: {json.dumps(change)}\n\n"
+        if changes:
+            last_sent = clock.monotonic()
+        elif clock.monotonic() - last_sent >= _config['CHANGE_LOG_HEARTBEAT']:
+            last_sent = clock.monotonic()
+            yield ': keep-alive\n\n'
+
+
+# Delete entries older than the retention window, in short transactions so
+# writers are not held up behind one long delete.
+def compact(connection, retention_hours=None):
+    hours = _config['CHANGE_LOG_RETENTION_HOURS'] if retention_hours is None else retention_hours
+    cutoff = (datetime.utcnow() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+    deleted = 0
+    while True:
+        with connection.begin():
+            result = connection.execute(sa.text(
+                'DELETE FROM change_log WHERE seq IN '
+                '(SELECT seq FROM change_log WHERE changed_at < :cutoff ORDER BY seq LIMIT :batch)'
+            ), {'cutoff': cutoff, 'batch': COMPACT_BATCH_SIZE})
+        deleted += result.rowcount
+        if result.rowcount < COMPACT_BATCH_SIZE:
+            return deleted
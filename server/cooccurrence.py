@@ -0,0 +1,415 @@
+# cooccurrence.py
+import fcntl
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+
+try:
+    import numpy as np
+except ImportError:  # optional; the related/similar endpoints answer 503 without it
+    np = None
+
+DEFAULTS = {
+    # Where the memory-mapped matrices live; defaults to <instance>/symptom_matrix
+    'SYMPTOM_MATRIX_DIR': None,
+}
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+FETCH_BATCH = 100000
+# Patients per block when counting symptom pairs; the temporaries grow with
+# block * symptoms_per_patient ** 2.
+PAIR_BLOCK = 50000
+
+# A snapshot is a directory of .npy files that every worker maps read-only,
+# so they share one copy through the page cache:
+#
+#   patient_indptr, patient_symptoms  CSR patient -> symptom ids (sorted)
+#   symptom_indptr, symptom_patients  the same pairs as symptom -> patient ids
+#   patient_sizes                     symptoms per patient (np.diff of the CSR)
+#   pair_indptr, pair_symptoms,       CSR symptom -> the other symptoms seen on
+#   pair_counts                       the same patient, with how many patients;
+#                                     only pairs that occur are stored, so the
+#                                     size follows the data, not the largest id
+#   delta.bin                         int32 (patient, symptom) pairs added
+#                                     since the build, appended by record()
+#
+# A symptom's own patient count is its length in symptom_indptr. Pairs in
+# delta.bin are folded into the counts when they are read, from the few
+# patients they touch. CURRENT names the live snapshot, so a rebuild swaps
+# in atomically. Writers serialise on an flock() of the lock file; readers
+# take no lock.
+
+ARRAYS = ('patient_indptr', 'patient_symptoms', 'patient_sizes', 'symptom_indptr', 'symptom_patients',
+          'pair_indptr', 'pair_symptoms', 'pair_counts')
+
+_config = dict(DEFAULTS)
+_lock = threading.Lock()
+_snapshot = None
+_building = None
+
+
+class Unavailable(Exception):
+    pass
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    if app.config['SYMPTOM_MATRIX_DIR'] is None:
+        app.config['SYMPTOM_MATRIX_DIR'] = os.path.join(app.instance_path, 'symptom_matrix')
+    _config.update((key, app.config[key]) for key in DEFAULTS)
+
+
+def available():
+    return np is not None
+
+
+@contextmanager
+def _exclusive():
+    directory = _config['SYMPTOM_MATRIX_DIR']
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'lock'), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield directory
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _pairs(connection):
+    result = connection.execute(sa.text(
+        'SELECT patient_id, symptom_id FROM patient_symptom ORDER BY patient_id, symptom_id'))
+    chunks = []
+    while True:
+        rows = result.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.int32).reshape(-1, 2))
+    pairs = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int32)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _indptr(ids, length):
+    indptr = np.zeros(length + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ids, minlength=length), out=indptr[1:])
+    return indptr
+
+
+# The off-diagonal of X^T X for the 0/1 patient x symptom matrix, without
+# materialising X or the product: every symptom of a patient is paired with
+# every other symptom of the same patient, the pairs of each block of
+# patients are counted, and the block counts are merged into one CSR.
+def _cooccurrence(indptr, symptoms, size):
+    keys, counts = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    patients = len(indptr) - 1
+    for first in range(0, patients, PAIR_BLOCK):
+        last = min(first + PAIR_BLOCK, patients)
+        lo, hi = indptr[first], indptr[last]
+        if lo == hi:
+            continue
+        block = symptoms[lo:hi].astype(np.int64)
+        lengths = np.diff(indptr[first:last + 1])
+        per_entry = np.repeat(lengths, lengths)
+        run_start = np.repeat(indptr[first:last] - lo, lengths)
+        left = np.repeat(block, per_entry)
+        offsets = np.arange(per_entry.sum()) - np.repeat(np.cumsum(per_entry) - per_entry, per_entry)
+        right = block[np.repeat(run_start, per_entry) + offsets]
+        pairs = (left * size + right)[left != right]
+        block_keys, block_counts = np.unique(pairs, return_counts=True)
+        keys.append(block_keys)
+        counts.append(block_counts)
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(counts), minlength=len(keys)).astype(np.int32)
+    return _indptr(keys // size, size), (keys % size).astype(np.int32), counts
+
+
+# Build a fresh snapshot from patient_symptom and make it current. Run after
+# bulk loads, or to fold in deletes, which record() does not track.
+def rebuild(connection):
+    if np is None:
+        raise Unavailable('NumPy is not installed')
+    with _exclusive() as directory:
+        patients, symptoms = _pairs(connection)
+        max_patient = connection.execute(sa.text('SELECT max(id) FROM patient')).scalar() or 0
+        max_symptom = connection.execute(sa.text('SELECT max(id) FROM symptom')).scalar() or 0
+        size = max(max_symptom, int(symptoms.max()) if len(symptoms) else 0) + 1
+
+        patient_indptr = _indptr(patients, max(max_patient, int(patients.max()) if len(patients) else 0) + 1)
+        order = np.argsort(symptoms, kind='stable')
+        pair_indptr, pair_symptoms, pair_counts = _cooccurrence(patient_indptr, symptoms, size)
+        arrays = {
+            'patient_indptr': patient_indptr,
+            'patient_symptoms': symptoms,
+            'patient_sizes': np.diff(patient_indptr).astype(np.int32),
+            'symptom_indptr': _indptr(symptoms, size),
+            'symptom_patients': patients[order],
+            'pair_indptr': pair_indptr,
+            'pair_symptoms': pair_symptoms,
+            'pair_counts': pair_counts,
+        }
+
+        name = str(time.time_ns())
+        os.makedirs(os.path.join(directory, name))
+        for key, array in arrays.items():
+            np.save(os.path.join(directory, name, f'{key}.npy'), array)
+        previous = _current_name(directory)
+        with open(os.path.join(directory, 'CURRENT.tmp'), 'w') as handle:
+            handle.write(name)
+        os.replace(os.path.join(directory, 'CURRENT.tmp'), os.path.join(directory, 'CURRENT'))
+        # Keep the snapshot just replaced for workers still switching over
+        for entry in os.listdir(directory):
+            if entry not in (name, previous) and entry.isdigit():
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return {'patients': len(patient_indptr) - 1, 'symptoms': size, 'pairs': len(patients),
+            'cooccurring': len(pair_symptoms)}
+
+
+def _current_name(directory):
+    try:
+        with open(os.path.join(directory, 'CURRENT')) as handle:
+            return handle.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class _Snapshot:
+    def __init__(self, path, name):
+        self.name = name
+        self.path = path
+        for key in ARRAYS:
+            setattr(self, key, np.load(os.path.join(path, f'{key}.npy'), mmap_mode='r'))
+        self.delta_read = 0
+        self.delta_patients = np.empty(0, dtype=np.int32)
+        self.delta_symptoms = np.empty(0, dtype=np.int32)
+        self.delta_ids = np.empty(0, dtype=np.int32)
+        self.delta_counts = np.empty(0, dtype=np.int64)
+
+    # Pick up pairs appended to delta.bin since the last call
+    def refresh(self):
+        path = os.path.join(self.path, 'delta.bin')
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        size -= size % 8
+        if size <= self.delta_read:
+            return
+        tail = np.fromfile(path, dtype=np.int32, count=(size - self.delta_read) // 4, offset=self.delta_read).reshape(-1, 2)
+        self.delta_read = size
+        self.delta_patients = np.concatenate([self.delta_patients, tail[:, 0]])
+        self.delta_symptoms = np.concatenate([self.delta_symptoms, tail[:, 1]])
+        self.delta_ids, self.delta_counts = np.unique(self.delta_patients, return_counts=True)
+
+    @property
+    def patients(self):
+        return len(self.patient_indptr) - 1
+
+    # As of the build, without delta.bin
+    def built_symptoms_of(self, patient_id):
+        if patient_id >= self.patients:
+            return self.patient_symptoms[:0]
+        return self.patient_symptoms[self.patient_indptr[patient_id]:self.patient_indptr[patient_id + 1]]
+
+    def symptoms_of(self, patient_id):
+        return np.union1d(self.built_symptoms_of(patient_id), self.delta_symptoms[self.delta_patients == patient_id])
+
+    # Patients per symptom id, for ids up to at least length - 1
+    def totals(self, length):
+        built = np.diff(self.symptom_indptr)
+        length = max(length, len(built), int(self.delta_symptoms.max()) + 1 if len(self.delta_symptoms) else 0)
+        totals = np.zeros(length, dtype=np.int64)
+        totals[:len(built)] = built
+        totals += np.bincount(self.delta_symptoms, minlength=length)
+        return totals
+
+    # How many patients have both symptom_id and each other symptom, by id
+    def together(self, symptom_id, length):
+        together = np.zeros(length, dtype=np.int64)
+        if symptom_id < len(self.pair_indptr) - 1:
+            lo, hi = self.pair_indptr[symptom_id], self.pair_indptr[symptom_id + 1]
+            together[self.pair_symptoms[lo:hi]] = self.pair_counts[lo:hi]
+        # Patients with diagnoses since the build that involve symptom_id:
+        # swap their pairs as built for their pairs now
+        touched = self.delta_ids[np.isin(self.delta_ids, self.postings(symptom_id))]
+        touched = np.union1d(touched, self.delta_patients[self.delta_symptoms == symptom_id])
+        for patient_id in touched:
+            built = self.built_symptoms_of(patient_id)
+            if np.isin(symptom_id, built):
+                together[built] -= 1
+            together[self.symptoms_of(patient_id)] += 1
+        together[symptom_id] = 0
+        return together
+
+    def postings(self, symptom_id):
+        indptr = self.symptom_indptr
+        if symptom_id >= len(indptr) - 1:
+            return self.symptom_patients[:0]
+        return self.symptom_patients[indptr[symptom_id]:indptr[symptom_id + 1]]
+
+    def patients_with(self, symptoms):
+        parts = [self.postings(s) for s in symptoms]
+        parts.append(self.delta_patients[np.isin(self.delta_symptoms, symptoms)])
+        return np.concatenate(parts)
+
+    def sizes(self, patients):
+        sizes = np.zeros(len(patients), dtype=np.int64)
+        known = patients < self.patients
+        sizes[known] = self.patient_sizes[patients[known]]
+        if len(self.delta_ids):
+            at = np.minimum(np.searchsorted(self.delta_ids, patients), len(self.delta_ids) - 1)
+            hit = self.delta_ids[at] == patients
+            sizes[hit] += self.delta_counts[at[hit]]
+        return sizes
+
+
+# None without a snapshot, or with one in an older layout, which is built
+# again like a missing one
+def _load():
+    global _snapshot
+    directory = _config['SYMPTOM_MATRIX_DIR']
+    name = _current_name(directory)
+    if name is None:
+        return None
+    with _lock:
+        if _snapshot is None or _snapshot.name != name:
+            try:
+                _snapshot = _Snapshot(os.path.join(directory, name), name)
+            except FileNotFoundError:
+                return None
+        _snapshot.refresh()
+        return _snapshot
+
+
+def _build(engine):
+    global _building
+    try:
+        with engine.connect() as connection:
+            rebuild(connection)
+    finally:
+        with _lock:
+            _building = None
+
+
+# The current snapshot. Without one, the first build is started in the
+# background and the request answered 503 rather than held while it runs.
+def _snapshot_for(session):
+    global _building
+    if np is None:
+        raise Unavailable('NumPy is not installed')
+    snapshot = _load()
+    if snapshot is None:
+        with _lock:
+            if _building is None:
+                _building = threading.Thread(target=_build, args=(session.get_bind(),), daemon=True)
+                _building.start()
+        raise Unavailable('The symptom index is being built; retry shortly')
+    return snapshot
+
+
+# Fold newly committed diagnoses of the patients in pairs into the current
+# snapshot by appending them to delta.bin.
+#
+# Each patient's committed symptoms are compared, under the lock, with the
+# ones the snapshot already has (the build plus delta.bin), and only the
+# difference is appended. Concurrent adds for one patient may each see the
+# other's row; whichever records first appends both and the second finds
+# nothing left, so no pair is counted twice.
+def record(session, pairs):
+    if np is None or not pairs:
+        return
+    with _exclusive():
+        snapshot = _load()
+        if snapshot is None:
+            return  # the first build will read these rows
+        patients = sorted({patient_id for patient_id, _ in pairs})
+        rows = session.execute(sa.text(
+            'SELECT patient_id, symptom_id FROM patient_symptom WHERE patient_id IN :patients'
+        ).bindparams(sa.bindparam('patients', expanding=True)), {'patients': patients})
+        committed = defaultdict(set)
+        for patient_id, symptom_id in rows:
+            committed[patient_id].add(symptom_id)
+
+        added = []
+        for patient_id in patients:
+            counted = {int(s) for s in snapshot.symptoms_of(patient_id)}
+            added.extend((patient_id, s) for s in sorted(committed[patient_id] - counted))
+        if not added:
+            return
+        with open(os.path.join(snapshot.path, 'delta.bin'), 'ab') as handle:
+            handle.write(np.array(added, dtype=np.int32).tobytes())
+
+
+def _top(scores, limit):
+    limit = min(limit, len(scores))
+    if limit == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def _names(session, table, ids):
+    rows = session.execute(sa.text(f'SELECT id, name FROM {table} WHERE id IN :ids').bindparams(
+        sa.bindparam('ids', expanding=True)), {'ids': [int(i) for i in ids]})
+    return dict(rows.all())
+
+
+# Symptoms most often seen alongside symptom_id, by Jaccard similarity of
+# their patient sets: one row of the pair counts and the symptom totals.
+def related(session, symptom_id, limit=DEFAULT_LIMIT):
+    snapshot = _snapshot_for(session)
+    totals = snapshot.totals(symptom_id + 1).astype(np.float64)
+    together = snapshot.together(symptom_id, len(totals)).astype(np.float64)
+    if not totals[symptom_id]:
+        return []
+    union = totals[symptom_id] + totals - together
+    scores = np.divide(together, union, out=np.zeros_like(together), where=union > 0)
+    scores[symptom_id] = 0
+    top = [int(i) for i in _top(scores, limit) if scores[i] > 0]
+    names = _names(session, 'symptom', top) if top else {}
+    return [{'id': int(i), 'name': names[i], 'patients': int(together[i]), 'score': round(float(scores[i]), 4)}
+            for i in top if i in names]
+
+
+# Patients sharing the most symptoms with patient_id, by Jaccard similarity
+# of symptom sets. Only patients holding at least one of the same symptoms
+# are scored: their ids come from the symptom -> patient postings and are
+# counted with one bincount.
+def similar(session, patient_id, limit=DEFAULT_LIMIT):
+    snapshot = _snapshot_for(session)
+    mine = snapshot.symptoms_of(patient_id)
+    if not len(mine):
+        return []
+    # A few spare in case some have been deleted since the build
+    wanted = limit + 10
+    shared = np.bincount(snapshot.patients_with(mine))
+    shared[patient_id:patient_id + 1] = 0
+
+    # A patient sharing n symptoms scores at most n / len(mine), so start with
+    # the patients sharing the most and only widen to fewer shared symptoms
+    # while they could still beat the current top results.
+    at_least = np.cumsum(np.bincount(shared)[::-1])[::-1]
+    floor = max([n for n in range(1, len(at_least)) if at_least[n] >= wanted] or [1])
+    while True:
+        ids = np.flatnonzero(shared >= floor)
+        overlap = shared[ids]
+        scores = overlap / (len(mine) + snapshot.sizes(ids) - overlap)
+        order = _top(scores, wanted)
+        if floor == 1 or (len(order) == wanted and scores[order[-1]] >= (floor - 1) / len(mine)):
+            break
+        floor -= 1
+    names = _names(session, 'patient', ids[order]) if len(order) else {}
+    results = []
+    for index in order:
+        candidate = int(ids[index])
+        if candidate in names:
+            results.append({'id': candidate, 'name': names[candidate], 'shared': int(overlap[index]),
+                            'score': round(float(scores[index]), 4)})
+        if len(results) == limit:
+            break
+    return results
@@ -0,0 +1,127 @@
+# deletes.py
+import sqlalchemy as sa
+
+from models import db, Doctor, Patient, Symptom, Appointment, patient_symptom
+import versioning
+
+# Set-based deletes: each dependent table is cleared with one DELETE or
+# UPDATE ... WHERE <foreign key>, so the cost follows the rows affected and
+# nothing is loaded into the session. The schema's ON DELETE CASCADE rules
+# (enforced, see sqlite_engine.py) say the same thing; doing it here keeps
+# each table's triggers and the freed slots in view.
+# Appointment deletes return the (doctor_id, start, duration_minutes) slots
+# they freed, for availability.release() once the caller has committed.
+
+
+class HasDependents(Exception):
+    pass
+
+
+class Conflict(Exception):
+    pass
+
+
+def _execute(statement):
+    return db.session.execute(statement, execution_options={'synchronize_session': False})
+
+
+def _slots(statement):
+    rows = _execute(statement.returning(Appointment.doctor_id, Appointment.start, Appointment.duration_minutes))
+    return [tuple(row) for row in rows]
+
+
+# The row's current version and any other columns asked for, or None if it
+# does not exist. Raises PreconditionFailed when expected (from If-Match)
+# names another version.
+def _current(model, id, expected, *columns):
+    row = db.session.execute(sa.select(model.version, *columns).where(model.id == id)).first()
+    if row is not None and expected is not None and row.version != expected:
+        raise versioning.PreconditionFailed()
+    return row
+
+
+# The row itself goes last, still guarded by the version in case it changed
+# since _current() looked. False if it has gone in the meantime.
+def _delete_row(model, id, expected):
+    statement = sa.delete(model).where(model.id == id)
+    if expected is not None:
+        statement = statement.where(model.version == expected)
+    if _execute(statement).rowcount == 0:
+        if expected is not None:
+            raise versioning.PreconditionFailed()
+        return False
+    return True
+
+
+def delete_symptom(id, expected=None):
+    if _current(Symptom, id, expected) is None:
+        return False
+    _execute(sa.delete(patient_symptom).where(patient_symptom.c.symptom_id == id))
+    return _delete_row(Symptom, id, expected)
+
+
+# patients is a list of ids or a SELECT of them
+def _delete_patients(patients):
+    slots = _slots(sa.delete(Appointment).where(Appointment.patient_id.in_(patients)))
+    _execute(sa.delete(patient_symptom).where(patient_symptom.c.patient_id.in_(patients)))
+    return slots
+
+
+# Returns the patient's doctor_id with the freed slots, for doctor_load
+def delete_patient(id, expected=None):
+    row = _current(Patient, id, expected, Patient.doctor_id)
+    if row is None:
+        return None
+    slots = _delete_patients([id])
+    if not _delete_row(Patient, id, expected):
+        return None
+    return row.doctor_id, slots
+
+
+# True if any of the doctor's appointments would overlap one of target's
+def _overlaps(doctor_id, target_id):
+    return db.session.execute(sa.text("""
+        SELECT 1 FROM appointment a JOIN appointment b ON b.doctor_id = :target
+         AND b.start < datetime(a.start, '+' || a.duration_minutes || ' minutes')
+         AND a.start < datetime(b.start, '+' || b.duration_minutes || ' minutes')
+        WHERE a.doctor_id = :doctor LIMIT 1
+    """), {'doctor': doctor_id, 'target': target_id}).first() is not None
+
+
+# Without reassign_to or cascade, a doctor who still has patients or
+# appointments is refused with HasDependents. reassign_to moves them all to
+# another doctor (Conflict if that would double-book them); cascade deletes
+# the doctor's patients along with every appointment either side has.
+def delete_doctor(id, expected=None, reassign_to=None, cascade=False):
+    if _current(Doctor, id, expected) is None:
+        return None
+    slots = []
+    if reassign_to is not None:
+        if reassign_to == id or db.session.get(Doctor, reassign_to) is None:
+            raise Conflict(f'Doctor {reassign_to} cannot take over these patients')
+        if _overlaps(id, reassign_to):
+            raise Conflict(f'Doctor {reassign_to} is already booked at some of these appointment times')
+        for model in (Patient, Appointment):
+            _execute(sa.update(model).where(model.doctor_id == id)
+                     .values({model.doctor_id: reassign_to, model.version: model.version + 1}))
+    elif cascade:
+        patients = sa.select(Patient.id).where(Patient.doctor_id == id).scalar_subquery()
+        slots = _slots(sa.delete(Appointment).where(Appointment.doctor_id == id))
+        slots += _delete_patients(patients)
+        _execute(sa.delete(Patient).where(Patient.doctor_id == id))
+    else:
+        for model in (Patient, Appointment):
+            if db.session.execute(sa.select(model.id).where(model.doctor_id == id).limit(1)).first():
+                raise HasDependents()
+    if not _delete_row(Doctor, id, expected):
+        return None
+    return slots
+
+
+def delete_appointments(before, doctor_id=None, patient_id=None):
+    statement = sa.delete(Appointment).where(Appointment.start < before)
+    if doctor_id is not None:
+        statement = statement.where(Appointment.doctor_id == doctor_id)
+    if patient_id is not None:
+        statement = statement.where(Appointment.patient_id == patient_id)
+    return _slots(statement)
@@ -0,0 +1,184 @@
+# doctor_load.py
+import heapq
+import threading
+import time as clock
+
+import sqlalchemy as sa
+
+# Per worker process, like the availability cache. The counts are read once
+# and from then on every write in this process adjusts them in place, so
+# neither a pick nor a write scans the patient or appointment table again.
+# Assignments made by other workers are not seen until invalidate() forces a
+# reload or the process restarts, so the balance across workers is
+# approximate; which doctors exist is kept exact by the doctor_* hooks.
+
+# A doctor's load is (patients, live appointments): fewest patients first,
+# then the lighter appointment book. Each specialty keeps a min-heap of
+# [patients, appointments, doctor_id] entries. A change pushes a fresh entry
+# and leaves the old one to be skipped when it reaches the top, so updates
+# and picks are O(log n) and nothing is ever searched for in a heap.
+_loads = {}
+_specialties = {}
+_members = {}
+_heaps = {}
+_loaded_at = None
+_lock = threading.Lock()
+
+
+def invalidate():
+    global _loaded_at
+    with _lock:
+        _loaded_at = None
+
+
+# One grouped pass over the patient.doctor_id and appointment (doctor_id,
+# start) indexes; run on first use and after invalidate().
+def _reload(session):
+    global _loaded_at
+    rows = session.execute(sa.text("""
+        SELECT d.id, d.specialty,
+               (SELECT count(*) FROM patient p WHERE p.doctor_id = d.id),
+               (SELECT count(*) FROM appointment a WHERE a.doctor_id = d.id)
+        FROM doctor d
+    """)).all()
+    _loads.clear()
+    _specialties.clear()
+    _members.clear()
+    for doctor_id, specialty, patients, appointments in rows:
+        _loads[doctor_id] = [patients, appointments]
+        _specialties[doctor_id] = specialty
+        _members.setdefault(specialty, []).append(doctor_id)
+    _heaps.clear()
+    for specialty in _members:
+        _heapify(specialty)
+    _loaded_at = clock.monotonic()
+
+
+def _fresh(session):
+    if _loaded_at is None:
+        _reload(session)
+
+
+def _heapify(specialty):
+    heap = [[*_loads[doctor_id], doctor_id] for doctor_id in _members[specialty]]
+    heapq.heapify(heap)
+    _heaps[specialty] = heap
+
+
+def _push(doctor_id):
+    specialty = _specialties[doctor_id]
+    heap = _heaps[specialty]
+    heapq.heappush(heap, [*_loads[doctor_id], doctor_id])
+    # Once stale entries outnumber live ones, start again from the counts
+    if len(heap) > 2 * len(_members[specialty]) + 16:
+        _heapify(specialty)
+
+
+def _adjust(doctor_id, patients=0, appointments=0):
+    load = _loads.get(doctor_id)
+    if load is None:
+        return
+    load[0] += patients
+    load[1] += appointments
+    _push(doctor_id)
+
+
+# Reserve a patient slot with the least-loaded doctor of specialty and
+# return their id, or None if the specialty has no doctors. The caller
+# undoes it with patient_removed() if the patient is not created after all.
+def assign(session, specialty):
+    with _lock:
+        _fresh(session)
+        heap = _heaps.get(specialty)
+        while heap:
+            patients, appointments, doctor_id = heap[0]
+            if _loads[doctor_id] == [patients, appointments]:
+                _adjust(doctor_id, patients=1)
+                return doctor_id
+            heapq.heappop(heap)
+        return None
+
+
+# Until the counts are loaded there is nothing to adjust; the load reads them
+def doctor_added(doctor_id, specialty):
+    with _lock:
+        if _loaded_at is None or doctor_id in _loads:
+            return
+        _loads[doctor_id] = [0, 0]
+        _specialties[doctor_id] = specialty
+        _members.setdefault(specialty, []).append(doctor_id)
+        _heaps.setdefault(specialty, [])
+        _push(doctor_id)
+
+
+# A doctor who changes specialty takes their load to the new heap; the old
+# one is rebuilt without them.
+def doctor_updated(doctor_id, specialty):
+    with _lock:
+        old = _specialties.get(doctor_id)
+        if old is None or old == specialty:
+            return
+        _members[old].remove(doctor_id)
+        _heapify(old)
+        _specialties[doctor_id] = specialty
+        _members.setdefault(specialty, []).append(doctor_id)
+        _heaps.setdefault(specialty, [])
+        _push(doctor_id)
+
+
+# reassign_to takes over everything the doctor had; otherwise it went with them
+def doctor_removed(doctor_id, reassign_to=None):
+    with _lock:
+        load = _loads.pop(doctor_id, None)
+        if load is None:
+            return
+        specialty = _specialties.pop(doctor_id)
+        _members[specialty].remove(doctor_id)
+        _heapify(specialty)
+        if reassign_to is not None:
+            _adjust(reassign_to, *load)
+
+
+def patient_added(doctor_id):
+    with _lock:
+        _adjust(doctor_id, patients=1)
+
+
+def patient_removed(doctor_id):
+    with _lock:
+        _adjust(doctor_id, patients=-1)
+
+
+def patient_moved(old_doctor_id, doctor_id):
+    if old_doctor_id == doctor_id:
+        return
+    with _lock:
+        _adjust(old_doctor_id, patients=-1)
+        _adjust(doctor_id, patients=1)
+
+
+def appointment_added(doctor_id):
+    with _lock:
+        _adjust(doctor_id, appointments=1)
+
+
+def appointment_removed(doctor_id):
+    with _lock:
+        _adjust(doctor_id, appointments=-1)
+
+
+def appointment_moved(old_doctor_id, doctor_id):
+    if old_doctor_id == doctor_id:
+        return
+    with _lock:
+        _adjust(old_doctor_id, appointments=-1)
+        _adjust(doctor_id, appointments=1)
+
+
+def snapshot(session, specialty=None):
+    with _lock:
+        _fresh(session)
+        return sorted(
+            ({'doctor_id': doctor_id, 'specialty': _specialties[doctor_id], 'patients': load[0], 'appointments': load[1]}
+             for doctor_id, load in _loads.items() if specialty is None or _specialties[doctor_id] == specialty),
+            key=lambda row: (row['patients'], row['appointments'], row['doctor_id']))
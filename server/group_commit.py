@@ -0,0 +1,164 @@
+# group_commit.py
+import queue
+import threading
+import time as clock
+from concurrent.futures import Future
+
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+DEFAULTS = {
+    'GROUP_COMMIT_ENABLED': False,
+    'GROUP_COMMIT_WINDOW_MS': 2,
+    'GROUP_COMMIT_MAX_BATCH': 64,
+}
+
+_committer = None
+_db = None
+
+
+# Collects INSERT statements from many request threads and commits them
+# together: one transaction (and one fsync) per batch instead of per row.
+# A batch is flushed once it holds max_batch statements or window_ms after
+# its first one arrived. If the batch transaction fails it is replayed one
+# statement per transaction, so each caller still gets its own outcome.
+class GroupCommitter:
+    def __init__(self, engine, window_ms=2, max_batch=64):
+        self.engine = engine
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.statements = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, statement, returning=False):
+        future = Future()
+        self._queue.put((statement, returning, future))
+        return future
+
+    # The statement's rowcount
+    def execute(self, statement):
+        return self.submit(statement).result()
+
+    # The first row a RETURNING statement gave back, or None; for add()
+    def _returning(self, statement):
+        return self.submit(statement, returning=True).result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = clock.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    # Take whatever queued up during the last flush, then wait
+                    # out the rest of the window for stragglers
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - clock.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    @staticmethod
+    def _execute(connection, statement, returning):
+        result = connection.execute(statement)
+        if returning:
+            row = result.first()
+            return None if row is None else tuple(row)
+        return result.rowcount
+
+    def _flush(self, batch):
+        self.batches += 1
+        self.statements += len(batch)
+        try:
+            with self.engine.begin() as connection:
+                results = [self._execute(connection, statement, returning) for statement, returning, _ in batch]
+        except Exception:
+            for statement, returning, future in batch:
+                try:
+                    with self.engine.begin() as connection:
+                        future.set_result(self._execute(connection, statement, returning))
+                except Exception as error:
+                    future.set_exception(error)
+            return
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+def init_app(app, db):
+    global _committer, _db
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    _db = db
+    if app.config['GROUP_COMMIT_ENABLED']:
+        with app.app_context():
+            engine = db.engines.get('writer', db.engine)
+        _committer = GroupCommitter(engine, app.config['GROUP_COMMIT_WINDOW_MS'], app.config['GROUP_COMMIT_MAX_BATCH'])
+
+
+def enabled():
+    return _committer is not None
+
+
+# Run a Core statement in its own commit, or as part of the next group
+# commit. Returns its rowcount either way.
+def execute(statement):
+    if _committer is None:
+        result = _db.session.execute(statement)
+        _db.session.commit()
+        return result.rowcount
+    return _committer.execute(statement)
+
+
+# Insert a new ORM object and commit it. With group commit on, the row goes
+# through the shared batch and the object is attached afterwards with its
+# new primary key, without reloading it. unless is a SQL condition checked
+# by the INSERT itself (INSERT ... SELECT ... WHERE NOT unless): if it holds,
+# nothing is inserted and None is returned.
+def add(obj, unless=None):
+    if _committer is None and unless is None:
+        _db.session.add(obj)
+        _db.session.commit()
+        return obj
+
+    mapper = inspect(obj).mapper
+    table = mapper.local_table
+    values = {}
+    for column in table.columns:
+        value = getattr(obj, mapper.get_property_by_column(column).key)
+        if value is not None:
+            values[column.key] = value
+    statement = table.insert()
+    if unless is None:
+        statement = statement.values(**values)
+    else:
+        row = sa.select(*(sa.literal(value, table.c[key].type) for key, value in values.items())).where(~unless)
+        statement = statement.from_select(list(values), row)
+    statement = statement.returning(*table.primary_key.columns)
+    if _committer is None:
+        primary_key = _db.session.execute(statement).first()
+        _db.session.commit()
+    else:
+        primary_key = _committer._returning(statement)
+    if primary_key is None:
+        return None
+    for column, value in zip(table.primary_key.columns, primary_key):
+        setattr(obj, mapper.get_property_by_column(column).key, value)
+    make_transient_to_detached(obj)
+    _db.session.add(obj)
+    return obj
+
+
+def stats():
+    if _committer is None:
+        return {'enabled': False}
+    return {'enabled': True, 'batches': _committer.batches, 'statements': _committer.statements}
@@ -0,0 +1,258 @@
+# idempotency.py
+import hashlib
+import json
+import threading
+import time as clock
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app, g, jsonify, request
+from flask_login import current_user
+
+import sqlite_engine
+
+DEFAULTS = {
+    # How long a key and its response are kept for retries
+    'IDEMPOTENCY_TTL_SECONDS': 24 * 60 * 60,
+    'IDEMPOTENCY_CACHE_SIZE': 1024,
+    # How long a duplicate waits for the request holding its key
+    'IDEMPOTENCY_WAIT_SECONDS': 30,
+    # A claim older than this belongs to a request that died; it may be taken over
+    'IDEMPOTENCY_CLAIM_SECONDS': 300,
+}
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Bodies larger than this are replayed from the table only
+MAX_CACHED_BODY = 64 * 1024
+STORED_HEADERS = ('Content-Type', 'Location', 'ETag', 'Retry-After')
+# Login sets a session cookie, which must never be replayed to someone else
+EXEMPT_ENDPOINTS = {'login'}
+NDJSON_MIMETYPE = 'application/x-ndjson'
+COMPACT_BATCH_SIZE = 5000
+# Claims held by other processes are not signalled here; waiters re-check
+# the table this often.
+RECHECK_SECONDS = 0.05
+
+# Per process: finished responses by key (LRU, bounded) and an event per key
+# whose request is running in this process, for duplicates to wait on. The
+# idempotency_key table is shared by all workers and is the source of truth.
+_entries = OrderedDict()
+_running = {}
+_lock = threading.Lock()
+_config = dict(DEFAULTS)
+_db = None
+
+
+def init_app(app, db):
+    global _db
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+        _config[key] = app.config[key]
+    _db = db
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+
+
+def _engine():
+    return _db.engines.get(sqlite_engine.WRITER_BIND, _db.engine)
+
+
+# Keys belong to whoever sent them: the logged-in user, else the remote
+# address. The table holds a digest of the pair, so one caller can neither
+# replay nor block another's response by guessing its key.
+def _scoped(key):
+    caller = f'user:{current_user.id}' if current_user.is_authenticated else f'ip:{request.remote_addr}'
+    return hashlib.sha256(f'{caller}\n{key}'.encode()).hexdigest()
+
+
+# The same key may only be reused for the same request. NDJSON bodies are
+# streamed by the bulk import, so only their length is taken.
+def _fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}?{request.query_string.decode()}\n'.encode())
+    if request.mimetype == NDJSON_MIMETYPE:
+        digest.update(str(request.content_length).encode())
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _lookup(key):
+    entry = _entries.get(key)
+    if entry is None or clock.monotonic() - entry['stored_at'] > _config['IDEMPOTENCY_TTL_SECONDS']:
+        return None
+    _entries.move_to_end(key)
+    return entry
+
+
+def _remember(key, entry):
+    if len(entry['body']) > MAX_CACHED_BODY:
+        return
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > _config['IDEMPOTENCY_CACHE_SIZE']:
+            _entries.popitem(last=False)
+
+
+def _cutoff(seconds):
+    return (datetime.utcnow() - timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Take the key in the table, or return the row holding it: a stored response
+# or another process's claim. Expired responses and abandoned claims are
+# taken over in the same statement.
+def _claim(key, fingerprint):
+    with _engine().begin() as connection:
+        claimed = connection.execute(sa.text("""
+            INSERT INTO idempotency_key (key, fingerprint) VALUES (:key, :fingerprint)
+            ON CONFLICT (key) DO UPDATE SET
+                fingerprint = excluded.fingerprint, status = NULL, headers = NULL, body = NULL,
+                created_at = CURRENT_TIMESTAMP
+            WHERE created_at < :expired OR (status IS NULL AND created_at < :abandoned)
+            RETURNING key
+        """), {
+            'key': key, 'fingerprint': fingerprint,
+            'expired': _cutoff(_config['IDEMPOTENCY_TTL_SECONDS']),
+            'abandoned': _cutoff(_config['IDEMPOTENCY_CLAIM_SECONDS']),
+        }).first()
+        if claimed:
+            return None
+        return connection.execute(sa.text(
+            'SELECT fingerprint, status, headers, body FROM idempotency_key WHERE key = :key'
+        ), {'key': key}).first()
+
+
+def _release(key):
+    with _engine().begin() as connection:
+        connection.execute(sa.text('DELETE FROM idempotency_key WHERE key = :key AND status IS NULL'), {'key': key})
+
+
+def _done(key):
+    with _lock:
+        event = _running.pop(key, None)
+    if event is not None:
+        event.set()
+
+
+def _replay(entry, fingerprint):
+    if entry['fingerprint'] != fingerprint:
+        return jsonify({'message': f'{HEADER} was already used for a different request'}), 422
+    response = current_app.response_class(entry['body'], status=entry['status'], headers=entry['headers'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _busy():
+    response = jsonify({'message': f'A request with this {HEADER} is still in progress; retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 409
+
+
+# Replay the stored response for a repeated key, wait for a duplicate that is
+# still running, or claim the key and let the request through. Only the
+# idempotency_key table is read; a replay never reaches the route.
+def _start_request():
+    if request.method != 'POST' or request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+    key = request.headers.get(HEADER)
+    if key is None:
+        return None
+    if not key.strip() or len(key) > MAX_KEY_LENGTH:
+        return jsonify({'message': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+    key = _scoped(key)
+    fingerprint = _fingerprint()
+    deadline = clock.monotonic() + _config['IDEMPOTENCY_WAIT_SECONDS']
+
+    # One request per key per process; the rest wait for it to finish
+    while True:
+        with _lock:
+            entry = _lookup(key)
+            running = None if entry else _running.get(key)
+            if entry is None and running is None:
+                _running[key] = threading.Event()
+        if entry is not None:
+            return _replay(entry, fingerprint)
+        if running is None:
+            break
+        if not running.wait(max(0.0, deadline - clock.monotonic())):
+            return _busy()
+
+    # And one per key across processes
+    try:
+        while True:
+            row = _claim(key, fingerprint)
+            if row is None:
+                g.idempotency_key = key
+                g.idempotency_fingerprint = fingerprint
+                return None
+            if row.status is not None:
+                entry = {
+                    'fingerprint': row.fingerprint, 'status': row.status,
+                    'headers': json.loads(row.headers), 'body': row.body, 'stored_at': clock.monotonic(),
+                }
+                if entry['fingerprint'] == fingerprint:
+                    _remember(key, entry)
+                return _replay(entry, fingerprint)
+            if clock.monotonic() >= deadline:
+                return _busy()
+            clock.sleep(RECHECK_SECONDS)
+    finally:
+        if 'idempotency_key' not in g:
+            _done(key)
+
+
+# Store what the route answered under its key. Server errors are not stored:
+# the claim is dropped so a retry runs the request again.
+def _finish_request(response):
+    key = g.pop('idempotency_key', None)
+    if key is None:
+        return response
+    try:
+        if response.status_code >= 500 or response.is_streamed:
+            _release(key)
+            return response
+        entry = {
+            'fingerprint': g.idempotency_fingerprint, 'status': response.status_code,
+            'headers': {name: response.headers[name] for name in STORED_HEADERS if name in response.headers},
+            'body': response.get_data(), 'stored_at': clock.monotonic(),
+        }
+        with _engine().begin() as connection:
+            connection.execute(sa.text(
+                'UPDATE idempotency_key SET status = :status, headers = :headers, body = :body WHERE key = :key'
+            ), {'key': key, 'status': entry['status'], 'headers': json.dumps(entry['headers']), 'body': entry['body']})
+        _remember(key, entry)
+        return response
+    finally:
+        _done(key)
+
+
+# A request that ended without a response (after_request never ran) gives its key back
+def _teardown_request(error):
+    key = g.pop('idempotency_key', None)
+    if key is not None:
+        try:
+            _release(key)
+        finally:
+            _done(key)
+
+
+def compact(connection, ttl_seconds=None):
+    cutoff = _cutoff(_config['IDEMPOTENCY_TTL_SECONDS'] if ttl_seconds is None else ttl_seconds)
+    deleted = 0
+    while True:
+        with connection.begin():
+            result = connection.execute(sa.text(
+                'DELETE FROM idempotency_key WHERE key IN '
+                '(SELECT key FROM idempotency_key WHERE created_at < :cutoff LIMIT :batch)'
+            ), {'cutoff': cutoff, 'batch': COMPACT_BATCH_SIZE})
+        deleted += result.rowcount
+        if result.rowcount < COMPACT_BATCH_SIZE:
+            return deleted
+
+
+def clear():
+    with _lock:
+        _entries.clear()
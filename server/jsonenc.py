@@ -0,0 +1,54 @@
+# jsonenc.py
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib provider is used instead
+    orjson = None
+
+DEFAULTS = {
+    # 'auto' uses orjson when it is installed, else the stdlib json module
+    'JSON_ENCODER': 'auto',
+}
+
+
+# Both providers write dates and datetimes as ISO 8601, the same as the
+# models' to_dict(), so projected rows and ORM dicts serialize identically.
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    sort_keys = False
+
+
+class OrjsonProvider(JSONProvider):
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    # Hand the encoded bytes straight to the response without a str round trip
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=_default), mimetype=self.mimetype)
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    choice = app.config['JSON_ENCODER']
+    if choice not in ('auto', 'orjson', 'stdlib'):
+        raise ValueError(f'JSON_ENCODER must be auto, orjson or stdlib, not {choice!r}')
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_ENCODER is orjson but orjson is not installed')
+    use_orjson = orjson is not None and choice != 'stdlib'
+    app.json = OrjsonProvider(app) if use_orjson else StdlibJSONProvider(app)
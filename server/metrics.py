@@ -0,0 +1,173 @@
+# metrics.py
+import threading
+import time as clock
+
+import sqlalchemy as sa
+from flask import g, has_request_context, request
+
+DEFAULTS = {
+    'METRICS_ENABLED': True,
+    'METRICS_SLOW_REQUEST_MS': 500,
+    'METRICS_SLOW_QUERY_MS': 100,
+}
+
+# Request duration histogram bucket bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_LOGGED_STATEMENT = 500
+
+# Per process, keyed by (method, route). Each entry holds the request count,
+# histogram bucket counts, summed request/query time, queries, rows and bytes.
+_routes = {}
+_statuses = {}
+_lock = threading.Lock()
+_config = dict(DEFAULTS)
+_logger = None
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * len(BUCKETS)
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.response_bytes = 0
+
+
+def init_app(app, db):
+    global _logger
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+        _config[key] = app.config[key]
+    _logger = app.logger
+    if not _config['METRICS_ENABLED']:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            sa.event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            sa.event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    sa.event.listen(db.Model, 'load', _on_load, propagate=True)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = clock.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    elapsed = clock.perf_counter() - started
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_queries += 1
+        g.metrics_query_seconds += elapsed
+    if elapsed * 1000 >= _config['METRICS_SLOW_QUERY_MS']:
+        _logger.warning('slow query (%.1f ms): %s', elapsed * 1000, statement[:MAX_LOGGED_STATEMENT])
+
+
+# Rows are counted as ORM objects loaded, which is where lazy loads show up,
+# plus the plain column rows that list pages report through add_rows()
+def _on_load(target, context):
+    add_rows(1)
+
+
+def add_rows(count):
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_rows += count
+
+
+def _start_request():
+    g.metrics_started = clock.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_seconds = 0.0
+    g.metrics_rows = 0
+
+
+# Streamed responses are timed up to the point the stream is handed to the
+# server; their body size is not known here and counts as zero.
+def _finish_request(response):
+    if 'metrics_started' not in g:
+        return response
+    elapsed = clock.perf_counter() - g.metrics_started
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    # calculate_content_length() would buffer a streamed body to measure it
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+
+    with _lock:
+        stats = _routes.get((request.method, route))
+        if stats is None:
+            stats = _routes[(request.method, route)] = RouteStats()
+        stats.requests += 1
+        stats.seconds += elapsed
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                stats.buckets[i] += 1
+        stats.queries += g.metrics_queries
+        stats.query_seconds += g.metrics_query_seconds
+        stats.rows += g.metrics_rows
+        stats.response_bytes += size
+        key = (request.method, route, response.status_code)
+        _statuses[key] = _statuses.get(key, 0) + 1
+
+    if elapsed * 1000 >= _config['METRICS_SLOW_REQUEST_MS']:
+        _logger.warning('slow request (%.1f ms): %s %s, %d queries in %.1f ms, %d rows, %d bytes',
+                        elapsed * 1000, request.method, request.full_path.rstrip('?'), g.metrics_queries,
+                        g.metrics_query_seconds * 1000, g.metrics_rows, size)
+    return response
+
+
+def _labels(**labels):
+    return ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels.items())
+
+
+# Prometheus text exposition format. gauges maps a name prefix to a flat
+# dict of numbers (e.g. principals.stats()) exported as <prefix>_<key>.
+def render(gauges=None):
+    with _lock:
+        routes = {key: vars(stats).copy() for key, stats in _routes.items()}
+        statuses = dict(_statuses)
+
+    lines = [
+        '# HELP http_requests_total Requests handled, by route and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (method, route, status), count in sorted(statuses.items()):
+        lines.append(f'http_requests_total{{{_labels(method=method, route=route, status=status)}}} {count}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Time spent handling requests.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (method, route), stats in sorted(routes.items()):
+        labels = _labels(method=method, route=route)
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["requests"]}')
+        lines.append(f'http_request_duration_seconds_sum{{{labels}}} {stats["seconds"]}')
+        lines.append(f'http_request_duration_seconds_count{{{labels}}} {stats["requests"]}')
+
+    for name, field, help_text in (
+        ('http_request_queries_total', 'queries', 'SQL statements executed while handling requests.'),
+        ('http_request_query_seconds_total', 'query_seconds', 'Time spent in SQL statements while handling requests.'),
+        ('http_request_rows_total', 'rows', 'ORM rows loaded while handling requests.'),
+        ('http_response_bytes_total', 'response_bytes', 'Response body bytes, excluding streamed responses.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (method, route), stats in sorted(routes.items()):
+            lines.append(f'{name}{{{_labels(method=method, route=route)}}} {stats[field]}')
+
+    for prefix, values in (gauges or {}).items():
+        for key, value in sorted(values.items()):
+            if isinstance(value, (int, float)):
+                lines += [f'# TYPE {prefix}_{key} gauge', f'{prefix}_{key} {float(value)}']
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    with _lock:
+        _routes.clear()
+        _statuses.clear()
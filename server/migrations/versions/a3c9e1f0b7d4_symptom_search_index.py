@@ -0,0 +1,85 @@
+"""Symptom and diagnosis full-text search index
+
+Revision ID: a3c9e1f0b7d4
+Revises: bdc53123b356
+Create Date: 2026-10-18 18:20:41.118204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9e1f0b7d4'
+down_revision = 'bdc53123b356'
+branch_labels = None
+depends_on = None
+
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED, symptom_id UNINDEXED, patient_id UNINDEXED,
+    name, description, diagnosis,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# Trigger DDL as of this revision. Later revisions change the trigger modules,
+# so the statements are kept here rather than imported.
+TRIGGERS = {
+    'search_symptom_insert': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_insert AFTER INSERT ON symptom BEGIN
+            INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+            VALUES (-new.id, 'symptom', new.id, new.name, new.description);
+        END""",
+    'search_symptom_update': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_update AFTER UPDATE OF name, description ON symptom BEGIN
+            DELETE FROM search_index WHERE rowid = -old.id;
+            INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+            VALUES (-new.id, 'symptom', new.id, new.name, new.description);
+        END""",
+    'search_symptom_delete': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_delete AFTER DELETE ON symptom BEGIN
+            DELETE FROM search_index WHERE rowid = -old.id;
+        END""",
+    'search_diagnosis_insert': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_insert AFTER INSERT ON patient_symptom
+        WHEN new.diagnosis IS NOT NULL BEGIN
+            INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+            VALUES ((new.patient_id << 24) | new.symptom_id, 'diagnosis', new.symptom_id, new.patient_id, new.diagnosis);
+        END""",
+    'search_diagnosis_update': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_update AFTER UPDATE ON patient_symptom BEGIN
+            DELETE FROM search_index WHERE rowid = (old.patient_id << 24) | old.symptom_id;
+            INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+            SELECT (new.patient_id << 24) | new.symptom_id, 'diagnosis', new.symptom_id, new.patient_id, new.diagnosis
+            WHERE new.diagnosis IS NOT NULL;
+        END""",
+    'search_diagnosis_delete': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_delete AFTER DELETE ON patient_symptom BEGIN
+            DELETE FROM search_index WHERE rowid = (old.patient_id << 24) | old.symptom_id;
+        END""",
+}
+
+REBUILD = (
+    """DELETE FROM search_index""",
+    """INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+       SELECT -id, 'symptom', id, name, description FROM symptom""",
+    """INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+       SELECT (patient_id << 24) | symptom_id, 'diagnosis', symptom_id, patient_id, diagnosis FROM patient_symptom
+       WHERE diagnosis IS NOT NULL""",
+    """INSERT INTO search_index (search_index) VALUES ('optimize')""",
+)
+
+
+def upgrade():
+    op.execute(CREATE_TABLE)
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+    for statement in REBUILD:
+        op.execute(statement)
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('DROP TABLE IF EXISTS search_index')
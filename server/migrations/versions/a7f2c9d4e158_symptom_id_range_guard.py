@@ -0,0 +1,45 @@
+"""Refuse symptom ids too large for the search index's diagnosis rowids
+
+Revision ID: a7f2c9d4e158
+Revises: c3e9f5b1a642
+Create Date: 2026-10-19 14:02:51.318406
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7f2c9d4e158'
+down_revision = 'c3e9f5b1a642'
+branch_labels = None
+depends_on = None
+
+# Diagnosis rows in search_index are keyed patient_id << 24 | symptom_id,
+# so a symptom id of 2**24 or more lands on another patient's row.
+TRIGGERS = {
+    'search_symptom_id_range_insert': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_id_range_insert AFTER INSERT ON symptom
+        WHEN new.id >= 16777216 OR new.id < 0 BEGIN
+            SELECT RAISE(ABORT, 'symptom id out of range for the search index');
+        END""",
+    'search_symptom_id_range_update': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_id_range_update AFTER UPDATE OF id ON symptom
+        WHEN new.id >= 16777216 OR new.id < 0 BEGIN
+            SELECT RAISE(ABORT, 'symptom id out of range for the search index');
+        END""",
+}
+
+
+def upgrade():
+    ids = [row[0] for row in op.get_bind().exec_driver_sql(
+        'SELECT id FROM symptom WHERE id >= 16777216 OR id < 0 ORDER BY id LIMIT 20').all()]
+    if ids:
+        raise RuntimeError('Symptoms with ids outside 0..16777215 must be renumbered first: '
+                           + ', '.join(map(str, ids)))
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
@@ -0,0 +1,122 @@
+"""ON DELETE CASCADE for appointment, patient and patient_symptom foreign keys
+
+Revision ID: b8f3c6e2d190
+Revises: d2e6a8b4f071
+Create Date: 2026-10-18 22:31:45.207114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f3c6e2d190'
+down_revision = 'd2e6a8b4f071'
+branch_labels = None
+depends_on = None
+
+# The original foreign keys are unnamed; this names them as reflected so the
+# batch operations below can drop and re-create them.
+NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+FOREIGN_KEYS = {
+    'patient': (('doctor_id', 'doctor'),),
+    'appointment': (('patient_id', 'patient'), ('doctor_id', 'doctor')),
+    'patient_symptom': (('patient_id', 'patient'), ('symptom_id', 'symptom')),
+}
+
+# Triggers on the rebuilt tables as of this revision. Later revisions change
+# the trigger modules, so the DDL is kept here.
+TRIGGERS = {
+    'search_diagnosis_insert': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_insert AFTER INSERT ON patient_symptom
+        WHEN new.diagnosis IS NOT NULL BEGIN
+            INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+            VALUES ((new.patient_id << 24) | new.symptom_id, 'diagnosis', new.symptom_id, new.patient_id, new.diagnosis);
+        END""",
+    'search_diagnosis_update': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_update AFTER UPDATE ON patient_symptom BEGIN
+            DELETE FROM search_index WHERE rowid = (old.patient_id << 24) | old.symptom_id;
+            INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+            SELECT (new.patient_id << 24) | new.symptom_id, 'diagnosis', new.symptom_id, new.patient_id, new.diagnosis
+            WHERE new.diagnosis IS NOT NULL;
+        END""",
+    'search_diagnosis_delete': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_delete AFTER DELETE ON patient_symptom BEGIN
+            DELETE FROM search_index WHERE rowid = (old.patient_id << 24) | old.symptom_id;
+        END""",
+    'appointment_stats_insert': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_insert AFTER INSERT ON appointment
+        WHEN new.start IS NOT NULL BEGIN
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            VALUES (new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0))
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_update': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_update
+        AFTER UPDATE OF doctor_id, start, duration_minutes ON appointment
+        WHEN old.start IS NOT NULL OR new.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            SELECT new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0) WHERE new.start IS NOT NULL
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL AND NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+    'change_log_appointment_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_insert AFTER INSERT ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'insert', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_update AFTER UPDATE ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'update', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_delete AFTER DELETE ON appointment WHEN NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', old.id, 'delete', NULL);
+        END""",
+    'change_log_patient_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_insert AFTER INSERT ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', new.id, 'insert', json_object('id', new.id, 'name', new.name, 'age', new.age, 'doctor_id', new.doctor_id));
+        END""",
+    'change_log_patient_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_update AFTER UPDATE ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', new.id, 'update', json_object('id', new.id, 'name', new.name, 'age', new.age, 'doctor_id', new.doctor_id));
+        END""",
+    'change_log_patient_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_delete AFTER DELETE ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', old.id, 'delete', NULL);
+        END""",
+}
+
+
+def _recreate_foreign_keys(ondelete):
+    for table, keys in FOREIGN_KEYS.items():
+        with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+            for column, referred in keys:
+                name = f'fk_{table}_{column}_{referred}'
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+    # SQLite applies these by rebuilding each table, which drops its triggers
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+
+
+def upgrade():
+    _recreate_foreign_keys('CASCADE')
+
+
+def downgrade():
+    _recreate_foreign_keys(None)
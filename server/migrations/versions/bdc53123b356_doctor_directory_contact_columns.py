@@ -0,0 +1,30 @@
+"""Doctor directory contact columns
+
+Revision ID: bdc53123b356
+Revises: ddc07651e72d
+Create Date: 2026-10-18 10:04:17.502931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bdc53123b356'
+down_revision = 'ddc07651e72d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('doctor') as batch_op:
+        batch_op.add_column(sa.Column('phone', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('email', sa.String(length=150), nullable=True))
+        batch_op.add_column(sa.Column('image_url', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('doctor') as batch_op:
+        batch_op.drop_column('image_url')
+        batch_op.drop_column('email')
+        batch_op.drop_column('phone')
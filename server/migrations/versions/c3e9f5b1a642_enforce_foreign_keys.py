@@ -0,0 +1,96 @@
+"""Refuse to enforce foreign keys over orphaned rows; cascade daily stats
+
+Revision ID: c3e9f5b1a642
+Revises: f6c1a8d3e527
+Create Date: 2026-10-19 11:26:08.471395
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e9f5b1a642'
+down_revision = 'f6c1a8d3e527'
+branch_labels = None
+depends_on = None
+
+NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+STATS_FK = 'fk_appointment_daily_stats_doctor_id_doctor'
+
+# The appointment triggers that write to appointment_daily_stats, as of this
+# revision. SQLite refuses to rename a table that triggers still point at the
+# old name of, so they are dropped around the rebuild.
+TRIGGERS = {
+    'appointment_stats_insert': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_insert AFTER INSERT ON appointment
+        WHEN new.start IS NOT NULL BEGIN
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            VALUES (new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0))
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_update': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_update
+        AFTER UPDATE OF doctor_id, start, duration_minutes ON appointment
+        WHEN old.start IS NOT NULL OR new.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            SELECT new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0) WHERE new.start IS NOT NULL
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL AND NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+}
+
+# Rowids listed per table when the upgrade is refused
+LISTED_ORPHANS = 20
+
+
+# Until now PRAGMA foreign_keys was off, so rows could outlive the row they
+# reference. They are clinical records, so the upgrade never deletes them:
+# it stops and names them, to be reassigned or removed by hand first.
+def _check_orphans():
+    orphans = {}
+    for table, rowid, parent, _ in op.get_bind().exec_driver_sql('PRAGMA foreign_key_check').all():
+        orphans.setdefault((table, parent), []).append(rowid)
+    if not orphans:
+        return
+    lines = [
+        f'  {table}: {len(rowids)} rows reference a missing {parent} '
+        f'(rowids {", ".join(map(str, sorted(rowids)[:LISTED_ORPHANS]))}{", ..." if len(rowids) > LISTED_ORPHANS else ""})'
+        for (table, parent), rowids in sorted(orphans.items())
+    ]
+    raise RuntimeError('Orphaned rows must be resolved before foreign keys are enforced:\n' + '\n'.join(lines))
+
+
+def _recreate_stats_foreign_key(ondelete):
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    with op.batch_alter_table('appointment_daily_stats', naming_convention=NAMING) as batch_op:
+        batch_op.drop_constraint(STATS_FK, type_='foreignkey')
+        batch_op.create_foreign_key(STATS_FK, 'doctor', ['doctor_id'], ['id'], ondelete=ondelete)
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+
+
+def upgrade():
+    _check_orphans()
+    # Archived appointments keep their stats rows, which would otherwise
+    # stop their doctor from being deleted
+    _recreate_stats_foreign_key('CASCADE')
+
+
+def downgrade():
+    _recreate_stats_foreign_key(None)
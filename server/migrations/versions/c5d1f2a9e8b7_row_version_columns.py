@@ -0,0 +1,120 @@
+"""Row version columns for optimistic concurrency
+
+Revision ID: c5d1f2a9e8b7
+Revises: f1b84a6d93c5
+Create Date: 2026-10-18 20:14:51.302716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d1f2a9e8b7'
+down_revision = 'f1b84a6d93c5'
+branch_labels = None
+depends_on = None
+
+TABLES = ('user', 'doctor', 'patient', 'symptom', 'appointment')
+
+# Triggers on TABLES as of this revision, which the downgrade has to put back.
+# Later revisions change the trigger modules, so the DDL is kept here.
+TRIGGERS = {
+    'search_symptom_insert': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_insert AFTER INSERT ON symptom BEGIN
+            INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+            VALUES (-new.id, 'symptom', new.id, new.name, new.description);
+        END""",
+    'search_symptom_update': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_update AFTER UPDATE OF name, description ON symptom BEGIN
+            DELETE FROM search_index WHERE rowid = -old.id;
+            INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+            VALUES (-new.id, 'symptom', new.id, new.name, new.description);
+        END""",
+    'search_symptom_delete': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_delete AFTER DELETE ON symptom BEGIN
+            DELETE FROM search_index WHERE rowid = -old.id;
+        END""",
+    'appointment_stats_insert': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_insert AFTER INSERT ON appointment
+        WHEN new.start IS NOT NULL BEGIN
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            VALUES (new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0))
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_update': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_update
+        AFTER UPDATE OF doctor_id, start, duration_minutes ON appointment
+        WHEN old.start IS NOT NULL OR new.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            SELECT new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0) WHERE new.start IS NOT NULL
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+    'change_log_appointment_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_insert AFTER INSERT ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'insert', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_update AFTER UPDATE ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'update', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_delete AFTER DELETE ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', old.id, 'delete', NULL);
+        END""",
+    'change_log_patient_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_insert AFTER INSERT ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', new.id, 'insert', json_object('id', new.id, 'name', new.name, 'age', new.age, 'doctor_id', new.doctor_id));
+        END""",
+    'change_log_patient_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_update AFTER UPDATE ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', new.id, 'update', json_object('id', new.id, 'name', new.name, 'age', new.age, 'doctor_id', new.doctor_id));
+        END""",
+    'change_log_patient_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_delete AFTER DELETE ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', old.id, 'delete', NULL);
+        END""",
+    'change_log_doctor_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_doctor_insert AFTER INSERT ON doctor BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('doctor', new.id, 'insert', json_object('id', new.id, 'name', new.name, 'specialty', new.specialty, 'phone', new.phone, 'email', new.email, 'imageUrl', new.image_url));
+        END""",
+    'change_log_doctor_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_doctor_update AFTER UPDATE ON doctor BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('doctor', new.id, 'update', json_object('id', new.id, 'name', new.name, 'specialty', new.specialty, 'phone', new.phone, 'email', new.email, 'imageUrl', new.image_url));
+        END""",
+    'change_log_doctor_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_doctor_delete AFTER DELETE ON doctor BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('doctor', old.id, 'delete', NULL);
+        END""",
+}
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version')
+    # Dropping a column rebuilds the table on SQLite, which takes its triggers with it
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
@@ -0,0 +1,83 @@
+"""Appointment archive table
+
+Revision ID: d2e6a8b4f071
+Revises: c5d1f2a9e8b7
+Create Date: 2026-10-18 21:07:12.418530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2e6a8b4f071'
+down_revision = 'c5d1f2a9e8b7'
+branch_labels = None
+depends_on = None
+
+# Delete triggers that now skip rows being moved into the archive
+GUARDED = {
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL AND NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+    'change_log_appointment_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_delete AFTER DELETE ON appointment WHEN NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', old.id, 'delete', NULL);
+        END""",
+}
+
+# The same triggers as f1b84a6d93c5 left them, for the downgrade
+UNGUARDED = {
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+    'change_log_appointment_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_delete AFTER DELETE ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', old.id, 'delete', NULL);
+        END""",
+}
+
+
+def upgrade():
+    op.create_table('appointment_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('start', sa.DateTime(), nullable=False),
+    sa.Column('duration_minutes', sa.Integer(), nullable=False),
+    sa.Column('date', sa.String(length=100), nullable=False),
+    sa.Column('time', sa.String(length=100), nullable=False),
+    sa.Column('reason', sa.String(length=200), nullable=False),
+    sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+    sa.Column('archived_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_appointment_archive_doctor_id_start', 'appointment_archive', ['doctor_id', 'start'], unique=False)
+    op.create_index('ix_appointment_archive_patient_id_start', 'appointment_archive', ['patient_id', 'start'], unique=False)
+    op.create_index('ix_appointment_archive_start', 'appointment_archive', ['start'], unique=False)
+    for name, ddl in GUARDED.items():
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute(ddl)
+
+
+def downgrade():
+    # Recreate the delete triggers without the archive check
+    for name, ddl in UNGUARDED.items():
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute(ddl)
+    op.drop_index('ix_appointment_archive_start', table_name='appointment_archive')
+    op.drop_index('ix_appointment_archive_patient_id_start', table_name='appointment_archive')
+    op.drop_index('ix_appointment_archive_doctor_id_start', table_name='appointment_archive')
+    op.drop_table('appointment_archive')
@@ -0,0 +1,97 @@
+"""Typed appointment start, duration and scheduling indexes
+
+Revision ID: ddc07651e72d
+Revises: 4e8f7955c2e2
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ddc07651e72d'
+down_revision = '4e8f7955c2e2'
+branch_labels = None
+depends_on = None
+
+BACKFILL_CHUNK_SIZE = 5000
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%B %d, %Y', '%b %d, %Y')
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p')
+
+
+def _parse(value, formats):
+    for fmt in formats:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_start(date, time):
+    day = _parse(date or '', DATE_FORMATS)
+    clock = _parse(time or '', TIME_FORMATS)
+    if day is None or clock is None:
+        return None
+    return datetime.combine(day.date(), clock.time())
+
+
+def upgrade():
+    # SQLite cannot add a NOT NULL column without rebuilding the table, so the
+    # new columns are added nullable and the application always fills them in.
+    with op.batch_alter_table('appointment') as batch_op:
+        batch_op.add_column(sa.Column('start', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('duration_minutes', sa.Integer(), nullable=False, server_default='30'))
+    op.create_index('ix_appointment_doctor_id_start', 'appointment', ['doctor_id', 'start'])
+    op.create_index('ix_appointment_patient_id_start', 'appointment', ['patient_id', 'start'])
+    op.create_index(op.f('ix_patient_doctor_id'), 'patient', ['doctor_id'])
+
+    if op.get_context().as_sql:
+        return
+
+    # Backfill in id-ordered chunks, each in its own short write transaction, so
+    # readers and writers can get at the database between chunks.
+    appointment = sa.table(
+        'appointment',
+        sa.column('id', sa.Integer),
+        sa.column('start', sa.DateTime),
+    )
+    update = appointment.update().where(appointment.c.id == sa.bindparam('row_id')).values(start=sa.bindparam('row_start'))
+    select = sa.text('SELECT id, date, time FROM appointment WHERE id > :last_id AND start IS NULL ORDER BY id LIMIT :chunk')
+
+    unparsed = 0
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        last_id = 0
+        while True:
+            rows = bind.execute(select, {'last_id': last_id, 'chunk': BACKFILL_CHUNK_SIZE}).fetchall()
+            if not rows:
+                break
+            params = []
+            for row_id, date, time in rows:
+                start = _parse_start(date, time)
+                if start is None:
+                    unparsed += 1
+                else:
+                    params.append({'row_id': row_id, 'row_start': start})
+            if params:
+                bind.exec_driver_sql('BEGIN IMMEDIATE')
+                bind.execute(update, params)
+                bind.exec_driver_sql('COMMIT')
+            last_id = rows[-1][0]
+
+    if unparsed:
+        print(f"{unparsed} appointment rows have a date/time that could not be parsed; start left NULL")
+
+
+def downgrade():
+    op.drop_index(op.f('ix_patient_doctor_id'), table_name='patient')
+    op.drop_index('ix_appointment_patient_id_start', table_name='appointment')
+    op.drop_index('ix_appointment_doctor_id_start', table_name='appointment')
+    with op.batch_alter_table('appointment') as batch_op:
+        batch_op.drop_column('duration_minutes')
+        batch_op.drop_column('start')
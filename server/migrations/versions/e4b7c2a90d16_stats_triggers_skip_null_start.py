@@ -0,0 +1,62 @@
+"""Skip appointments without a start in the daily stats triggers
+
+Revision ID: e4b7c2a90d16
+Revises: a9d4e1c7b352
+Create Date: 2026-10-19 09:12:37.604183
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c2a90d16'
+down_revision = 'a9d4e1c7b352'
+branch_labels = None
+depends_on = None
+
+# Legacy rows whose start could not be parsed have no day to count under;
+# the triggers without these WHEN checks failed on them with NOT NULL.
+TRIGGERS = {
+    'appointment_stats_insert': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_insert AFTER INSERT ON appointment
+        WHEN new.start IS NOT NULL BEGIN
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            VALUES (new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0))
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_update': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_update
+        AFTER UPDATE OF doctor_id, start, duration_minutes ON appointment
+        WHEN old.start IS NOT NULL OR new.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            SELECT new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0) WHERE new.start IS NOT NULL
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL AND NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+}
+
+
+def upgrade():
+    for name, ddl in TRIGGERS.items():
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute(ddl)
+
+
+def downgrade():
+    # The checked triggers are right for every earlier schema as well
+    pass
@@ -0,0 +1,82 @@
+"""Appointment daily stats summary table
+
+Revision ID: e7a2d4c81f36
+Revises: a3c9e1f0b7d4
+Create Date: 2026-10-18 18:41:09.552310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a2d4c81f36'
+down_revision = 'a3c9e1f0b7d4'
+branch_labels = None
+depends_on = None
+
+# Trigger DDL as of this revision. Later revisions change the trigger modules,
+# so the statements are kept here rather than imported.
+TRIGGERS = {
+    'appointment_stats_insert': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_insert AFTER INSERT ON appointment
+        WHEN new.start IS NOT NULL BEGIN
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            VALUES (new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0))
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_update': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_update
+        AFTER UPDATE OF doctor_id, start, duration_minutes ON appointment
+        WHEN old.start IS NOT NULL OR new.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            SELECT new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0) WHERE new.start IS NOT NULL
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+}
+
+REBUILD = (
+    """DELETE FROM appointment_daily_stats""",
+    """INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+       SELECT doctor_id, date(start), count(*), coalesce(sum(duration_minutes), 0)
+       FROM appointment WHERE start IS NOT NULL GROUP BY doctor_id, date(start)""",
+)
+
+
+def upgrade():
+    op.create_table('appointment_daily_stats',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('appointments', sa.Integer(), nullable=False),
+    sa.Column('minutes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id', 'day')
+    )
+    op.create_index('ix_appointment_daily_stats_day', 'appointment_daily_stats', ['day'], unique=False)
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+    for statement in REBUILD:
+        op.execute(statement)
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_index('ix_appointment_daily_stats_day', table_name='appointment_daily_stats')
+    op.drop_table('appointment_daily_stats')
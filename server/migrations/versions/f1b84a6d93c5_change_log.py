@@ -0,0 +1,80 @@
+"""Change log for appointment, patient and doctor writes
+
+Revision ID: f1b84a6d93c5
+Revises: e7a2d4c81f36
+Create Date: 2026-10-18 19:02:33.870145
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b84a6d93c5'
+down_revision = 'e7a2d4c81f36'
+branch_labels = None
+depends_on = None
+
+# Trigger DDL as of this revision. Later revisions change the trigger modules,
+# so the statements are kept here rather than imported.
+TRIGGERS = {
+    'change_log_appointment_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_insert AFTER INSERT ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'insert', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_update AFTER UPDATE ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'update', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_delete AFTER DELETE ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', old.id, 'delete', NULL);
+        END""",
+    'change_log_patient_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_insert AFTER INSERT ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', new.id, 'insert', json_object('id', new.id, 'name', new.name, 'age', new.age, 'doctor_id', new.doctor_id));
+        END""",
+    'change_log_patient_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_update AFTER UPDATE ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', new.id, 'update', json_object('id', new.id, 'name', new.name, 'age', new.age, 'doctor_id', new.doctor_id));
+        END""",
+    'change_log_patient_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_patient_delete AFTER DELETE ON patient BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('patient', old.id, 'delete', NULL);
+        END""",
+    'change_log_doctor_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_doctor_insert AFTER INSERT ON doctor BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('doctor', new.id, 'insert', json_object('id', new.id, 'name', new.name, 'specialty', new.specialty, 'phone', new.phone, 'email', new.email, 'imageUrl', new.image_url));
+        END""",
+    'change_log_doctor_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_doctor_update AFTER UPDATE ON doctor BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('doctor', new.id, 'update', json_object('id', new.id, 'name', new.name, 'specialty', new.specialty, 'phone', new.phone, 'email', new.email, 'imageUrl', new.image_url));
+        END""",
+    'change_log_doctor_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_doctor_delete AFTER DELETE ON doctor BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('doctor', old.id, 'delete', NULL);
+        END""",
+}
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('changed_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_change_log_changed_at', 'change_log', ['changed_at'], unique=False)
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_index('ix_change_log_changed_at', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,90 @@
+"""AUTOINCREMENT appointment ids
+
+Revision ID: f6c1a8d3e527
+Revises: e4b7c2a90d16
+Create Date: 2026-10-19 10:03:52.918240
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c1a8d3e527'
+down_revision = 'e4b7c2a90d16'
+branch_labels = None
+depends_on = None
+
+# Triggers on appointment as of this revision; rebuilding the table drops them
+TRIGGERS = {
+    'appointment_stats_insert': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_insert AFTER INSERT ON appointment
+        WHEN new.start IS NOT NULL BEGIN
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            VALUES (new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0))
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_update': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_update
+        AFTER UPDATE OF doctor_id, start, duration_minutes ON appointment
+        WHEN old.start IS NOT NULL OR new.start IS NOT NULL BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+            INSERT INTO appointment_daily_stats (doctor_id, day, appointments, minutes)
+            SELECT new.doctor_id, date(new.start), 1, coalesce(new.duration_minutes, 0) WHERE new.start IS NOT NULL
+            ON CONFLICT (doctor_id, day) DO UPDATE
+            SET appointments = appointments + 1, minutes = minutes + excluded.minutes;
+        END""",
+    'appointment_stats_delete': """
+        CREATE TRIGGER IF NOT EXISTS appointment_stats_delete AFTER DELETE ON appointment
+        WHEN old.start IS NOT NULL AND NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            UPDATE appointment_daily_stats
+            SET appointments = appointments - 1, minutes = minutes - coalesce(old.duration_minutes, 0)
+            WHERE doctor_id = old.doctor_id AND day = date(old.start);
+            DELETE FROM appointment_daily_stats
+            WHERE doctor_id = old.doctor_id AND day = date(old.start) AND appointments <= 0;
+        END""",
+    'change_log_appointment_insert': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_insert AFTER INSERT ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'insert', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_update': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_update AFTER UPDATE ON appointment BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', new.id, 'update', json_object('id', new.id, 'patient_id', new.patient_id, 'doctor_id', new.doctor_id, 'start', strftime('%Y-%m-%dT%H:%M:%S', new.start), 'duration_minutes', new.duration_minutes, 'date', new.date, 'time', new.time, 'reason', new.reason));
+        END""",
+    'change_log_appointment_delete': """
+        CREATE TRIGGER IF NOT EXISTS change_log_appointment_delete AFTER DELETE ON appointment WHEN NOT EXISTS (SELECT 1 FROM appointment_archive WHERE id = old.id) BEGIN
+            INSERT INTO change_log (entity, entity_id, op, data) VALUES ('appointment', old.id, 'delete', NULL);
+        END""",
+}
+
+# Without AUTOINCREMENT SQLite hands out max(id) + 1, which reuses archived
+# (and deleted) ids once the newest rows are gone from appointment. The
+# sequence starts past every id either table has seen.
+SEQUENCE = (
+    "DELETE FROM sqlite_sequence WHERE name = 'appointment'",
+    """INSERT INTO sqlite_sequence (name, seq)
+       SELECT 'appointment', max(coalesce((SELECT max(id) FROM appointment), 0),
+                                 coalesce((SELECT max(id) FROM appointment_archive), 0))""",
+)
+
+
+def _rebuild(autoincrement):
+    with op.batch_alter_table('appointment', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+
+
+def upgrade():
+    _rebuild(True)
+    for statement in SEQUENCE:
+        op.execute(statement)
+
+
+def downgrade():
+    _rebuild(False)
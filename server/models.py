@@ -1,15 +1,57 @@
 # models.py
+from datetime import datetime, timedelta
+
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from sqlalchemy.orm import validates
+from sqlalchemy.orm import selectinload, validates
+
+import group_commit
+import passwords
+import principals
+import search
+import appointment_stats
+import changes
+import cooccurrence
+import doctor_load
+from sqlite_engine import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+search.install(db.metadata)
+appointment_stats.install(db.metadata)
+changes.install(db.metadata)
+
+DEFAULT_APPOINTMENT_MINUTES = 30
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%B %d, %Y', '%b %d, %Y')
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p')
+
+def _parse_with(value, formats):
+    value = value.strip()
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date/time value: {value!r}")
 
-db = SQLAlchemy()
+# Appointments used to store date and time as free-form strings, so accept the
+# formats clients have been sending as well as a single ISO 8601 start.
+def parse_appointment_start(date=None, time=None, start=None):
+    if start:
+        return datetime.fromisoformat(start)
+    if not date or not time:
+        raise ValueError("Appointment needs a start or both a date and a time.")
+    day = _parse_with(date, DATE_FORMATS).date()
+    clock = _parse_with(time, TIME_FORMATS).time()
+    return datetime.combine(day, clock)
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
+    # Bumped on every UPDATE; the ORM adds it to UPDATE/DELETE WHERE clauses
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
 
     @validates('username')
     def validate_username(self, key, username):
@@ -18,45 +60,206 @@ class User(db.Model, UserMixin):
         return username
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify_password(self.password_hash, password)
+
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username, 'version': self.version}
 
 class Doctor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     specialty = db.Column(db.String(150), nullable=False)
-    patients = db.relationship('Patient', backref='doctor', lazy=True)
-    appointments = db.relationship('Appointment', backref='doctor', lazy=True)
+    phone = db.Column(db.String(50))
+    email = db.Column(db.String(150))
+    image_url = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+    # passive_deletes: dependents are removed by deletes.py or ON DELETE
+    # CASCADE, never loaded just to be deleted
+    patients = db.relationship('Patient', backref='doctor', lazy=True, passive_deletes=True)
+    appointments = db.relationship('Appointment', backref='doctor', lazy=True, passive_deletes=True)
+
+    def to_dict(self, expand=()):
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'specialty': self.specialty,
+            'phone': self.phone,
+            'email': self.email,
+            'imageUrl': self.image_url,
+            'version': self.version
+        }
+        if 'patients' in expand:
+            data['patients'] = [patient.to_dict() for patient in self.patients]
+        if 'appointments' in expand:
+            data['appointments'] = [appointment.to_dict() for appointment in self.appointments]
+        return data
 
 class Patient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     age = db.Column(db.Integer, nullable=False)
-    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id', ondelete='CASCADE'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
     symptoms = db.relationship('Symptom', secondary='patient_symptom', backref='patients')
-    appointments = db.relationship('Appointment', backref='patient', lazy=True)
+    appointments = db.relationship('Appointment', backref='patient', lazy=True, passive_deletes=True)
+    # Read-only view of the association rows, which carry the diagnosis
+    symptom_links = db.relationship('PatientSymptom', viewonly=True)
+
+    def to_dict(self, expand=()):
+        data = {'id': self.id, 'name': self.name, 'age': self.age, 'doctor_id': self.doctor_id, 'version': self.version}
+        if 'symptoms' in expand:
+            data['symptoms'] = [dict(link.symptom.to_dict(), diagnosis=link.diagnosis) for link in self.symptom_links]
+        if 'appointments' in expand:
+            data['appointments'] = [appointment.to_dict() for appointment in self.appointments]
+        return data
 
 class Symptom(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'description': self.description, 'version': self.version}
 
 # Association table for patient symptoms
 patient_symptom = db.Table('patient_symptom',
-    db.Column('patient_id', db.Integer, db.ForeignKey('patient.id'), primary_key=True),
-    db.Column('symptom_id', db.Integer, db.ForeignKey('symptom.id'), primary_key=True),
+    db.Column('patient_id', db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('symptom_id', db.Integer, db.ForeignKey('symptom.id', ondelete='CASCADE'), primary_key=True),
     db.Column('diagnosis', db.String(100))
 )
 
+class PatientSymptom(db.Model):
+    __table__ = patient_symptom
+    symptom = db.relationship('Symptom', viewonly=True)
+
+# Loader options per expand= name: each expansion costs one or two extra
+# SELECT ... WHERE id IN (...) per query, however many rows it returns.
+PATIENT_EXPANSIONS = {
+    'symptoms': lambda: selectinload(Patient.symptom_links).selectinload(PatientSymptom.symptom),
+    'appointments': lambda: selectinload(Patient.appointments),
+}
+DOCTOR_EXPANSIONS = {
+    'patients': lambda: selectinload(Doctor.patients),
+    'appointments': lambda: selectinload(Doctor.appointments),
+}
+
 class Appointment(db.Model):
+    # AUTOINCREMENT: ids are never handed out again, even once the rows
+    # holding them have moved to appointment_archive or been deleted
+    __table_args__ = (
+        db.Index('ix_appointment_doctor_id_start', 'doctor_id', 'start'),
+        db.Index('ix_appointment_patient_id_start', 'patient_id', 'start'),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
-    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id', ondelete='CASCADE'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id', ondelete='CASCADE'), nullable=False)
+    start = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=DEFAULT_APPOINTMENT_MINUTES)
+    # Legacy string columns, kept in step with start for older readers
     date = db.Column(db.String(100), nullable=False)
     time = db.Column(db.String(100), nullable=False)
     reason = db.Column(db.String(200), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+
+    @property
+    def end(self):
+        return self.start + timedelta(minutes=self.duration_minutes or DEFAULT_APPOINTMENT_MINUTES)
+
+    def set_start(self, start):
+        self.start = start
+        self.date = start.date().isoformat()
+        self.time = start.strftime('%H:%M')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'doctor_id': self.doctor_id,
+            'start': self.start.isoformat() if self.start else None,
+            'duration_minutes': self.duration_minutes,
+            'date': self.date,
+            'time': self.time,
+            'reason': self.reason,
+            'version': self.version
+        }
+
+# Columns each model exposes through the API, keyed by JSON field name in
+# to_dict() order. List and detail routes select these directly as rows
+# (see pagination.field_args) instead of loading ORM instances.
+PUBLIC_FIELDS = {
+    User: {'id': User.id, 'username': User.username, 'version': User.version},
+    Doctor: {'id': Doctor.id, 'name': Doctor.name, 'specialty': Doctor.specialty, 'phone': Doctor.phone,
+             'email': Doctor.email, 'imageUrl': Doctor.image_url, 'version': Doctor.version},
+    Patient: {'id': Patient.id, 'name': Patient.name, 'age': Patient.age, 'doctor_id': Patient.doctor_id, 'version': Patient.version},
+    Symptom: {'id': Symptom.id, 'name': Symptom.name, 'description': Symptom.description, 'version': Symptom.version},
+    Appointment: {'id': Appointment.id, 'patient_id': Appointment.patient_id, 'doctor_id': Appointment.doctor_id,
+                  'start': Appointment.start, 'duration_minutes': Appointment.duration_minutes,
+                  'date': Appointment.date, 'time': Appointment.time, 'reason': Appointment.reason,
+                  'version': Appointment.version},
+}
+
+# Appointments that started before the archive cutoff, moved out of the hot
+# table in batches by archive.archive(). Same columns and ids as appointment,
+# without foreign keys, so history stays readable whatever happens later.
+class AppointmentArchive(db.Model):
+    __tablename__ = 'appointment_archive'
+    __table_args__ = (
+        db.Index('ix_appointment_archive_doctor_id_start', 'doctor_id', 'start'),
+        db.Index('ix_appointment_archive_patient_id_start', 'patient_id', 'start'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    start = db.Column(db.DateTime, nullable=False, index=True)
+    duration_minutes = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.String(100), nullable=False)
+    time = db.Column(db.String(100), nullable=False)
+    reason = db.Column(db.String(200), nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    archived_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+
+# Appointments and booked minutes per doctor per day, maintained by triggers
+# (see appointment_stats.py) so dashboards never scan the appointment table.
+class AppointmentDailyStats(db.Model):
+    __tablename__ = 'appointment_daily_stats'
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    appointments = db.Column(db.Integer, nullable=False, default=0)
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+
+# Append-only log of appointment, patient and doctor writes, filled by
+# triggers (see changes.py). seq never goes backwards, even after compaction.
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    data = db.Column(db.Text)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp(), index=True)
+
+# Responses to POSTs sent with an Idempotency-Key (see idempotency.py). A row
+# with no status is a claim by the request still running under that key.
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer)
+    headers = db.Column(db.Text)
+    body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp(), index=True)
 
 # CRUD Methods
 def create_user(username, password):
@@ -66,16 +269,17 @@ def create_user(username, password):
     db.session.commit()
     return user
 
-def create_doctor(name, specialty):
-    doctor = Doctor(name=name, specialty=specialty)
+def create_doctor(name, specialty, phone=None, email=None, image_url=None):
+    doctor = Doctor(name=name, specialty=specialty, phone=phone, email=email, image_url=image_url)
     db.session.add(doctor)
     db.session.commit()
+    doctor_load.doctor_added(doctor.id, specialty)
     return doctor
 
 def create_patient(name, age, doctor_id):
     patient = Patient(name=name, age=age, doctor_id=doctor_id)
-    db.session.add(patient)
-    db.session.commit()
+    group_commit.add(patient)
+    doctor_load.patient_added(doctor_id)
     return patient
 
 def create_symptom(name, description):
@@ -86,13 +290,29 @@ def create_symptom(name, description):
 
 def add_symptom_to_patient(patient_id, symptom_id, diagnosis):
     stmt = patient_symptom.insert().values(patient_id=patient_id, symptom_id=symptom_id, diagnosis=diagnosis)
-    db.session.execute(stmt)
-    db.session.commit()
+    group_commit.execute(stmt)
+    cooccurrence.record(db.session, [(patient_id, symptom_id)])
 
-def create_appointment(patient_id, doctor_id, date, time, reason):
-    appointment = Appointment(patient_id=patient_id, doctor_id=doctor_id, date=date, time=time, reason=reason)
-    db.session.add(appointment)
-    db.session.commit()
+# The appointment helpers check what POST and PUT /appointments check: a bad
+# field raises bulk.RowError, a clash with another booking availability.Conflict.
+def create_appointment(patient_id, doctor_id, date, time, reason, duration_minutes=DEFAULT_APPOINTMENT_MINUTES):
+    values = bulk.validate_appointment({'patient_id': patient_id, 'doctor_id': doctor_id, 'date': date, 'time': time,
+                                        'reason': reason, 'duration_minutes': duration_minutes})
+    start, minutes = values['start'], values['duration_minutes']
+    if not availability.reserve(doctor_id, start, minutes):
+        raise availability.Conflict()
+    appointment = Appointment(patient_id=patient_id, doctor_id=doctor_id, reason=reason, duration_minutes=minutes)
+    appointment.set_start(start)
+    try:
+        booked = group_commit.add(appointment, unless=availability.overlapping(doctor_id, start, minutes))
+    except Exception:
+        db.session.rollback()
+        availability.release(doctor_id, start, minutes)
+        raise
+    if booked is None:
+        availability.forget(doctor_id)
+        raise availability.Conflict()
+    doctor_load.appointment_added(doctor_id)
     return appointment
 
 def update_user(user_id, username=None, password=None):
@@ -104,6 +324,7 @@ def update_user(user_id, username=None, password=None):
     if password:
         user.set_password(password)
     db.session.commit()
+    principals.invalidate(user.id)
     return user
 
 def update_doctor(doctor_id, name=None, specialty=None):
@@ -115,6 +336,8 @@ def update_doctor(doctor_id, name=None, specialty=None):
     if specialty:
         doctor.specialty = specialty
     db.session.commit()
+    if specialty:
+        doctor_load.doctor_updated(doctor_id, specialty)
     return doctor
 
 def update_patient(patient_id, name=None, age=None, doctor_id=None):
@@ -125,11 +348,55 @@ def update_patient(patient_id, name=None, age=None, doctor_id=None):
         patient.name = name
     if age:
         patient.age = age
+    old_doctor_id = patient.doctor_id
     if doctor_id:
         patient.doctor_id = doctor_id
     db.session.commit()
+    if doctor_id:
+        doctor_load.patient_moved(old_doctor_id, doctor_id)
     return patient
 
+def update_appointment(appointment_id, patient_id=None, doctor_id=None, date=None, time=None, reason=None, duration_minutes=None):
+    appointment = Appointment.query.get(appointment_id)
+    if not appointment:
+        return None
+    given = {'patient_id': patient_id, 'doctor_id': doctor_id, 'reason': reason, 'duration_minutes': duration_minutes}
+    updates = bulk.validate_appointment_changes({key: value for key, value in given.items() if value is not None})
+    old_doctor, old_slot = appointment.doctor_id, (appointment.start, appointment.duration_minutes)
+    start, minutes = old_slot
+    if date or time:
+        try:
+            start = parse_appointment_start(date or appointment.date, time or appointment.time)
+        except (TypeError, ValueError):
+            raise bulk.RowError('Invalid appointment date or time')
+    minutes = updates.get('duration_minutes', minutes) or DEFAULT_APPOINTMENT_MINUTES
+    for key in ('patient_id', 'doctor_id', 'reason'):
+        if key in updates:
+            setattr(appointment, key, updates[key])
+
+    moved = (appointment.doctor_id, start, minutes) != (old_doctor, *old_slot)
+    if moved:
+        if not availability.reserve(appointment.doctor_id, start, minutes,
+                                    ignore=old_slot if appointment.doctor_id == old_doctor else None):
+            db.session.rollback()
+            raise availability.Conflict()
+        appointment.set_start(start)
+        appointment.duration_minutes = minutes
+    try:
+        db.session.flush()
+        if moved and availability.clashes(appointment.doctor_id, start, minutes, appointment.id):
+            raise availability.Conflict()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if moved:
+            availability.release(appointment.doctor_id, start, minutes)
+        raise
+    if moved:
+        availability.release(old_doctor, *old_slot)
+    doctor_load.appointment_moved(old_doctor, appointment.doctor_id)
+    return appointment
+
 def update_symptom(symptom_id, name=None, description=None):
     symptom = Symptom.query.get(symptom_id)
     if not symptom:
@@ -141,28 +408,12 @@ def update_symptom(symptom_id, name=None, description=None):
     db.session.commit()
     return symptom
 
-def update_appointment(appointment_id, patient_id=None, doctor_id=None, date=None, time=None, reason=None):
-    appointment = Appointment.query.get(appointment_id)
-    if not appointment:
-        return None
-    if patient_id:
-        appointment.patient_id = patient_id
-    if doctor_id:
-        appointment.doctor_id = doctor_id
-    if date:
-        appointment.date = date
-    if time:
-        appointment.time = time
-    if reason:
-        appointment.reason = reason
-    db.session.commit()
-    return appointment
-
 def delete_user(user_id):
     user = User.query.get(user_id)
     if user:
         db.session.delete(user)
         db.session.commit()
+        principals.invalidate(user_id)
     return user
 
 def delete_doctor(doctor_id):
@@ -170,13 +421,20 @@ def delete_doctor(doctor_id):
     if doctor:
         db.session.delete(doctor)
         db.session.commit()
+        doctor_load.invalidate()
     return doctor
 
 def delete_patient(patient_id):
     patient = Patient.query.get(patient_id)
     if patient:
+        # The database cascades the appointments; note whose they were first
+        booked = [doctor for doctor, in db.session.query(Appointment.doctor_id).filter(Appointment.patient_id == patient_id)]
+        doctor_id = patient.doctor_id
         db.session.delete(patient)
         db.session.commit()
+        for doctor in booked:
+            doctor_load.appointment_removed(doctor)
+        doctor_load.patient_removed(doctor_id)
     return patient
 
 def delete_symptom(symptom_id):
@@ -189,6 +447,13 @@ def delete_symptom(symptom_id):
 def delete_appointment(appointment_id):
     appointment = Appointment.query.get(appointment_id)
     if appointment:
+        slot = (appointment.doctor_id, appointment.start, appointment.duration_minutes)
         db.session.delete(appointment)
         db.session.commit()
+        availability.release(*slot)
+        doctor_load.appointment_removed(slot[0])
     return appointment
+
+# Last: both import models, and only the helpers above call into them
+import availability  # noqa: E402
+import bulk  # noqa: E402
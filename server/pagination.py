@@ -0,0 +1,92 @@
+# pagination.py
+from flask import Response, current_app, jsonify, request, stream_with_context, url_for
+from sqlalchemy.engine import Row
+
+import metrics
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def page_args():
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    after = request.args.get('after', 0, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE)), max(after, 0)
+
+
+def wants_stream():
+    if request.args.get('format') == 'ndjson':
+        return True
+    best = request.accept_mimetypes.best_match([NDJSON_MIMETYPE, 'application/json'])
+    return best == NDJSON_MIMETYPE
+
+
+# fields=a,b from the query string as [(name, column)] pairs taken from a
+# model's PUBLIC_FIELDS, with id always included first; every public field
+# when absent. Raises ValueError naming any unknown fields.
+def field_args(public):
+    requested = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    if not requested:
+        return list(public.items())
+    unknown = [name for name in requested if name not in public]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(public)}")
+    names = ['id'] + [name for name in dict.fromkeys(requested) if name != 'id']
+    return [(name, public[name]) for name in names]
+
+
+# Select just these columns as plain rows; pair with row_dict as the serializer.
+def project(query, fields):
+    return query.with_entities(*[column.label(name) for name, column in fields])
+
+
+def row_dict(row):
+    return row._asdict()
+
+
+# Keyset page on the primary key: WHERE id > :after ORDER BY id LIMIT :limit + 1.
+# The extra row tells us whether there is a next page without a COUNT(*).
+def keyset_page(model, serialize, query=None):
+    limit, after = page_args()
+    query = query if query is not None else model.query
+    rows = query.filter(model.id > after).order_by(model.id).limit(limit + 1).all()
+    # Projected pages are column rows, which the ORM load event never sees
+    if rows and isinstance(rows[0], Row):
+        metrics.add_rows(len(rows))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    response = jsonify([serialize(row) for row in rows])
+    if has_more:
+        next_cursor = rows[-1].id
+        args = request.args.to_dict()
+        args.update(after=next_cursor, limit=limit)
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = '<%s>; rel="next"' % url_for(request.endpoint, **args)
+    return response
+
+
+# Streams every row after the cursor as NDJSON, fetching from the database in
+# batches of STREAM_BATCH_SIZE so memory stays flat however large the table is.
+def ndjson_stream(model, serialize, query=None):
+    _, after = page_args()
+    query = query if query is not None else model.query
+    query = query.filter(model.id > after).order_by(model.id)
+    limit = request.args.get('limit', type=int)
+    if limit:
+        query = query.limit(limit)
+
+    def generate():
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            yield current_app.json.dumps(serialize(row)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def list_response(model, serialize, query=None):
+    if wants_stream():
+        return ndjson_stream(model, serialize, query)
+    return keyset_page(model, serialize, query)
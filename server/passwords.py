@@ -0,0 +1,87 @@
+# passwords.py
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULTS = {
+    # werkzeug method string: algorithm plus cost, e.g. pbkdf2:sha256:600000
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:260000',
+    'PASSWORD_HASH_SALT_LENGTH': 16,
+    # 0 runs hashing inline on the request thread (handy for tests and dev)
+    'PASSWORD_HASH_WORKERS': 2,
+    'PASSWORD_HASH_MAX_PENDING': 8,
+    'PASSWORD_HASH_TIMEOUT': 5.0,
+}
+
+_config = dict(DEFAULTS)
+_pool = None
+_pool_lock = threading.Lock()
+_prefixes = {}
+_slots = threading.BoundedSemaphore(DEFAULTS['PASSWORD_HASH_WORKERS'] + DEFAULTS['PASSWORD_HASH_MAX_PENDING'])
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def init_app(app):
+    global _slots
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+        _config[key] = app.config[key]
+    _slots = threading.BoundedSemaphore(_config['PASSWORD_HASH_WORKERS'] + _config['PASSWORD_HASH_MAX_PENDING'])
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_config['PASSWORD_HASH_WORKERS'])
+        return _pool
+
+
+# Runs fn in the hashing pool. Callers beyond the workers plus the allowed
+# backlog are turned away at once with HashingBusy instead of queueing. A
+# slot is held until its hash has actually finished: a caller that times out
+# leaves a running hash behind, and cancel() only stops one still queued.
+def _run(fn, *args):
+    if not _config['PASSWORD_HASH_WORKERS']:
+        return fn(*args)
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=_config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        future.cancel()
+        raise HashingBusy()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, _config['PASSWORD_HASH_METHOD'], _config['PASSWORD_HASH_SALT_LENGTH'])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+# werkzeug fills in its default cost when the method leaves it out, so learn
+# the full prefix it writes for the configured method once.
+def _policy_prefix():
+    method = _config['PASSWORD_HASH_METHOD']
+    if method not in _prefixes:
+        _prefixes[method] = generate_password_hash('', method, 1).split('$', 1)[0]
+    return _prefixes[method]
+
+
+# True when a stored hash was made with a different method or cost than the
+# current policy, so it can be upgraded the next time the password is known.
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != _policy_prefix()
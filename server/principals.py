@@ -0,0 +1,69 @@
+# principals.py
+import threading
+import time as clock
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+# Per worker process. Writes in this process invalidate immediately; the TTL
+# bounds how long another worker's delete can leave a session valid here.
+CACHE_TTL_SECONDS = 60
+MAX_ENTRIES = 10000
+
+
+# What flask-login keeps as current_user between requests: just enough to
+# identify the user, without the password hash or relationships.
+class Principal(UserMixin):
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_generation = 0
+
+
+def get(user_id, load):
+    now = clock.monotonic()
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and now - entry[0] <= CACHE_TTL_SECONDS:
+            _entries.move_to_end(user_id)
+            _stats['hits'] += 1
+            return entry[1]
+        _stats['misses'] += 1
+        generation = _generation
+
+    principal = load(user_id)
+    if principal is None:
+        return None
+    with _lock:
+        # An invalidation while we were loading means the row may be stale
+        if generation != _generation:
+            return principal
+        _entries[user_id] = (now, principal)
+        _entries.move_to_end(user_id)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+    return principal
+
+
+def invalidate(user_id):
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.pop(user_id, None)
+        _stats['invalidations'] += 1
+
+
+def stats():
+    with _lock:
+        return dict(_stats, size=len(_entries), max_size=MAX_ENTRIES)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,72 @@
+# refcache.py
+import hashlib
+import threading
+import time as clock
+from collections import OrderedDict
+
+from flask import current_app, request
+
+# Per worker process. Writes in this process invalidate immediately; the TTL
+# bounds how long a write made by another worker can go unseen here.
+CACHE_TTL_SECONDS = 30
+MAX_ENTRIES = 256
+
+CACHED_HEADERS = ('X-Next-Cursor', 'Link')
+
+_entries = OrderedDict()
+_versions = {}
+_lock = threading.Lock()
+
+
+def invalidate(namespace):
+    with _lock:
+        _versions[namespace] = _versions.get(namespace, 0) + 1
+
+
+def _lookup(key, version):
+    entry = _entries.get(key)
+    if entry is None or entry['version'] != version or clock.monotonic() - entry['stored_at'] > CACHE_TTL_SECONDS:
+        return None
+    _entries.move_to_end(key)
+    return entry
+
+
+# Read-through: serve the pre-serialized body for this namespace and query
+# string, building it with build() (which returns a Response) on a miss.
+# The ETag is a hash of the body, so every worker agrees on it.
+def cached_response(namespace, build):
+    key = (namespace, request.query_string)
+    with _lock:
+        version = _versions.get(namespace, 0)
+        entry = _lookup(key, version)
+
+    if entry is None:
+        built = build()
+        if built.status_code != 200:
+            return built
+        body = built.get_data()
+        entry = {
+            'version': version,
+            'stored_at': clock.monotonic(),
+            'body': body,
+            'mimetype': built.mimetype,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'headers': {name: built.headers[name] for name in CACHED_HEADERS if name in built.headers},
+        }
+        with _lock:
+            # A write during the build bumped the version; do not keep stale bytes
+            if _versions.get(namespace, 0) == version:
+                _entries[key] = entry
+                _entries.move_to_end(key)
+                while len(_entries) > MAX_ENTRIES:
+                    _entries.popitem(last=False)
+
+    response = current_app.response_class(entry['body'], mimetype=entry['mimetype'], headers=entry['headers'])
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
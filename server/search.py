@@ -0,0 +1,154 @@
+# search.py
+import re
+
+import sqlalchemy as sa
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Column weights for bm25(), in table column order: kind, symptom_id and
+# patient_id are unindexed, then name, description and diagnosis.
+WEIGHTS = (0, 0, 0, 10.0, 4.0, 2.0)
+
+# One FTS5 row per symptom (rowid = -symptom.id) and one per diagnosed
+# patient_symptom row (rowid = patient_id << 24 | symptom_id, which unlike
+# the table's implicit rowid survives VACUUM), so every trigger touches
+# exactly one index row by rowid. prefix= keeps 'fev*' style queries on
+# short prefixes from scanning the whole term list.
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED, symptom_id UNINDEXED, patient_id UNINDEXED,
+    name, description, diagnosis,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# A larger symptom id would spill into the patient bits of a diagnosis
+# rowid, and its triggers would then touch another patient's row; the
+# search_symptom_id_range_* triggers refuse one outright.
+SYMPTOM_ID_BITS = 24
+
+TRIGGERS = {
+    'search_symptom_id_range_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS search_symptom_id_range_insert AFTER INSERT ON symptom
+        WHEN new.id >= {1 << SYMPTOM_ID_BITS} OR new.id < 0 BEGIN
+            SELECT RAISE(ABORT, 'symptom id out of range for the search index');
+        END""",
+    'search_symptom_id_range_update': f"""
+        CREATE TRIGGER IF NOT EXISTS search_symptom_id_range_update AFTER UPDATE OF id ON symptom
+        WHEN new.id >= {1 << SYMPTOM_ID_BITS} OR new.id < 0 BEGIN
+            SELECT RAISE(ABORT, 'symptom id out of range for the search index');
+        END""",
+    'search_symptom_insert': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_insert AFTER INSERT ON symptom BEGIN
+            INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+            VALUES (-new.id, 'symptom', new.id, new.name, new.description);
+        END""",
+    'search_symptom_update': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_update AFTER UPDATE OF name, description ON symptom BEGIN
+            DELETE FROM search_index WHERE rowid = -old.id;
+            INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+            VALUES (-new.id, 'symptom', new.id, new.name, new.description);
+        END""",
+    'search_symptom_delete': """
+        CREATE TRIGGER IF NOT EXISTS search_symptom_delete AFTER DELETE ON symptom BEGIN
+            DELETE FROM search_index WHERE rowid = -old.id;
+        END""",
+    'search_diagnosis_insert': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_insert AFTER INSERT ON patient_symptom
+        WHEN new.diagnosis IS NOT NULL BEGIN
+            INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+            VALUES ((new.patient_id << 24) | new.symptom_id, 'diagnosis', new.symptom_id, new.patient_id, new.diagnosis);
+        END""",
+    'search_diagnosis_update': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_update AFTER UPDATE ON patient_symptom BEGIN
+            DELETE FROM search_index WHERE rowid = (old.patient_id << 24) | old.symptom_id;
+            INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+            SELECT (new.patient_id << 24) | new.symptom_id, 'diagnosis', new.symptom_id, new.patient_id, new.diagnosis
+            WHERE new.diagnosis IS NOT NULL;
+        END""",
+    'search_diagnosis_delete': """
+        CREATE TRIGGER IF NOT EXISTS search_diagnosis_delete AFTER DELETE ON patient_symptom BEGIN
+            DELETE FROM search_index WHERE rowid = (old.patient_id << 24) | old.symptom_id;
+        END""",
+}
+
+REBUILD = (
+    "DELETE FROM search_index",
+    """INSERT INTO search_index (rowid, kind, symptom_id, name, description)
+       SELECT -id, 'symptom', id, name, description FROM symptom""",
+    """INSERT INTO search_index (rowid, kind, symptom_id, patient_id, diagnosis)
+       SELECT (patient_id << 24) | symptom_id, 'diagnosis', symptom_id, patient_id, diagnosis FROM patient_symptom
+       WHERE diagnosis IS NOT NULL""",
+    "INSERT INTO search_index (search_index) VALUES ('optimize')",
+)
+
+
+def create(connection):
+    connection.exec_driver_sql(CREATE_TABLE)
+    create_triggers(connection)
+
+
+def create_triggers(connection):
+    for ddl in TRIGGERS.values():
+        connection.exec_driver_sql(ddl)
+
+
+def drop_triggers(connection):
+    for name in TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+
+
+# Refill the index from the base tables, e.g. after a bulk load with the
+# triggers dropped.
+def rebuild(connection):
+    for statement in REBUILD:
+        connection.exec_driver_sql(statement)
+
+
+# Create and drop the index alongside the mapped tables in create_all()/drop_all()
+def install(metadata):
+    @sa.event.listens_for(metadata, 'after_create')
+    def _create_search_index(target, connection, **kwargs):
+        if connection.dialect.name == 'sqlite':
+            create(connection)
+
+    @sa.event.listens_for(metadata, 'before_drop')
+    def _drop_search_index(target, connection, **kwargs):
+        if connection.dialect.name == 'sqlite':
+            drop_triggers(connection)
+            connection.exec_driver_sql('DROP TABLE IF EXISTS search_index')
+
+
+# Turn free text into an FTS5 query: every word must match, each as a prefix,
+# and FTS5 operators or quotes in the input are treated as plain text.
+def match_expression(text):
+    words = re.findall(r'\w+', text)
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def search(session, text, limit=DEFAULT_LIMIT, kind=None):
+    expression = match_expression(text)
+    if not expression:
+        return []
+    sql = """
+        SELECT kind, symptom_id, patient_id, name, description, diagnosis,
+               bm25(search_index, %s) AS score
+        FROM search_index
+        WHERE search_index MATCH :expression %s
+        ORDER BY score
+        LIMIT :limit
+    """ % (', '.join(str(weight) for weight in WEIGHTS), 'AND kind = :kind' if kind else '')
+    rows = session.execute(sa.text(sql), {'expression': expression, 'limit': limit, 'kind': kind})
+
+    results = []
+    for row in rows:
+        # bm25() is lower-is-better; flip it so clients sort descending
+        if row.kind == 'symptom':
+            results.append({'type': 'symptom', 'score': round(-row.score, 4), 'symptom': {
+                'id': row.symptom_id, 'name': row.name, 'description': row.description}})
+        else:
+            results.append({'type': 'diagnosis', 'score': round(-row.score, 4), 'patient_id': row.patient_id,
+                            'symptom_id': row.symptom_id, 'diagnosis': row.diagnosis})
+    return results
@@ -1,36 +1,297 @@
 #!/usr/bin/env python3
+# Seeds the database with a deterministic synthetic dataset.
+#
+#   python seed.py                                   # small dev dataset
+#   python seed.py --doctors 1000 --patients 1000000 --appointments 10000000
+#
+# The same --seed, sizes, --first-day and --chunk-size always produce the same
+# data, whatever --workers is: each chunk is generated from its own derived seed.
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+from multiprocessing import Pool
+
+from faker import Faker
+from faker.providers.person.en_US import Provider as PersonProvider
 
 from app import app
-from models import db, Doctor, Patient, Symptom, User
+from models import db, Doctor, Patient, Symptom, User, Appointment, patient_symptom
+import passwords
+import search
+import appointment_stats
+import changes
+import cooccurrence
+
+# The doctor directory the front end shows; always seeded as doctors 1-5
+DIRECTORY_DOCTORS = [
+    ('Dr. Faith Nyaboke', 'Cardiology', '+254 123 456 789', 'faith.nyaboke@gmail.com', 'https://images.unsplash.com/photo-1651008376811-b90baee60c1f?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8Mnx8RG9jdG9yfGVufDB8fDB8fHww'),
+    ('Dr. Jane Kinyua', 'Pediatrics', '+254 234 567 890', 'jane.kinyua@example.com', 'https://images.unsplash.com/photo-1584467735815-f778f274e296?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8OHx8RG9jdG9yfGVufDB8fDB8fHww'),
+    ('Dr. Michael Kimemia', 'Orthopedics', '+254 345 678 901', 'michael.kimemia@icloud.com', 'https://images.unsplash.com/photo-1609743522471-83c84ce23e32?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8MTZ8fERvY3RvcnxlbnwwfHwwfHx8MA%3D%3D'),
+    ('Dr. Gary Kimani', 'Dermatology', '+254 456 789 012', 'gary.kimani@example.com', 'https://media.istockphoto.com/id/1486172842/photo/portrait-of-male-nurse-in-his-office.webp?b=1&s=170667a&w=0&k=20&c=X4TGvYkgE0Hqqdwv13z47msgfNAFLH9udGXPzWHlT9A='),
+    ('Dr. David', 'Neurology', '+254 567 890 123', 'david.lee@example.com', 'https://images.unsplash.com/photo-1579684453401-966b11832744?w=500&auto=format&fit=crop&q=60&ixlib=rb-4.0.3&ixid=M3wxMjA3fDB8MHxzZWFyY2h8MzV8fERvY3RvcnxlbnwwfHwwfHx8MA%3D%3D'),
+]
+
+SPECIALTIES = [
+    'Cardiology', 'Pediatrics', 'Orthopedics', 'Dermatology', 'Neurology', 'General Practice',
+    'Oncology', 'Gastroenterology', 'Psychiatry', 'Ophthalmology', 'ENT', 'Endocrinology',
+    'Pulmonology', 'Nephrology', 'Urology', 'Gynecology', 'Rheumatology',
+]
+
+# Listed roughly from most to least common; popularity falls off as 1/rank
+SYMPTOMS = [
+    ('Headache', 'Pain in head'),
+    ('Fever', 'Body temperature above normal'),
+    ('Cough', 'Sudden expulsion of air from the lungs'),
+    ('Fatigue', 'Persistent tiredness or lack of energy'),
+    ('Nausea', 'Feeling of sickness with an inclination to vomit'),
+    ('Sore throat', 'Pain or irritation in the throat'),
+    ('Back pain', 'Pain in the upper or lower back'),
+    ('Shortness of breath', 'Difficulty breathing or feeling breathless'),
+    ('Dizziness', 'Feeling faint, woozy or unsteady'),
+    ('Abdominal pain', 'Pain between the chest and the pelvis'),
+    ('Rash', 'Change in skin colour or texture'),
+    ('Joint pain', 'Discomfort or aching in one or more joints'),
+    ('Chest pain', 'Pain or discomfort in the chest'),
+    ('Diarrhoea', 'Loose or watery stools'),
+    ('Vomiting', 'Forceful emptying of the stomach'),
+    ('Runny nose', 'Excess nasal drainage'),
+    ('Insomnia', 'Difficulty falling or staying asleep'),
+    ('Anxiety', 'Feelings of worry, nervousness or unease'),
+    ('Palpitations', 'Noticeably rapid, strong or irregular heartbeat'),
+    ('Blurred vision', 'Loss of sharpness of eyesight'),
+    ('Numbness', 'Loss of sensation in part of the body'),
+    ('Swelling', 'Enlargement of part of the body'),
+    ('Weight loss', 'Unintentional decrease in body weight'),
+    ('Itching', 'Irritating sensation that causes a desire to scratch'),
+    ('Ear pain', 'Pain in one or both ears'),
+    ('Loss of appetite', 'Reduced desire to eat'),
+    ('Muscle cramps', 'Sudden involuntary muscle contractions'),
+    ('Constipation', 'Infrequent or difficult bowel movements'),
+    ('Wheezing', 'High-pitched whistling sound when breathing'),
+    ('Tremor', 'Involuntary rhythmic shaking'),
+]
+
+DIAGNOSES = [
+    'Migraine', 'Influenza', 'Common cold', 'Hypertension', 'Gastroenteritis', 'Asthma',
+    'Anaemia', 'Type 2 diabetes', 'Urinary tract infection', 'Pneumonia', 'Allergic rhinitis',
+    'Osteoarthritis', 'Eczema', 'Depression', 'Generalised anxiety disorder', 'Bronchitis',
+    'Sinusitis', 'Arrhythmia', 'Hypothyroidism', 'Under investigation',
+]
+
+REASONS = [
+    'Routine check-up', 'Follow-up visit', 'Consultation', 'Test results review',
+    'Prescription renewal', 'New symptoms', 'Vaccination', 'Referral assessment',
+    'Post-operative review', 'Annual physical',
+]
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 20  # 08:00 to 18:00
+
+
+KINDS = {'doctors': 1, 'patients': 2, 'appointments': 3}
+
+
+def chunk_seed(seed, kind, index):
+    return (seed * 1000003 + KINDS[kind] * 7919 + index) & 0xFFFFFFFF
+
+
+def generate_doctors(task):
+    seed, first_id, count = task
+    fake = Faker()
+    fake.seed_instance(chunk_seed(seed, 'doctors', first_id))
+    rng = random.Random(chunk_seed(seed, 'doctors', first_id))
+    rows = []
+    for doctor_id in range(first_id, first_id + count):
+        name = f'Dr. {fake.first_name()} {fake.last_name()}'
+        email = f'{name[4:].lower().replace(" ", ".")}.{doctor_id}@example.com'
+        rows.append((doctor_id, name, rng.choice(SPECIALTIES), fake.phone_number(), email, None))
+    return rows
+
+
+# Patients are spread round-robin over doctors, so the patients of doctor d
+# are d, d + doctors, d + 2 * doctors, ... and can be enumerated without a query.
+def doctor_of(patient_id, doctors):
+    return (patient_id - 1) % doctors + 1
+
+
+# Faker's own weighted name lists, sampled in bulk: calling fake.name() per
+# patient costs ~100x more and dominates generation at a million rows.
+def weighted_names(names):
+    return list(names), list(accumulate(names.values()))
+
+
+FIRST_NAMES = weighted_names(PersonProvider.first_names)
+LAST_NAMES = weighted_names(PersonProvider.last_names)
+
+
+def generate_patients(task):
+    seed, first_id, count, doctors, symptoms, symptoms_per_patient = task
+    rng = random.Random(chunk_seed(seed, 'patients', first_id))
+    symptom_ids = list(range(1, symptoms + 1))
+    symptom_weights = list(accumulate(1.0 / rank for rank in symptom_ids))
+    first_names = rng.choices(FIRST_NAMES[0], cum_weights=FIRST_NAMES[1], k=count)
+    last_names = rng.choices(LAST_NAMES[0], cum_weights=LAST_NAMES[1], k=count)
+
+    patients, associations = [], []
+    for offset, patient_id in enumerate(range(first_id, first_id + count)):
+        name = f'{first_names[offset]} {last_names[offset]}'
+        patients.append((patient_id, name, rng.randint(0, 95), doctor_of(patient_id, doctors)))
+        wanted = min(int(rng.expovariate(1.0 / symptoms_per_patient)), symptoms) if symptoms_per_patient else 0
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.update(rng.choices(symptom_ids, cum_weights=symptom_weights, k=wanted - len(chosen)))
+        for symptom_id in sorted(chosen):
+            diagnosis = rng.choice(DIAGNOSES) if rng.random() < 0.7 else None
+            associations.append((patient_id, symptom_id, diagnosis))
+    return patients, associations
+
+
+# Appointments are generated per doctor by sampling distinct 30-minute slots
+# from the doctor's calendar, so no two bookings for a doctor overlap.
+def generate_appointments(task):
+    seed, first_doctor, doctor_count, per_doctor, extra, doctors, patients, first_day, days = task
+    rng = random.Random(chunk_seed(seed, 'appointments', first_doctor))
+    dates = [(first_day + timedelta(days=day)).isoformat() for day in range(days)]
+    times = [f'{(8 * 60 + slot * SLOT_MINUTES) // 60:02d}:{(slot * SLOT_MINUTES) % 60:02d}' for slot in range(SLOTS_PER_DAY)]
+    rows = []
+    for doctor_id in range(first_doctor, first_doctor + doctor_count):
+        count = per_doctor + (1 if doctor_id <= extra else 0)
+        own_patients = (patients - doctor_id) // doctors + 1 if doctor_id <= patients else 0
+        for slot in sorted(rng.sample(range(days * SLOTS_PER_DAY), count)):
+            day, slot_of_day = divmod(slot, SLOTS_PER_DAY)
+            if own_patients and rng.random() < 0.8:
+                patient_id = doctor_id + doctors * rng.randrange(own_patients)
+            else:
+                patient_id = rng.randint(1, patients)
+            # start is written in SQLite's DateTime storage format
+            rows.append((
+                patient_id, doctor_id, f'{dates[day]} {times[slot_of_day]}:00.000000', SLOT_MINUTES,
+                dates[day], times[slot_of_day], rng.choice(REASONS),
+            ))
+    return rows
+
+
+def insert_sql(table, columns):
+    return f'INSERT INTO {table.name} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+
+
+def bulk_insert(connection, table, columns, rows, chunk_size):
+    sql = insert_sql(table, columns)
+    for i in range(0, len(rows), chunk_size):
+        connection.exec_driver_sql(sql, rows[i:i + chunk_size])
+        connection.commit()
+
+
+def chunks(total, size, first=1):
+    for start in range(first, first + total, size):
+        yield start, min(size, first + total - start)
+
+
+def seed_data(doctors=10, patients=200, appointments=2000, users=2, symptoms=len(SYMPTOMS),
+              symptoms_per_patient=1.5, days=365, first_day=None, seed=42, workers=None, chunk_size=20000):
+    started = time.perf_counter()
+    first_day = first_day or date.today() - timedelta(days=days // 2)
+    doctors = max(doctors, len(DIRECTORY_DOCTORS))
+    if appointments and not patients:
+        raise SystemExit('Appointments need at least one patient')
+    per_doctor, extra = divmod(appointments, doctors)
+    if per_doctor + (1 if extra else 0) > days * SLOTS_PER_DAY:
+        raise SystemExit(f'{appointments} appointments do not fit in {days} days for {doctors} doctors; raise --days')
 
-def seed_data():
     with app.app_context():
         db.drop_all()
         db.create_all()
+        connection = db.engine.connect()
+        connection.exec_driver_sql('PRAGMA synchronous=OFF')
+
+        # Secondary indexes are cheaper to build once at the end than to maintain per row
+        indexes = list(Appointment.__table__.indexes) + list(Patient.__table__.indexes)
+        for index in indexes:
+            index.drop(connection)
+        # Likewise the search index and appointment stats are filled in one pass at the end
+        search.drop_triggers(connection)
+        appointment_stats.drop_triggers(connection)
+        changes.drop_triggers(connection)
+        connection.commit()
+
+        def log(message):
+            print(f'[{time.perf_counter() - started:7.1f}s] {message}', flush=True)
 
-        # Adding sample data for doctors
-        doctor1 = Doctor(name='Dr. John Doe', specialty='Cardiology')
-        doctor2 = Doctor(name='Dr. Jane Smith', specialty='Neurology')
+        with Pool(workers) as pool:
+            directory = [(i + 1, *doctor) for i, doctor in enumerate(DIRECTORY_DOCTORS)]
+            bulk_insert(connection, Doctor.__table__, ['id', 'name', 'specialty', 'phone', 'email', 'image_url'], directory, chunk_size)
+            tasks = [(seed, first, count) for first, count in chunks(doctors - len(directory), chunk_size, len(directory) + 1)]
+            for rows in pool.imap(generate_doctors, tasks):
+                bulk_insert(connection, Doctor.__table__, ['id', 'name', 'specialty', 'phone', 'email', 'image_url'], rows, chunk_size)
+            log(f'{doctors} doctors')
 
-        # Adding sample data for patients
-        patient1 = Patient(name='Alice Johnson', age=30, doctor=doctor1)
-        patient2 = Patient(name='Bob Brown', age=45, doctor=doctor2)
+            symptom_rows = [(i + 1, *SYMPTOMS[i]) if i < len(SYMPTOMS) else (i + 1, f'Symptom {i + 1}', None) for i in range(symptoms)]
+            bulk_insert(connection, Symptom.__table__, ['id', 'name', 'description'], symptom_rows, chunk_size)
+            log(f'{symptoms} symptoms')
 
-        # Adding sample data for symptoms
-        symptom1 = Symptom(name='Headache', description='Pain in head')
-        symptom2 = Symptom(name='Nausea', description='Feeling of sickness with an inclination to vomit')
+            tasks = [(seed, first, count, doctors, symptoms, symptoms_per_patient) for first, count in chunks(patients, chunk_size)]
+            associations = 0
+            for patient_rows, association_rows in pool.imap(generate_patients, tasks):
+                bulk_insert(connection, Patient.__table__, ['id', 'name', 'age', 'doctor_id'], patient_rows, chunk_size)
+                bulk_insert(connection, patient_symptom, ['patient_id', 'symptom_id', 'diagnosis'], association_rows, chunk_size)
+                associations += len(association_rows)
+            log(f'{patients} patients, {associations} patient symptoms')
 
-        # Associating patients with symptoms
-        patient1.symptoms.append(symptom1)
-        patient2.symptoms.append(symptom2)
+            doctors_per_task = max(1, chunk_size // max(per_doctor, 1))
+            tasks = [(seed, first, count, per_doctor, extra, doctors, patients, first_day, days) for first, count in chunks(doctors, doctors_per_task)]
+            columns = ['patient_id', 'doctor_id', 'start', 'duration_minutes', 'date', 'time', 'reason']
+            for rows in pool.imap(generate_appointments, tasks):
+                bulk_insert(connection, Appointment.__table__, columns, rows, chunk_size)
+            log(f'{appointments} appointments')
 
-        # Adding sample data for users with plain text passwords
-        user1 = User(username='user1', password='password1')
-        user2 = User(username='user2', password='password2')
+        for index in indexes:
+            index.create(connection)
+        search.rebuild(connection)
+        search.create_triggers(connection)
+        appointment_stats.rebuild(connection)
+        appointment_stats.create_triggers(connection)
+        # The seeded rows are the starting state, not changes to replay
+        changes.create_triggers(connection)
+        connection.commit()
+        log('indexes rebuilt')
 
-        db.session.add_all([doctor1, doctor2, patient1, patient2, symptom1, symptom2, user1, user2])
-        db.session.commit()
+        # One hash for every synthetic account keeps seeding fast; they all log in with "password"
+        password_hash = passwords.hash_password('password')
+        user_rows = [(1, 'user1', passwords.hash_password('password1')), (2, 'user2', passwords.hash_password('password2'))][:users]
+        fake = Faker()
+        fake.seed_instance(seed)
+        user_rows += [(i, f'{fake.user_name()}{i}', password_hash) for i in range(len(user_rows) + 1, users + 1)]
+        bulk_insert(connection, User.__table__, ['id', 'username', 'password_hash'], user_rows, chunk_size)
+        log(f'{users} users')
+
+        connection.exec_driver_sql('ANALYZE')
+        connection.commit()
+        if cooccurrence.available():
+            cooccurrence.rebuild(connection)
+            log('symptom matrix built')
+        connection.close()
         print("Data seeded successfully!")
 
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the hospital database with deterministic synthetic data.')
+    parser.add_argument('--doctors', type=int, default=10)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--appointments', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--symptoms', type=int, default=len(SYMPTOMS))
+    parser.add_argument('--symptoms-per-patient', type=float, default=1.5, help='mean symptoms recorded per patient')
+    parser.add_argument('--days', type=int, default=365, help='length of the appointment calendar')
+    parser.add_argument('--first-day', type=date.fromisoformat, help='first calendar day (default: half of --days ago)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, help='generator processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='rows per generated chunk and per insert transaction')
+    args = parser.parse_args()
+    seed_data(**{key: value for key, value in vars(args).items()})
+
+
 if __name__ == "__main__":
-    seed_data()
+    main()
@@ -0,0 +1,92 @@
+# sqlite_engine.py
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session
+
+WRITER_BIND = 'writer'
+
+DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    # Negative cache_size is in KiB rather than pages
+    'SQLITE_CACHE_SIZE_KB': 65536,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_READ_POOL_SIZE': 8,
+    'SQLITE_READ_POOL_OVERFLOW': 8,
+    # Seconds a request waits for the single writer connection
+    'SQLITE_WRITE_TIMEOUT': 10,
+    # Enforce REFERENCES and their ON DELETE CASCADE rules (off by default in SQLite)
+    'SQLITE_FOREIGN_KEYS': True,
+}
+
+
+def _is_sqlite_file(uri):
+    url = sa.engine.make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+# Must run before db.init_app(app): sizes the reader pool and adds a writer
+# bind on the same file with exactly one connection, so writes from this
+# process queue up in the pool instead of fighting over the SQLite lock.
+def configure(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not _is_sqlite_file(uri):
+        return
+
+    engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    engine_options.setdefault('pool_size', app.config['SQLITE_READ_POOL_SIZE'])
+    engine_options.setdefault('max_overflow', app.config['SQLITE_READ_POOL_OVERFLOW'])
+
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(WRITER_BIND, {
+        'url': uri,
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_timeout': app.config['SQLITE_WRITE_TIMEOUT'],
+    })
+
+
+# Must run after db.init_app(app): applies the pragmas to every new connection.
+def install(app, db):
+    pragmas = [
+        f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA cache_size=-{int(app.config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA foreign_keys={'ON' if app.config['SQLITE_FOREIGN_KEYS'] else 'OFF'}",
+    ]
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                sa.event.listen(engine, 'connect', apply_pragmas)
+
+
+# Sends flushes and Core INSERT/UPDATE/DELETE to the writer bind, and keeps
+# the rest of that transaction on it so reads see their own writes. Everything
+# else is served from the reader pool.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engines = self._db.engines
+            if WRITER_BIND in engines:
+                if self._flushing or getattr(clause, 'is_dml', False) or self.info.get('writing'):
+                    self.info['writing'] = True
+                    return engines[WRITER_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, 'after_transaction_end')
+def _end_writing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('writing', None)
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+SERVER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = tempfile.mkdtemp(prefix='hospital-tests-')
+
+# The app reads its configuration once, at import
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(DATA, 'app.db')}"
+os.environ['FLASK_SYMPTOM_MATRIX_DIR'] = os.path.join(DATA, 'symptom_matrix')
+os.environ['FLASK_PASSWORD_HASH_WORKERS'] = '0'
+os.environ['FLASK_METRICS_SLOW_REQUEST_MS'] = '100000'
+sys.path.insert(0, SERVER)
+
+from app import app as flask_app  # noqa: E402
+from models import db, Doctor, Patient  # noqa: E402
+import availability  # noqa: E402
+import doctor_load  # noqa: E402
+import idempotency  # noqa: E402
+import refcache  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    # Per-process caches would otherwise carry rows of the previous test's database
+    availability.clear()
+    doctor_load.invalidate()
+    idempotency.clear()
+    refcache.clear()
+    yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# Two doctors with one patient each
+@pytest.fixture
+def clinic(app):
+    with app.app_context():
+        doctors = [Doctor(name='Dr. Grey', specialty='Cardiology'), Doctor(name='Dr. Shepherd', specialty='Neurology')]
+        db.session.add_all(doctors)
+        db.session.flush()
+        patients = [Patient(name='Ann', age=40, doctor_id=doctors[0].id), Patient(name='Ben', age=52, doctor_id=doctors[1].id)]
+        db.session.add_all(patients)
+        db.session.commit()
+        return {'doctors': [d.id for d in doctors], 'patients': [p.id for p in patients]}
@@ -0,0 +1,71 @@
+import sqlalchemy as sa
+
+from models import db
+
+
+def book(client, clinic, time, doctor=0, date='2035-03-01', **extra):
+    return client.post('/appointments', json={
+        'patient_id': clinic['patients'][0], 'doctor_id': clinic['doctors'][doctor],
+        'date': date, 'time': time, 'reason': 'Checkup', **extra})
+
+
+def appointment_id(app, time):
+    with app.app_context():
+        return db.session.execute(sa.text('SELECT id FROM appointment WHERE time = :time'), {'time': time}).scalar()
+
+
+def test_overlapping_booking_is_refused(client, clinic):
+    assert book(client, clinic, '10:00').status_code == 201
+    assert book(client, clinic, '10:15').status_code == 409
+    assert book(client, clinic, '09:45').status_code == 409
+    # Back to back, or with another doctor, is fine
+    assert book(client, clinic, '10:30').status_code == 201
+    assert book(client, clinic, '10:00', doctor=1).status_code == 201
+
+
+def test_booking_made_by_another_worker_is_seen(app, client, clinic):
+    # Load this process's slot map for the day, then book behind its back
+    assert client.get(f"/doctors/{clinic['doctors'][0]}/availability?from=2035-03-01&to=2035-03-01").status_code == 200
+    with app.app_context():
+        db.session.execute(sa.text(
+            "INSERT INTO appointment (patient_id, doctor_id, reason, date, time, start, duration_minutes) "
+            "VALUES (:patient, :doctor, 'Elsewhere', '2035-03-01', '11:00', '2035-03-01 11:00:00.000000', 30)"
+        ), {'patient': clinic['patients'][1], 'doctor': clinic['doctors'][0]})
+        db.session.commit()
+
+    assert book(client, clinic, '11:15').status_code == 409
+    other = appointment_id(app, '11:00')
+    with app.app_context():
+        db.session.execute(sa.text("UPDATE appointment SET time = '13:00', start = '2035-03-01 13:00:00.000000' "
+                                   'WHERE id = :id'), {'id': other})
+        db.session.commit()
+    assert book(client, clinic, '12:00').status_code == 201
+    moved = appointment_id(app, '12:00')
+    assert client.put(f'/appointments/{moved}', json={'time': '12:45'}).status_code == 409
+
+
+def test_deleting_an_appointment_releases_its_slot(app, client, clinic):
+    assert book(client, clinic, '10:00').status_code == 201
+    assert client.delete(f"/appointments/{appointment_id(app, '10:00')}").status_code == 200
+    assert book(client, clinic, '10:00').status_code == 201
+
+
+def test_rescheduling_moves_the_reservation(app, client, clinic):
+    assert book(client, clinic, '10:00').status_code == 201
+    response = client.put(f"/appointments/{appointment_id(app, '10:00')}", json={'time': '11:00'})
+    assert response.status_code == 200
+    assert book(client, clinic, '11:00').status_code == 409
+    assert book(client, clinic, '10:00').status_code == 201
+
+
+def test_invalid_fields_are_rejected(client, clinic):
+    assert book(client, clinic, 'noon').status_code == 400
+    assert book(client, clinic, '10:00', duration_minutes='long').status_code == 400
+
+
+def test_missing_patient_is_not_found(client, clinic):
+    response = client.post('/appointments', json={
+        'patient_id': 999, 'doctor_id': clinic['doctors'][0], 'date': '2035-03-01', 'time': '10:00', 'reason': 'x'})
+    assert response.status_code == 404
+    # The refused booking gave its slot back
+    assert book(client, clinic, '10:00').status_code == 201
@@ -0,0 +1,50 @@
+import sqlalchemy as sa
+
+from models import db
+
+
+def count(app, table):
+    with app.app_context():
+        return db.session.execute(sa.text(f'SELECT COUNT(*) FROM {table}')).scalar()
+
+
+def test_operations_see_earlier_creates(app, client, clinic):
+    response = client.post('/batch', json={'operations': [
+        {'op': 'create', 'resource': 'doctors', 'ref': 'house', 'data': {'name': 'Dr. House', 'specialty': 'Diagnostics'}},
+        {'op': 'create', 'resource': 'patients', 'ref': 'cara', 'data': {'name': 'Cara', 'age': 30, 'doctor_id': '$house'}},
+        {'op': 'create', 'resource': 'appointments', 'data': {
+            'patient_id': '$cara', 'doctor_id': '$0', 'date': '2035-03-01', 'time': '09:00', 'reason': 'Intake'}},
+    ]})
+    assert response.status_code == 200
+    doctor, patient, appointment = (result['id'] for result in response.get_json()['results'])
+    with app.app_context():
+        row = db.session.execute(sa.text('SELECT patient_id, doctor_id FROM appointment WHERE id = :id'),
+                                 {'id': appointment}).one()
+    assert tuple(row) == (patient, doctor)
+
+
+def test_failed_operation_rolls_back_the_batch(app, client, clinic):
+    doctor, patient = clinic['doctors'][0], clinic['patients'][0]
+    booking = {'patient_id': patient, 'doctor_id': doctor, 'date': '2035-03-01', 'time': '09:00', 'reason': 'Intake'}
+    response = client.post('/batch', json={'operations': [
+        {'op': 'create', 'resource': 'patients', 'data': {'name': 'Cara', 'age': 30, 'doctor_id': doctor}},
+        {'op': 'create', 'resource': 'appointments', 'data': booking},
+        {'op': 'create', 'resource': 'appointments', 'data': {**booking, 'time': '09:15'}},
+    ]})
+    assert response.status_code == 409
+    assert response.get_json()['index'] == 2
+    assert count(app, 'patient') == 2
+    assert count(app, 'appointment') == 0
+
+    # The slot the rolled back booking held is free again
+    assert client.post('/appointments', json=booking).status_code == 201
+
+
+def test_unknown_reference_is_rejected(app, client, clinic):
+    response = client.post('/batch', json={'operations': [
+        {'op': 'create', 'resource': 'symptoms', 'data': {'name': 'Cough'}},
+        {'op': 'create', 'resource': 'patients', 'data': {'name': 'Cara', 'age': 30, 'doctor_id': '$nobody'}},
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 1
+    assert count(app, 'symptom') == 0
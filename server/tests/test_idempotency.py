@@ -0,0 +1,58 @@
+import sqlalchemy as sa
+
+import idempotency
+from models import db
+
+HEADERS = {'Idempotency-Key': 'a7d1c2'}
+
+
+def patient(clinic, name='Cara'):
+    return {'name': name, 'age': 30, 'doctor_id': clinic['doctors'][0]}
+
+
+def patients_named(app, name):
+    with app.app_context():
+        return db.session.execute(sa.text('SELECT COUNT(*) FROM patient WHERE name = :name'), {'name': name}).scalar()
+
+
+def test_retry_replays_the_first_response(app, client, clinic):
+    first = client.post('/patients', json=patient(clinic), headers=HEADERS)
+    assert first.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+
+    retry = client.post('/patients', json=patient(clinic), headers=HEADERS)
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+
+    # Another worker has only the table to go on
+    idempotency.clear()
+    retry = client.post('/patients', json=patient(clinic), headers=HEADERS)
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert patients_named(app, 'Cara') == 1
+
+
+def test_key_reused_for_another_request_is_refused(app, client, clinic):
+    assert client.post('/patients', json=patient(clinic), headers=HEADERS).status_code == 201
+    response = client.post('/patients', json=patient(clinic, 'Dana'), headers=HEADERS)
+    assert response.status_code == 422
+    assert patients_named(app, 'Dana') == 0
+
+
+def test_keys_are_scoped_to_the_caller(app, client, clinic):
+    assert client.post('/patients', json=patient(clinic), headers=HEADERS).status_code == 201
+    other = client.post('/patients', json=patient(clinic), headers=HEADERS,
+                        environ_base={'REMOTE_ADDR': '10.0.0.9'})
+    assert other.status_code == 201
+    assert 'Idempotent-Replayed' not in other.headers
+    assert patients_named(app, 'Cara') == 2
+
+
+# Only server errors give the key back; a rejected request stays rejected
+def test_client_error_is_replayed(client, clinic):
+    first = client.post('/patients', json={'name': 'Cara'}, headers=HEADERS)
+    assert first.status_code == 400
+    retry = client.post('/patients', json={'name': 'Cara'}, headers=HEADERS)
+    assert retry.status_code == 400
+    assert retry.headers['Idempotent-Replayed'] == 'true'
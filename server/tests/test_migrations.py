@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+SERVER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BEFORE_FOREIGN_KEYS = 'f6c1a8d3e527'
+FOREIGN_KEYS = 'c3e9f5b1a642'
+SYMPTOM_ID_GUARD = 'a7f2c9d4e158'
+
+
+@pytest.fixture
+def database(tmp_path):
+    return tmp_path / 'migrate.db'
+
+
+def upgrade(database, revision):
+    env = dict(os.environ, FLASK_SQLALCHEMY_DATABASE_URI=f'sqlite:///{database}',
+               FLASK_SYMPTOM_MATRIX_DIR=str(database.parent / 'symptom_matrix'))
+    return subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'upgrade', revision],
+                          cwd=SERVER, env=env, capture_output=True, text=True, timeout=300)
+
+
+def query(database, sql, *params):
+    with sqlite3.connect(database) as connection:
+        rows = connection.execute(sql, params).fetchall()
+    connection.close()
+    return rows
+
+
+def revision(database):
+    return query(database, 'SELECT version_num FROM alembic_version')[0][0]
+
+
+def test_orphans_block_the_foreign_key_migration(database):
+    assert upgrade(database, BEFORE_FOREIGN_KEYS).returncode == 0
+    query(database, 'INSERT INTO doctor (id, name, specialty) VALUES (1, ?, ?)', 'Dr. Grey', 'Cardiology')
+    query(database, 'INSERT INTO patient (id, name, age, doctor_id) VALUES (1, ?, 40, 1), (2, ?, 52, 99)', 'Ann', 'Ben')
+
+    result = upgrade(database, FOREIGN_KEYS)
+    assert result.returncode != 0
+    assert revision(database) == BEFORE_FOREIGN_KEYS
+    assert 'patient: 1 rows reference a missing doctor (rowids 2)' in result.stderr
+    # Nothing was deleted to make the constraint fit
+    assert query(database, 'SELECT id FROM patient ORDER BY id') == [(1,), (2,)]
+
+    query(database, 'UPDATE patient SET doctor_id = 1 WHERE id = 2')
+    assert upgrade(database, FOREIGN_KEYS).returncode == 0
+    assert revision(database) == FOREIGN_KEYS
+    assert query(database, 'PRAGMA foreign_key_check') == []
+
+
+def test_symptom_ids_are_kept_below_the_diagnosis_limit(database):
+    assert upgrade(database, FOREIGN_KEYS).returncode == 0
+    query(database, 'INSERT INTO symptom (id, name) VALUES (?, ?)', 2 ** 24, 'Cough')
+    assert upgrade(database, SYMPTOM_ID_GUARD).returncode != 0
+    assert revision(database) == FOREIGN_KEYS
+
+    query(database, 'UPDATE symptom SET id = 7')
+    assert upgrade(database, SYMPTOM_ID_GUARD).returncode == 0
+    with pytest.raises(sqlite3.IntegrityError):
+        query(database, 'INSERT INTO symptom (id, name) VALUES (?, ?)', 2 ** 24, 'Fever')
+    query(database, 'INSERT INTO symptom (id, name) VALUES (?, ?)', 2 ** 24 - 1, 'Fever')
@@ -0,0 +1,92 @@
+# versioning.py
+import re
+
+import sqlalchemy as sa
+from flask import request
+
+from models import db
+
+_ETAG = re.compile(r'^(?:W/)?"(\d+)"$')
+
+
+class PreconditionFailed(Exception):
+    pass
+
+
+# A value that the model's @validates hooks refuse
+class Invalid(ValueError):
+    pass
+
+
+def etag(version):
+    return f'"{version}"'
+
+
+# Set the ETag header when the version is known (it is left out of ?fields=
+# projections that do not ask for it).
+def tagged(response, version):
+    if version is not None:
+        response.headers['ETag'] = etag(version)
+    return response
+
+
+# The version named by If-Match, or None when the header is absent or "*".
+# A header that names no version of ours can never match.
+def if_match():
+    header = request.headers.get('If-Match')
+    if header is None or header.strip() == '*':
+        return None
+    for candidate in header.split(','):
+        match = _ETAG.match(candidate.strip())
+        if match:
+            return int(match.group(1))
+    raise PreconditionFailed()
+
+
+def check(obj):
+    expected = if_match()
+    if expected is not None and obj.version != expected:
+        raise PreconditionFailed()
+
+
+# Run the model's @validates hooks over values, as assigning them to an
+# instance would. A Core UPDATE bypasses them otherwise.
+def validate(model, values):
+    mapper = sa.inspect(model)
+    instance = mapper.class_manager.new_instance()
+    validated = {}
+    for column, value in values.items():
+        validator = mapper.validators.get(column.key)
+        if validator is not None:
+            try:
+                value = validator[0](instance, column.key, value)
+            except ValueError as error:
+                raise Invalid(str(error)) from error
+        validated[column] = value
+    return validated
+
+
+# Apply values to one row as a single UPDATE ... WHERE id = :id [AND version
+# = :if_match] RETURNING version, bumping the version as the ORM's
+# version_id_col would. Returns the new version, or None if there is no such
+# row; raises PreconditionFailed if the row exists at another version and
+# Invalid if a model validator rejects a value.
+def update(model, id, values):
+    values = validate(model, values)
+    expected = if_match()
+    statement = sa.update(model).where(model.id == id)
+    if expected is not None:
+        statement = statement.where(model.version == expected)
+    statement = statement.values({**values, model.version: model.version + 1}).returning(model.version)
+    version = db.session.execute(statement, execution_options={'synchronize_session': False}).scalar()
+    if version is None and expected is not None:
+        exists = db.session.query(model.id).filter(model.id == id).first() is not None
+        db.session.rollback()
+        if exists:
+            raise PreconditionFailed()
+    return version
+
+
+# Request keys that a PUT may set, mapped to columns
+def values_from(data, columns):
+    return {column: data[key] for key, column in columns.items() if key in data}